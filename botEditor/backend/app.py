@@ -1,13 +1,19 @@
+import hmac
+import math
 import os
 import uuid
+from collections import Counter
 from datetime import datetime, timedelta
+from typing import Any, Dict, List
 
 import jwt
+import orjson
 from fastapi import Depends, FastAPI, HTTPException, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi import Request
 from passlib.context import CryptContext
-from psycopg2.extras import Json
+from psycopg2.extras import Json, execute_values
 from psycopg2 import Error as PsycopgError
 
 
@@ -17,14 +23,67 @@ JWT_SECRET = os.getenv("JWT_SECRET", "dev-secret-change-me")
 JWT_ALG = "HS256"
 JWT_TTL_MINUTES = int(os.getenv("JWT_TTL_MINUTES", "1440"))
 
+# Прием событий воронки от раннеров ботов (заголовок X-Ingest-Token)
+STATS_INGEST_TOKEN = os.getenv("STATS_INGEST_TOKEN", "")
+STATS_BUCKET_SECONDS = 3600
+STATS_RETENTION_HOURS = int(os.getenv("STATS_RETENTION_HOURS", str(24 * 30)))
+DWELL_BINS = 24     # Гистограмма времени на блоке: корзина i - [2^(i-1), 2^i) секунд
+
+# Ограничение размера тела запроса (сценарии приходят целиком в одном JSON)
+MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_BYTES", str(2 * 1024 * 1024)))
+# Поля блока, нужные только редактору: хранятся отдельно от исполняемой модели
+LAYOUT_FIELDS = ("X", "Y", "BlockName")
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-app = FastAPI(title="Bot Editor Backend")
+app = FastAPI(title="Bot Editor Backend", default_response_class=ORJSONResponse)
 
 FRONTEND_ORIGIN = os.getenv("FRONTEND_ORIGIN", "http://localhost:5173")
 origins_env = os.getenv("FRONTEND_ORIGIN", "http://localhost:5173")
 origins = [o.strip() for o in origins_env.split(",") if o.strip()]
 
+class BodySizeLimitMiddleware:
+    """
+    413 для тел больше max_bytes: по Content-Length сразу,
+    для chunked-запросов - как только прочитано больше лимита.
+    """
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None:
+            try:
+                length = int(content_length)
+            except ValueError:
+                length = -1
+            if length < 0:
+                response = ORJSONResponse({"detail": "Invalid Content-Length"}, status_code=400)
+                return await response(scope, receive, send)
+            if length > self.max_bytes:
+                response = ORJSONResponse({"detail": "Request body too large"}, status_code=413)
+                return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail="Request body too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+app.add_middleware(BodySizeLimitMiddleware, max_bytes=MAX_REQUEST_BYTES)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -164,11 +223,48 @@ async def logout(response: Response):
     return {"ok": True}
 
 
+def split_layout(scenario: dict):
+    """
+    Отделяет от сценария данные редактора (координаты, подписи блоков).
+    Раннер читает только исполняемую модель, редактор склеивает их обратно.
+    """
+    blocks = scenario.get("Blocks")
+    if not isinstance(blocks, list):
+        return scenario, {}
+
+    layout = {}
+    executable_blocks = []
+    for block in blocks:
+        if not isinstance(block, dict):
+            executable_blocks.append(block)
+            continue
+        block = dict(block)
+        ui = {field: block.pop(field) for field in LAYOUT_FIELDS if field in block}
+        if ui:
+            layout[str(block.get("Block_id"))] = ui
+        executable_blocks.append(block)
+    return {**scenario, "Blocks": executable_blocks}, layout
+
+
+def bot_summary(row) -> dict:
+    return {
+        "id": str(row["id"]),
+        "name": row["name"],
+        "bot_name": row["bot_name"],
+        "created_at": row["created_at"].isoformat(),
+        "updated_at": row["updated_at"].isoformat(),
+    }
+
+
+# Список ботов отдает только метаданные; сценарий загружается при открытии бота
+BOT_SUMMARY_COLUMNS = "id, name, scenario->>'BotName' AS bot_name, created_at, updated_at"
+
+
 @app.post("/api/bots")
 async def create_bot(payload: dict, user = Depends(current_user)):
     user_id = user["id"]
     name = (payload.get("name") or "").strip() or "Новый бот"
-    scenario = payload.get("scenario") or {}
+    scenario, layout = split_layout(payload.get("scenario") or {})
 
     bot_id = str(uuid.uuid4())
 
@@ -178,12 +274,12 @@ async def create_bot(payload: dict, user = Depends(current_user)):
             with conn.cursor() as cur:
                 try:
                     cur.execute(
-                        """
-                        INSERT INTO bot_model (id, user_id, name, scenario)
-                        VALUES (%s::uuid, %s, %s, %s::jsonb)
-                        RETURNING id, name, scenario, created_at, updated_at
+                        f"""
+                        INSERT INTO bot_model (id, user_id, name, scenario, layout)
+                        VALUES (%s::uuid, %s, %s, %s::jsonb, %s::jsonb)
+                        RETURNING {BOT_SUMMARY_COLUMNS}
                         """,
-                        (bot_id, user_id, name, Json(scenario)),
+                        (bot_id, user_id, name, Json(scenario), Json(layout)),
                     )
 
                 except PsycopgError as e:
@@ -199,13 +295,7 @@ async def create_bot(payload: dict, user = Depends(current_user)):
     if not row:
         raise HTTPException(status_code=500, detail="Failed to create bot")
 
-    return {
-        "id": str(row["id"]),
-        "name": row["name"],
-        "scenario": row["scenario"],
-        "created_at": row["created_at"].isoformat(),
-        "updated_at": row["updated_at"].isoformat(),
-    }
+    return bot_summary(row)
 
 @app.get("/api/bots")
 async def get_bots(user = Depends(current_user)):
@@ -216,8 +306,8 @@ async def get_bots(user = Depends(current_user)):
         with conn:
             with conn.cursor() as cur:
                 cur.execute(
-                    """
-                    SELECT id, name, scenario, created_at, updated_at
+                    f"""
+                    SELECT {BOT_SUMMARY_COLUMNS}
                     FROM bot_model
                     WHERE user_id = %s
                     ORDER BY created_at DESC
@@ -228,38 +318,61 @@ async def get_bots(user = Depends(current_user)):
     finally:
         conn.close()
 
-    return [
-        {
-            "id": str(row["id"]),
-            "name": row["name"],
-            "scenario": row["scenario"],
-            "created_at": row["created_at"].isoformat(),
-            "updated_at": row["updated_at"].isoformat(),
-        }
-        for row in rows
-    ]
+    return ORJSONResponse([bot_summary(row) for row in rows])
+
+
+@app.get("/api/bots/{bot_id}")
+async def get_bot(bot_id: str, user = Depends(current_user)):
+    user_id = user["id"]
+
+    conn = get_connection()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                # JSONB отдаем текстом: без разбора в dict и повторной сериализации
+                cur.execute(
+                    f"""
+                    SELECT {BOT_SUMMARY_COLUMNS}, scenario::text AS scenario, layout::text AS layout
+                    FROM bot_model
+                    WHERE id = %s AND user_id = %s
+                    """,
+                    (bot_id, user_id),
+                )
+                row = cur.fetchone()
+    finally:
+        conn.close()
+
+    if not row:
+        raise HTTPException(status_code=404, detail="Bot not found")
+
+    return ORJSONResponse({
+        **bot_summary(row),
+        "scenario": orjson.Fragment(row["scenario"]),
+        "layout": orjson.Fragment(row["layout"]),
+    })
 
 
 @app.put("/api/bots/{bot_id}")
 async def update_bot(bot_id: str, payload: dict, user = Depends(current_user)):
     user_id = user["id"]
     name = (payload.get("name") or "").strip() or "Без имени"
-    scenario = payload.get("scenario") or {}
+    scenario, layout = split_layout(payload.get("scenario") or {})
 
     conn = get_connection()
     try:
         with conn:
             with conn.cursor() as cur:
                 cur.execute(
-                    """
+                    f"""
                     UPDATE bot_model
                     SET name = %s,
                         scenario = %s,
+                        layout = %s,
                         updated_at = now()
                     WHERE id = %s AND user_id = %s
-                    RETURNING id, name, scenario, created_at, updated_at
+                    RETURNING {BOT_SUMMARY_COLUMNS}
                     """,
-                    (name, Json(scenario), bot_id, user_id),
+                    (name, Json(scenario), Json(layout), bot_id, user_id),
                 )
 
                 row = cur.fetchone()
@@ -269,13 +382,7 @@ async def update_bot(bot_id: str, payload: dict, user = Depends(current_user)):
     if not row:
         raise HTTPException(status_code=404, detail="Bot not found")
 
-    return {
-        "id": str(row["id"]),
-        "name": row["name"],
-        "scenario": row["scenario"],
-        "created_at": row["created_at"].isoformat(),
-        "updated_at": row["updated_at"].isoformat(),
-    }
+    return bot_summary(row)
 
 
 @app.delete("/api/bots/{bot_id}")
@@ -296,3 +403,145 @@ async def delete_bot(bot_id: str, user = Depends(current_user)):
         conn.close()
 
     return {"ok": True}
+
+
+def dwell_bin(seconds: float) -> int:
+    if seconds < 1:
+        return 0
+    return min(DWELL_BINS - 1, int(math.log2(seconds)) + 1)
+
+
+def median_from_histogram(hist: dict):
+    """Медиана по гистограмме: середина корзины, в которую попадает половина наблюдений"""
+    total = sum(hist.values())
+    if not total:
+        return None
+    seen = 0
+    for i in range(DWELL_BINS):
+        seen += hist.get(i, 0)
+        if seen * 2 >= total:
+            low, high = (0.0, 1.0) if i == 0 else (2.0 ** (i - 1), 2.0 ** i)
+            return round((low + high) / 2, 1)
+    return None
+
+
+def aggregate_events(events: List[Dict[str, Any]]) -> Counter:
+    """Сворачивает пачку событий в приращения счетчиков (bucket, block_id, metric)"""
+    deltas = Counter()
+    for e in events:
+        if not e.get("block_id"):
+            continue
+        try:
+            bucket = int(float(e.get("ts", 0)) // STATS_BUCKET_SECONDS * STATS_BUCKET_SECONDS)
+            if e.get("event") == "variant_stats":
+                # Блок split присылает уже свернутые приращения по варианту
+                entries, completions = int(e.get("entries", 0)), int(e.get("completions", 0))
+                deltas[(bucket, e["block_id"], f"variant:{e.get('value')}:entries")] += entries
+                deltas[(bucket, e["block_id"], f"variant:{e.get('value')}:completions")] += completions
+                continue
+            dwell = float(e["dwell"]) if e.get("dwell") is not None else None
+        except (TypeError, ValueError):
+            # Битое событие пропускаем, а не роняем всю пачку
+            continue
+        if e.get("event") != "block_entered":
+            continue
+        deltas[(bucket, e["block_id"], "entries")] += 1
+        prev = e.get("from_block")
+        if prev:
+            # Переход prev -> block: выход из prev по ветке и время, проведенное на prev
+            deltas[(bucket, prev, "exit:" + e["block_id"])] += 1
+            if dwell is not None:
+                deltas[(bucket, prev, f"dwell:{dwell_bin(dwell)}")] += 1
+    return deltas
+
+
+@app.post("/api/bots/{bot_id}/events")
+async def ingest_events(bot_id: str, events: List[Dict[str, Any]], request: Request):
+    token = request.headers.get("X-Ingest-Token", "")
+    if not STATS_INGEST_TOKEN or not hmac.compare_digest(token, STATS_INGEST_TOKEN):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid ingest token")
+
+    # Пачка сворачивается в памяти: в БД уходит по одной строке на (корзина, блок, метрика)
+    deltas = aggregate_events(events)
+    if not deltas:
+        return {"ok": True, "rows": 0}
+
+    conn = get_connection()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                execute_values(
+                    cur,
+                    """
+                    INSERT INTO block_stats (bot_id, bucket, block_id, metric, value)
+                    VALUES %s
+                    ON CONFLICT (bot_id, bucket, block_id, metric)
+                    DO UPDATE SET value = block_stats.value + EXCLUDED.value
+                    """,
+                    [(bot_id, bucket, block_id, metric, value)
+                     for (bucket, block_id, metric), value in deltas.items()],
+                    template="(%s::uuid, to_timestamp(%s), %s, %s, %s)",
+                )
+                # Скользящее окно: старые корзины удаляются
+                cur.execute(
+                    "DELETE FROM block_stats WHERE bot_id = %s AND bucket < now() - %s * interval '1 hour'",
+                    (bot_id, STATS_RETENTION_HOURS),
+                )
+    except PsycopgError as e:
+        raise HTTPException(status_code=400, detail=f"DB error while ingesting events: {e.pgerror or str(e)}")
+    finally:
+        conn.close()
+
+    return {"ok": True, "rows": len(deltas)}
+
+
+@app.get("/api/bots/{bot_id}/stats")
+async def get_bot_stats(bot_id: str, hours: int = 24, user = Depends(current_user)):
+    """
+    Данные для оверлея на холсте: по каждому блоку входы, выходы по веткам и медиана времени на блоке,
+    для блоков split - входы и завершения диалога по вариантам.
+    Объем чтения зависит от числа блоков и корзин в окне, но не от числа событий.
+    """
+    user_id = user["id"]
+    hours = max(1, min(hours, STATS_RETENTION_HOURS))
+
+    conn = get_connection()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1 FROM bot_model WHERE id = %s AND user_id = %s", (bot_id, user_id))
+                if not cur.fetchone():
+                    raise HTTPException(status_code=404, detail="Bot not found")
+
+                cur.execute(
+                    """
+                    SELECT block_id, metric, SUM(value) AS value
+                    FROM block_stats
+                    WHERE bot_id = %s AND bucket >= now() - %s * interval '1 hour'
+                    GROUP BY block_id, metric
+                    """,
+                    (bot_id, hours),
+                )
+                rows = cur.fetchall()
+    finally:
+        conn.close()
+
+    blocks = {}
+    dwell = {}
+    for row in rows:
+        stats = blocks.setdefault(row["block_id"], {"entries": 0, "exits": {}, "median_dwell_sec": None, "variants": {}})
+        metric, value = row["metric"], int(row["value"])
+        if metric == "entries":
+            stats["entries"] = value
+        elif metric.startswith("exit:"):
+            stats["exits"][metric[len("exit:"):]] = value
+        elif metric.startswith("dwell:"):
+            dwell.setdefault(row["block_id"], {})[int(metric[len("dwell:"):])] = value
+        elif metric.startswith("variant:"):
+            _, variant, counter = metric.split(":", 2)
+            stats["variants"].setdefault(variant, {"entries": 0, "completions": 0})[counter] = value
+
+    for block_id, hist in dwell.items():
+        blocks[block_id]["median_dwell_sec"] = median_from_histogram(hist)
+
+    return {"hours": hours, "blocks": blocks}
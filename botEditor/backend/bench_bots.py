@@ -0,0 +1,98 @@
+"""
+Бенчмарк ответов /api/bots для пользователя с 200 крупными ботами (без БД).
+
+Было:  GET /api/bots отдает все сценарии целиком (dict из JSONB -> jsonable_encoder -> json).
+Стало: GET /api/bots отдает только метаданные (orjson), сценарий одного бота
+       загружается при открытии и отдается текстом JSONB без разбора (orjson.Fragment).
+
+Запуск: python backend/bench_bots.py [bots] [blocks]
+"""
+import json
+import sys
+import time
+import uuid
+from datetime import datetime
+
+import orjson
+
+try:
+    from fastapi.encoders import jsonable_encoder
+except ImportError:
+    def jsonable_encoder(obj):
+        return obj
+
+
+def make_scenario(n_blocks: int) -> dict:
+    ids = [str(uuid.uuid4()) for _ in range(n_blocks)]
+    blocks = []
+    for i, block_id in enumerate(ids):
+        blocks.append({
+            "BlockName": f"Блок {i}",
+            "Block_id": block_id,
+            "Type": "sendMessage",
+            "X": i * 40,
+            "Y": i * 25,
+            "Params": {"message": f"Текст сообщения номер {i}. " * 8},
+            "Connections": {"In": ids[max(0, i - 1):i], "Out": ids[i + 1:i + 2]},
+        })
+    return {"BotName": "bench", "Token": "", "Start": ids[0], "Final": ids[-1], "Blocks": blocks}
+
+
+def measure(label: str, fn, repeat: int = 5):
+    best = float("inf")
+    size = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        size = len(fn())
+        best = min(best, time.perf_counter() - started)
+    print(f"{label:<45} {best * 1000:8.2f} мс  {size / 1024:10.1f} KiB")
+
+
+def main():
+    n_bots = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    n_blocks = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+
+    now = datetime.now()
+    rows = []
+    for i in range(n_bots):
+        scenario = make_scenario(n_blocks)
+        rows.append({
+            "id": uuid.uuid4(), "name": f"bot {i}", "created_at": now, "updated_at": now,
+            "scenario": scenario,                       # так psycopg2 отдает JSONB по умолчанию
+            "scenario_text": json.dumps(scenario, ensure_ascii=False),
+            "bot_name": scenario["BotName"],
+        })
+    print(f"{n_bots} ботов по {n_blocks} блоков\n")
+
+    def full_list_json():
+        payload = [
+            {"id": str(r["id"]), "name": r["name"], "scenario": r["scenario"],
+             "created_at": r["created_at"].isoformat(), "updated_at": r["updated_at"].isoformat()}
+            for r in rows
+        ]
+        return json.dumps(jsonable_encoder(payload)).encode("utf-8")
+
+    def summary_list_orjson():
+        return orjson.dumps([
+            {"id": str(r["id"]), "name": r["name"], "bot_name": r["bot_name"],
+             "created_at": r["created_at"].isoformat(), "updated_at": r["updated_at"].isoformat()}
+            for r in rows
+        ])
+
+    row = rows[0]
+
+    def one_bot_parsed():
+        scenario = json.loads(row["scenario_text"])
+        return json.dumps(jsonable_encoder({"id": str(row["id"]), "scenario": scenario})).encode("utf-8")
+
+    def one_bot_fragment():
+        return orjson.dumps({"id": str(row["id"]), "scenario": orjson.Fragment(row["scenario_text"])})
+
+    measure("список: все сценарии (json)", full_list_json)
+    measure("список: только метаданные (orjson)", summary_list_orjson)
+    measure("один бот: разбор JSONB + json", one_bot_parsed)
+    measure("один бот: текст JSONB как Fragment", one_bot_fragment)
+
+
+if __name__ == "__main__":
+    main()
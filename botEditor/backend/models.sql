@@ -17,3 +17,44 @@ CREATE TABLE IF NOT EXISTS bot_model (
 
 CREATE INDEX IF NOT EXISTS idx_bot_model_user_id ON bot_model(user_id);
 
+-- Данные редактора (координаты и подписи блоков) отдельно от исполняемой модели:
+-- раннер читает только scenario, редактор склеивает scenario и layout
+ALTER TABLE bot_model ADD COLUMN IF NOT EXISTS layout JSONB NOT NULL DEFAULT '{}'::jsonb;
+
+-- Большие сценарии хранятся в TOAST сжатыми; lz4 (PostgreSQL 14+) быстрее pglz по умолчанию
+ALTER TABLE bot_model ALTER COLUMN scenario SET COMPRESSION lz4;
+ALTER TABLE bot_model ALTER COLUMN layout SET COMPRESSION lz4;
+
+
+-- Предагрегированная воронка по блокам: счетчики в часовых корзинах.
+-- metric: 'entries' | 'exit:<block_id>' | 'dwell:<bin>' (гистограмма времени на блоке, log2 секунд)
+CREATE TABLE IF NOT EXISTS block_stats (
+    bot_id      UUID NOT NULL REFERENCES bot_model(id) ON DELETE CASCADE,
+    bucket      TIMESTAMPTZ NOT NULL,
+    block_id    TEXT NOT NULL,
+    metric      TEXT NOT NULL,
+    value       BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (bot_id, bucket, block_id, metric)
+);
+
+-- Общие переменные ботов (блок sharedVar): одни на всех пользователей и все воркеры раннера
+CREATE TABLE IF NOT EXISTS shared_variables (
+    bot_id      TEXT NOT NULL,
+    name        TEXT NOT NULL,
+    value       JSONB,
+    updated_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (bot_id, name)
+);
+
+-- Уведомление раннеров об изменении сценария (кэш моделей сбрасывает запись по bot_id)
+CREATE OR REPLACE FUNCTION notify_bot_model_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('bot_model_changed', COALESCE(NEW.id, OLD.id)::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS bot_model_changed ON bot_model;
+CREATE TRIGGER bot_model_changed
+    AFTER INSERT OR UPDATE OR DELETE ON bot_model
+    FOR EACH ROW EXECUTE FUNCTION notify_bot_model_changed();
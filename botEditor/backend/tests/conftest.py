@@ -0,0 +1,9 @@
+# conftest.py
+# backend импортируется как пакет (from .db import ...), как при запуске uvicorn backend.app:app из botEditor/
+import os
+import sys
+
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/bot_editor_test")
+os.environ.setdefault("STATS_INGEST_TOKEN", "test-ingest-token")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
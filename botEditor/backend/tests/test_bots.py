@@ -0,0 +1,105 @@
+# test_bots.py
+from datetime import datetime
+
+import pytest
+
+for _module in ("fastapi", "httpx", "psycopg2", "jwt", "orjson", "passlib"):
+    pytest.importorskip(_module)
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from backend import app as backend_app
+from backend.app import BodySizeLimitMiddleware, app, current_user, split_layout
+
+
+def limited_client(max_bytes=10):
+    inner = FastAPI()
+
+    @inner.post("/echo")
+    async def echo(request: Request):
+        return {"size": len(await request.body())}
+
+    return TestClient(BodySizeLimitMiddleware(inner, max_bytes=max_bytes))
+
+
+def test_body_within_limit_passes():
+    assert limited_client().post("/echo", content=b"x" * 10).json() == {"size": 10}
+
+
+def test_oversized_body_rejected_by_content_length():
+    response = limited_client().post("/echo", content=b"x" * 11)
+    assert response.status_code == 413
+
+
+def test_oversized_chunked_body_rejected_while_reading():
+    response = limited_client().post("/echo", content=iter([b"x" * 6, b"x" * 6]))
+    assert response.status_code == 413
+
+
+def test_malformed_content_length_rejected():
+    response = limited_client().post("/echo", content=b"x", headers={"Content-Length": "abc"})
+    assert response.status_code == 400
+
+
+def test_split_layout_moves_editor_fields_out_of_the_model():
+    scenario = {"BotName": "Bot", "Blocks": [
+        {"Block_id": "a", "Type": "start", "X": 10, "Y": 20, "BlockName": "Старт", "Params": {}},
+        {"Block_id": "b", "Type": "final", "Params": {}},
+    ]}
+    model, layout = split_layout(scenario)
+    assert model["Blocks"] == [{"Block_id": "a", "Type": "start", "Params": {}}, {"Block_id": "b", "Type": "final", "Params": {}}]
+    assert layout == {"a": {"X": 10, "Y": 20, "BlockName": "Старт"}}
+    assert scenario["Blocks"][0]["X"] == 10
+
+
+class FakeCursor:
+    def __init__(self, row):
+        self.row = row
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchone(self):
+        return self.row
+
+
+class FakeConnection:
+    def __init__(self, row):
+        self.row = row
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return FakeCursor(self.row)
+
+    def close(self):
+        pass
+
+
+def test_get_bot_embeds_stored_json_text(monkeypatch):
+    now = datetime(2026, 1, 1)
+    row = {"id": "00000000-0000-0000-0000-000000000001", "name": "Bot", "bot_name": "Bot",
+           "created_at": now, "updated_at": now,
+           "scenario": '{"BotName": "Bot", "Blocks": []}', "layout": '{"a": {"X": 1}}'}
+    monkeypatch.setattr(backend_app, "get_connection", lambda: FakeConnection(row))
+    app.dependency_overrides[current_user] = lambda: {"id": 1}
+    try:
+        response = TestClient(app).get(f"/api/bots/{row['id']}")
+    finally:
+        app.dependency_overrides.clear()
+    assert response.status_code == 200
+    body = response.json()
+    assert body["scenario"] == {"BotName": "Bot", "Blocks": []}
+    assert body["layout"] == {"a": {"X": 1}}
+    assert body["updated_at"] == now.isoformat()
@@ -0,0 +1,53 @@
+# test_stats.py
+import pytest
+
+for _module in ("fastapi", "httpx", "psycopg2", "jwt", "orjson", "passlib"):
+    pytest.importorskip(_module)
+
+from fastapi.testclient import TestClient
+
+from backend.app import STATS_BUCKET_SECONDS, aggregate_events, app, dwell_bin, median_from_histogram
+
+
+def test_aggregate_counts_entries_exits_and_dwell():
+    events = [
+        {"event": "block_entered", "block_id": "a", "ts": 10},
+        {"event": "block_entered", "block_id": "b", "from_block": "a", "dwell": 3.0, "ts": 20},
+        {"event": "block_entered", "block_id": "b", "from_block": "a", "dwell": 5.0, "ts": STATS_BUCKET_SECONDS + 1},
+    ]
+    deltas = aggregate_events(events)
+    assert deltas[(0, "a", "entries")] == 1
+    assert deltas[(0, "b", "entries")] == 1
+    assert deltas[(0, "a", "exit:b")] == 1
+    assert deltas[(0, "a", f"dwell:{dwell_bin(3.0)}")] == 1
+    assert deltas[(STATS_BUCKET_SECONDS, "a", "exit:b")] == 1
+
+
+def test_aggregate_variant_stats():
+    deltas = aggregate_events([{"event": "variant_stats", "block_id": "s", "value": 1, "entries": 4,
+                                "completions": 2, "ts": 0}])
+    assert deltas[(0, "s", "variant:1:entries")] == 4
+    assert deltas[(0, "s", "variant:1:completions")] == 2
+
+
+def test_aggregate_skips_malformed_events():
+    deltas = aggregate_events([
+        {"event": "block_entered", "block_id": "a", "ts": "yesterday"},
+        {"event": "variant_stats", "block_id": "s", "entries": "many", "ts": 0},
+        {"event": "block_entered", "ts": 0},
+        {"event": "block_entered", "block_id": "b", "ts": 0},
+    ])
+    assert dict(deltas) == {(0, "b", "entries"): 1}
+
+
+def test_median_from_histogram():
+    assert median_from_histogram({}) is None
+    assert median_from_histogram({0: 3}) == 0.5
+    assert median_from_histogram({0: 1, 3: 2}) == 6.0
+
+
+def test_ingest_rejects_non_object_events():
+    client = TestClient(app)
+    response = client.post("/api/bots/00000000-0000-0000-0000-000000000000/events", json=[1],
+                           headers={"X-Ingest-Token": "test-ingest-token"})
+    assert response.status_code == 422
@@ -1,5 +1,6 @@
 # main_preview.py
 import json
+import copy
 import asyncio
 # 1. ВАЖНО: Импортируем create_proxy
 from pyodide.ffi import create_proxy
@@ -12,8 +13,27 @@ from state_storage import MemoryStorage
 interpreter = None
 api = None
 storage = None
+loaded_model = None
 PREVIEW_USER_ID = 777
 
+# Поля блока, которые влияют только на отображение в редакторе
+LAYOUT_FIELDS = ("X", "Y", "BlockName")
+
+
+class SnapshotStorage(MemoryStorage):
+    """
+    Хранилище превью, которое дополнительно запоминает снимок переменных
+    на входе в каждый блок. Нужен для перезапуска диалога с выбранного блока.
+    """
+    def __init__(self):
+        super().__init__()
+        self.snapshots = {}
+
+    async def save_state(self, user_id, state):
+        await super().save_state(user_id, state)
+        if state.get("step", 0) == 0:
+            self.snapshots[state["current_block"]] = copy.deepcopy(state["variables"])
+
 # --- Обработчики входящих событий ---
 
 async def process_user_text(text):
@@ -34,7 +54,7 @@ def init_preview(js_bridge):
     print("PYTHON: Init started...")
     
     api = PreviewAPI(js_bridge)
-    storage = MemoryStorage()
+    storage = SnapshotStorage()
     
     # 2. ВАЖНО: Оборачиваем функции в proxy перед передачей в JS.
     # Это предотвращает ошибку "borrowed proxy was automatically destroyed"
@@ -46,19 +66,67 @@ def init_preview(js_bridge):
     
     print("PYTHON: Callbacks registered successfully with create_proxy")
 
-async def start_preview(bot_model_json):
-    global interpreter
+def _executable_block(block):
+    return {k: v for k, v in block.items() if k not in LAYOUT_FIELDS}
+
+def diff_models(old_model, new_model):
+    """
+    Сравнивает две версии модели.
+    Возвращает (измененные/новые блоки, ID удаленных блоков).
+    Перемещение блока по холсту изменением не считается.
+    """
+    old_blocks = {b["Block_id"]: b for b in old_model.get("Blocks", [])}
+    new_blocks = {b["Block_id"]: b for b in new_model.get("Blocks", [])}
+
+    updated = [
+        b for block_id, b in new_blocks.items()
+        if block_id not in old_blocks or _executable_block(old_blocks[block_id]) != _executable_block(b)
+    ]
+    removed = [block_id for block_id in old_blocks if block_id not in new_blocks]
+    return updated, removed
+
+def get_snapshots():
+    """Снимки переменных по блокам (для выбора точки перезапуска в UI)"""
+    return json.dumps(storage.snapshots if storage else {}, ensure_ascii=False, default=str)
+
+async def start_preview(bot_model_json, from_block=None, variables_json=None):
+    """
+    Запуск превью.
+    Если интерпретатор уже создан, модель не пересобирается: применяются только измененные блоки.
+    from_block - ID блока, с которого начать диалог (по умолчанию Start).
+    variables_json - снимок переменных; если не задан, берется последний снимок на входе в from_block.
+    """
+    global interpreter, loaded_model
     try:
         # Парсинг модели
         if isinstance(bot_model_json, str):
             model = json.loads(bot_model_json)
         else:
             model = bot_model_json
-            
-        interpreter = BotInterpreter(model, api, storage)
-        
+
+        if interpreter is None:
+            interpreter = BotInterpreter(model, api, storage)
+        else:
+            updated, removed = diff_models(loaded_model, model)
+            interpreter.patch_blocks(updated, removed, bot_model=model)
+            print(f"PYTHON: Model patched ({len(updated)} changed, {len(removed)} removed)")
+        loaded_model = model
+
+        variables = None
+        if from_block:
+            if from_block not in interpreter.blocks:
+                from_block = None
+            elif variables_json:
+                variables = json.loads(variables_json) if isinstance(variables_json, str) else variables_json
+            else:
+                variables = copy.deepcopy(storage.snapshots.get(from_block))
+
+        if not from_block:
+            # Полный перезапуск — старые снимки больше не актуальны
+            storage.snapshots.clear()
+
         meta = {"username": "User", "first_name": "Test", "user_id": PREVIEW_USER_ID}
-        await interpreter.start_dialog(PREVIEW_USER_ID, meta)
+        await interpreter.start_dialog(PREVIEW_USER_ID, meta, start_block=from_block, variables=variables)
         
     except Exception as e:
         print(f"PYTHON ERROR: {e}")
@@ -5,6 +5,20 @@ export function fetchBotsApi() {
   return httpRequest("/bots", { method: "GET" });
 }
 
+// GET /api/bots/:id — сценарий и раскладка блоков хранятся раздельно, склеиваем здесь
+export async function fetchBotApi(id) {
+  const bot = await httpRequest(`/bots/${id}`, { method: "GET" });
+  const layout = bot.layout || {};
+  const scenario = {
+    ...bot.scenario,
+    Blocks: (bot.scenario?.Blocks || []).map((block) => ({
+      ...block,
+      ...layout[block.Block_id],
+    })),
+  };
+  return { ...bot, scenario };
+}
+
 // POST /api/bots
 export function createBotApi({ name, scenario }) {
   return httpRequest("/bots", {
@@ -28,3 +42,7 @@ export function deleteBotApi(id) {
   });
 }
 
+// GET /api/bots/:id/stats?hours=N — счетчики по блокам для оверлея на холсте
+export function fetchBotStatsApi(id, hours = 24) {
+  return httpRequest(`/bots/${id}/stats?hours=${hours}`, { method: "GET" });
+}
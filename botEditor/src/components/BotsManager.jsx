@@ -1,5 +1,6 @@
 import React, { useState } from "react";
 import PropTypes from "prop-types";
+import { fetchBotApi } from "../api/botsApi";
 import "./../styles/botsManager.css";
 
 export default function BotsManager({
@@ -23,7 +24,14 @@ export default function BotsManager({
     onDeleteBot(botId);
   };
 
-  const handleExportBot = (bot) => {
+  const handleExportBot = async (summary) => {
+    let bot;
+    try {
+      bot = await fetchBotApi(summary.id);
+    } catch (e) {
+      alert("Не удалось загрузить бота: " + e.message);
+      return;
+    }
     const scenario = bot.scenario || {};
     const fileNameBase = scenario.BotName || bot.name || "bot";
     const blob = new Blob([JSON.stringify(scenario, null, 2)], {
@@ -103,9 +111,9 @@ export default function BotsManager({
                 <div className="bots-item-main">
                   <div className="bots-item-name">{bot.name}</div>
                   <div className="bots-item-meta">ID: {bot.id}</div>
-                  {bot.scenario?.BotName && (
+                  {bot.bot_name && (
                     <div className="bots-item-meta bots-item-meta-light">
-                      В сценарии: {bot.scenario.BotName}
+                      В сценарии: {bot.bot_name}
                     </div>
                   )}
                 </div>
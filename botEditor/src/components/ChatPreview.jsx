@@ -3,6 +3,7 @@ import React, { useState, useEffect, useRef } from "react";
 import { toScenario } from "../utils/scenarioUtils";
 // Импорт обновленного класса моста
 import { PreviewJSBridge } from "./JsBridge";
+import { getPreviewRuntime } from "./PreviewRuntime";
 
 export default function ChatPreview({ nodes, edges, open: propOpen }) {
   // --- Состояние открытия окна ---
@@ -20,9 +21,12 @@ export default function ChatPreview({ nodes, edges, open: propOpen }) {
   const [choiceOptions, setChoiceOptions] = useState([]);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
+  const [bootMs, setBootMs] = useState(null);
+  // Блок, с которого перезапускается превью (null — с начала)
+  const [restartBlockId, setRestartBlockId] = useState(null);
 
   // --- Refs ---
-  const pyodideRef = useRef(null);
+  const runtimeRef = useRef(null);
   const jsBridgeRef = useRef(null);
   const messagesEndRef = useRef(null);
 
@@ -42,91 +46,33 @@ export default function ChatPreview({ nodes, edges, open: propOpen }) {
     }
   }, [messages, choiceOptions, isOpen]);
 
-  // 3️⃣ Загрузка Pyodide и Python-файлов
+  // 3️⃣ Подключение к Python-окружению (грузится в фоне воркером с момента открытия редактора)
   useEffect(() => {
     if (!isOpen) return;
 
-    async function initPyodide() {
-      if (pyodideRef.current) return;
+    const runtime = getPreviewRuntime();
+    runtime.attach(jsBridgeRef.current);
 
-      try {
-        setLoading(true);
-
-        // A. Загрузка движка
-        if (!window.loadPyodide) {
-           const script = document.createElement('script');
-           script.src = "https://cdn.jsdelivr.net/pyodide/v0.25.0/full/pyodide.js";
-           document.body.appendChild(script);
-           await new Promise(resolve => script.onload = resolve);
-        }
-
-        const pyodide = await window.loadPyodide({
-          indexURL: "https://cdn.jsdelivr.net/pyodide/v0.25.0/full/",
-          stdout: (text) => console.log("[Py]:", text),
-          stderr: (text) => console.error("[Py Err]:", text),
-        });
-
-        // B. Установка зависимостей
-        await pyodide.loadPackage("micropip");
-        const micropip = pyodide.pyimport("micropip");
-        await micropip.install(["pyodide-http", "aiohttp"]);
-
-        pyodide.runPython(`
-          import pyodide_http
-          pyodide_http.patch_all()
-        `);
-
-        // C. Загрузка файлов
-        const fileNames = [
-          "bot_api_interface.py",
-          "state_storage.py",
-          "api_preview.py",
-          "bot_interpreter.py",
-          "main_preview.py"
-        ];
-
-        const FS = pyodide.FS;
-        if (!FS.analyzePath("/python").exists) {
-            FS.mkdir("/python");
-        }
-
-        await Promise.all(fileNames.map(async (name) => {
-            // Добавляем timestamp для сброса кэша
-            const response = await fetch(`/python/${name}?t=${Date.now()}`);
-            if (!response.ok) throw new Error(`Failed to fetch ${name}`);
-            const code = await response.text();
-            FS.writeFile(`/python/${name}`, code);
-        }));
+    if (runtimeRef.current) return;
 
-        pyodide.runPython(`
-          import sys
-          if '/python' not in sys.path:
-              sys.path.append('/python')
-        `);
-
-        // D. Передача моста
-        pyodide.globals.set("js_bridge", jsBridgeRef.current);
-
-        // E. Инициализация через pyimport (надежно)
-        const mainModule = pyodide.pyimport("main_preview");
-        mainModule.init_preview(jsBridgeRef.current);
-
-        pyodideRef.current = pyodide;
+    setLoading(true);
+    runtime.ready
+      .then((ms) => {
+        runtimeRef.current = runtime;
+        setBootMs(ms);
         setLoading(false);
-      } catch (err) {
+      })
+      .catch((err) => {
         console.error("Pyodide Load Error:", err);
         setError("Ошибка инициализации Python: " + err.message);
         setLoading(false);
-      }
-    }
-
-    initPyodide();
+      });
   }, [isOpen]);
 
   // 4️⃣ Перезапуск сценария
   useEffect(() => {
     async function restartScenario() {
-      if (!isOpen || !pyodideRef.current || loading) return;
+      if (!isOpen || !runtimeRef.current || loading) return;
 
       // Сброс UI
       setMessages([]);
@@ -138,8 +84,7 @@ export default function ChatPreview({ nodes, edges, open: propOpen }) {
         const botModel = toScenario(nodes, edges);
         const jsonModel = JSON.stringify(botModel);
         
-        const mainModule = pyodideRef.current.pyimport("main_preview");
-        await mainModule.start_preview(jsonModel);
+        await runtimeRef.current.startPreview(jsonModel, restartBlockId);
         
       } catch (err) {
         console.error("Error starting scenario:", err);
@@ -148,7 +93,7 @@ export default function ChatPreview({ nodes, edges, open: propOpen }) {
     }
 
     restartScenario();
-  }, [isOpen, nodes, edges, loading]);
+  }, [isOpen, nodes, edges, loading, restartBlockId]);
 
   // --- Handlers ---
 
@@ -194,7 +139,29 @@ export default function ChatPreview({ nodes, edges, open: propOpen }) {
         <div style={{ position: "fixed", left: 20, bottom: 90, width: 360, height: 550, background: "white", border: "1px solid #e0e0e0", borderRadius: 16, boxShadow: "0 8px 30px rgba(0,0,0,0.15)", display: "flex", flexDirection: "column", zIndex: 999, overflow: "hidden", fontFamily: "-apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif" }}>
           
           <div style={{ padding: "16px", borderBottom: "1px solid #f0f0f0", fontWeight: 600, background: "#fff", display: "flex", justifyContent: "space-between", alignItems: "center", fontSize: "16px", color: "#333" }}>
-            <span>Превью бота</span>
+            <span>
+              Превью бота
+              {bootMs !== null && (
+                <span style={{ marginLeft: 8, fontSize: 11, fontWeight: 400, color: "#999" }}>
+                  Python: {bootMs} мс
+                </span>
+              )}
+            </span>
+            <select
+              value={restartBlockId || ""}
+              onChange={(e) => setRestartBlockId(e.target.value || null)}
+              title="Перезапускать с блока"
+              style={{ maxWidth: 120, fontSize: 12, border: "1px solid #e0e0e0", borderRadius: 6, padding: "2px 4px", color: "#555" }}
+            >
+              <option value="">С начала</option>
+              {nodes
+                .filter((n) => n.type !== "start" && n.type !== "final")
+                .map((n) => (
+                  <option key={n.id} value={n.id}>
+                    {n.data.label || n.id}
+                  </option>
+                ))}
+            </select>
             <button onClick={() => setIsOpen(false)} style={{ border: "none", background: "transparent", cursor: "pointer", fontSize: "24px", color: "#999", lineHeight: 1 }}>×</button>
           </div>
 
@@ -0,0 +1,100 @@
+// PreviewRuntime.js
+// Фоновая загрузка Python-окружения превью.
+// Воркер стартует сразу после загрузки редактора, а не при открытии окна превью,
+// поэтому к первому сообщению Pyodide обычно уже готов.
+
+class PreviewRuntime {
+  constructor() {
+    this.worker = new Worker(new URL("./pyodideWorker.js", import.meta.url));
+    this.bridge = null;
+    this.bootMs = null;
+    this.pending = new Map();
+    this.nextRequestId = 1;
+
+    this.worker.onmessage = (event) => this.handleMessage(event.data);
+
+    this.ready = new Promise((resolve, reject) => {
+      this.resolveReady = resolve;
+      this.rejectReady = reject;
+    });
+    this.worker.postMessage({ type: "boot" });
+  }
+
+  handleMessage(msg) {
+    switch (msg.type) {
+      case "ready":
+        this.bootMs = msg.bootMs;
+        console.info(`[PreviewRuntime] Python runtime booted in ${msg.bootMs} ms`);
+        this.resolveReady(msg.bootMs);
+        break;
+      case "boot_error":
+        this.rejectReady(new Error(msg.error));
+        break;
+      case "reply": {
+        const request = this.pending.get(msg.requestId);
+        if (!request) return;
+        this.pending.delete(msg.requestId);
+        if (msg.error) request.reject(new Error(msg.error));
+        else request.resolve(msg.result);
+        break;
+      }
+      // События Python -> UI пробрасываем в текущий мост
+      case "add_message":
+        this.bridge?.add_message(msg.text, msg.is_bot);
+        break;
+      case "activate_input_mode":
+        this.bridge?.activate_input_mode();
+        break;
+      case "show_choices":
+        this.bridge?.show_choices(msg.text, msg.choices);
+        break;
+      default:
+        break;
+    }
+  }
+
+  request(type, payload = {}) {
+    const requestId = this.nextRequestId++;
+    return new Promise((resolve, reject) => {
+      this.pending.set(requestId, { resolve, reject });
+      this.worker.postMessage({ type, requestId, ...payload });
+    });
+  }
+
+  /**
+   * Подключает мост UI: события из Python уходят в него,
+   * а ввод пользователя из моста — в воркер.
+   */
+  attach(bridge) {
+    this.bridge = bridge;
+    bridge.bindPythonCallbacks(
+      (text) => this.request("user_text", { text }),
+      (id) => this.request("user_choice", { id })
+    );
+  }
+
+  /**
+   * Запуск (или перезапуск) превью. Интерпретатор в воркере не пересоздается:
+   * применяются только измененные блоки. fromBlock — ID блока, с которого
+   * начать диалог со снимком переменных, запомненным при прошлом проходе.
+   */
+  startPreview(jsonModel, fromBlock = null) {
+    return this.request("start_preview", { model: jsonModel, fromBlock });
+  }
+}
+
+let runtime = null;
+
+/**
+ * Запускает загрузку Python-окружения в фоне (идемпотентно).
+ */
+export function preloadPreviewRuntime() {
+  if (!runtime) {
+    runtime = new PreviewRuntime();
+  }
+  return runtime;
+}
+
+export function getPreviewRuntime() {
+  return preloadPreviewRuntime();
+}
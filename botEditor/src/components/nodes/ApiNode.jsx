@@ -1,5 +1,6 @@
 import { Handle, Position } from "reactflow";
 import PropTypes from "prop-types";
+import NodeStats from "./NodeStats";
 export default function ApiNode({ data }) {
   return (
     <div className="node api">
@@ -7,6 +8,7 @@ export default function ApiNode({ data }) {
       <div className="node-text">
         {data.method} {data.url}
       </div>
+      <NodeStats stats={data.stats} />
       <Handle type="target" position={Position.Top} />
       <Handle type="source" position={Position.Bottom} />
     </div>
@@ -17,5 +19,6 @@ ApiNode.propTypes = {
     label: PropTypes.string,
     method: PropTypes.string,
     url: PropTypes.string,
+    stats: NodeStats.propTypes.stats,
   }).isRequired,
 };
\ No newline at end of file
@@ -2,6 +2,7 @@ import React from "react";
 import { Handle, Position } from "reactflow";
 import { renderTextWithVariables } from "../../utils/scenarioUtils";
 import PropTypes from "prop-types";
+import NodeStats from "./NodeStats";
 
 export default function ChoiceNode({ data }) {
   return (
@@ -13,6 +14,7 @@ export default function ChoiceNode({ data }) {
           {data.options.map((opt) => opt.label).join(", ")}
         </div>
       )}
+      <NodeStats stats={data.stats} />
       <Handle type="target" position={Position.Top} />
       {data.options &&
         data.options.map((opt, index) => {
@@ -43,5 +45,6 @@ ChoiceNode.propTypes = {
         label: PropTypes.string.isRequired,
       })
     ),
+    stats: NodeStats.propTypes.stats,
   }).isRequired,
 };
\ No newline at end of file
@@ -1,6 +1,7 @@
 import { Handle, Position } from "reactflow";
 import { renderTextWithVariables } from "../../utils/scenarioUtils";
 import PropTypes from "prop-types";
+import NodeStats from "./NodeStats";
 
 export default function ConditionNode({ data }) {
   return (
@@ -9,6 +10,7 @@ export default function ConditionNode({ data }) {
       <div className="condition-expression">
         {renderTextWithVariables(data.expression)}
       </div>
+      <NodeStats stats={data.stats} />
       <Handle type="target" position={Position.Top} />
       <Handle
         type="source"
@@ -31,5 +33,6 @@ ConditionNode.propTypes = {
   data: PropTypes.shape({
     label: PropTypes.string,
     expression: PropTypes.string,
+    stats: NodeStats.propTypes.stats,
   }).isRequired,
 };
@@ -1,10 +1,19 @@
 import { Handle, Position } from "reactflow";
+import PropTypes from "prop-types";
+import NodeStats from "./NodeStats";
 
-export default function FinalNode() {
+export default function FinalNode({ data }) {
   return (
     <div className="node final">
       <strong>Финал</strong>
+      <NodeStats stats={data?.stats} />
       <Handle type="target" position={Position.Top} />
     </div>
   );
 }
+
+FinalNode.propTypes = {
+  data: PropTypes.shape({
+    stats: NodeStats.propTypes.stats,
+  }),
+};
@@ -1,6 +1,7 @@
 import { Handle, Position } from "reactflow";
 import { renderTextWithVariables } from "../../utils/scenarioUtils";
 import PropTypes from "prop-types";
+import NodeStats from "./NodeStats";
 
 export default function InputNode({ data }) {
   return (
@@ -8,6 +9,7 @@ export default function InputNode({ data }) {
       <strong>{data.label}</strong>
       <div className="node-text">{renderTextWithVariables(data.prompt)}</div>
       <div className="node-subtext">→ {data.variableName}</div>
+      <NodeStats stats={data.stats} />
       <Handle type="target" position={Position.Top} />
       <Handle type="source" position={Position.Bottom} />
     </div>
@@ -19,5 +21,6 @@ InputNode.propTypes = {
     label: PropTypes.string,
     prompt: PropTypes.oneOfType([PropTypes.string, PropTypes.node]),
     variableName: PropTypes.string,
+    stats: NodeStats.propTypes.stats,
   }).isRequired,
 };
@@ -1,12 +1,14 @@
 import { Handle, Position } from "reactflow";
 import { renderTextWithVariables } from "../../utils/scenarioUtils";
 import PropTypes from "prop-types";
+import NodeStats from "./NodeStats";
 
 export default function MessageNode({ data }) {
   return (
     <div className="node message">
       <strong>{data.label}</strong>
       <div className="node-text">{renderTextWithVariables(data.text)}</div>
+      <NodeStats stats={data.stats} />
       <Handle type="target" position={Position.Top} />
       <Handle type="source" position={Position.Bottom} />
     </div>
@@ -17,5 +19,6 @@ MessageNode.propTypes = {
   data: PropTypes.shape({
     label: PropTypes.string,
     text: PropTypes.oneOfType([PropTypes.string, PropTypes.node]),
+    stats: NodeStats.propTypes.stats,
   }).isRequired,
 };
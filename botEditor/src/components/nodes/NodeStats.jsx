@@ -0,0 +1,26 @@
+import PropTypes from "prop-types";
+
+// Оверлей статистики блока (GET /api/bots/:id/stats): входы, сколько пользователей здесь остановились
+// и медиана времени на блоке. Переходы по веткам показываются подписями на рёбрах.
+export default function NodeStats({ stats }) {
+  if (!stats) return null;
+  const exited = Object.values(stats.exits || {}).reduce((sum, n) => sum + n, 0);
+  const stopped = Math.max(0, stats.entries - exited);
+  return (
+    <div className="node-stats">
+      <span title="Входы">▶ {stats.entries}</span>
+      {stopped > 0 && <span title="Не пошли дальше">✕ {stopped}</span>}
+      {stats.median_dwell_sec != null && (
+        <span title="Медиана времени на блоке">⏱ {stats.median_dwell_sec} с</span>
+      )}
+    </div>
+  );
+}
+
+NodeStats.propTypes = {
+  stats: PropTypes.shape({
+    entries: PropTypes.number,
+    exits: PropTypes.objectOf(PropTypes.number),
+    median_dwell_sec: PropTypes.number,
+  }),
+};
@@ -1,10 +1,19 @@
 import { Handle, Position } from "reactflow";
+import PropTypes from "prop-types";
+import NodeStats from "./NodeStats";
 
-export default function StartNode() {
+export default function StartNode({ data }) {
   return (
     <div className="node start">
       <strong>Старт</strong>
+      <NodeStats stats={data?.stats} />
       <Handle type="source" position={Position.Bottom} />
     </div>
   );
 }
+
+StartNode.propTypes = {
+  data: PropTypes.shape({
+    stats: NodeStats.propTypes.stats,
+  }),
+};
@@ -0,0 +1,185 @@
+// pyodideWorker.js
+// Python-окружение превью живет в Web Worker, чтобы загрузка Pyodide
+// не блокировала редактор. С основным потоком общаемся через postMessage.
+
+const PYODIDE_URL = "https://cdn.jsdelivr.net/pyodide/v0.25.0/full/";
+
+// Минимальный набор модулей интерпретатора (без сетевых зависимостей)
+const PYTHON_FILES = [
+  "bot_api_interface.py",
+  "state_storage.py",
+  "timers.py",
+  "api_preview.py",
+  "bot_interpreter.py",
+  "main_preview.py",
+];
+
+// Необязательные подсистемы: интерпретатор импортирует их в обработчиках своих блоков,
+// поэтому файлы загружаются только для сценариев с такими блоками
+const BLOCK_PYTHON_FILES = {
+  apiRequest: ["http_metrics.py", "http_client.py"],
+  parallelApi: ["http_metrics.py", "http_client.py"],
+  sharedVar: ["shared_vars.py"],
+  script: ["script_runner.py"],
+};
+
+let pyodide = null;
+let mainModule = null;
+const loadedFiles = new Set();
+let networkReady = null;
+let bootPromise = null;
+
+// Мост Python -> UI: вместо прямых вызовов React-сеттеров шлем события в основной поток
+const workerBridge = {
+  async add_message(text, is_bot = true) {
+    self.postMessage({ type: "add_message", text, is_bot });
+  },
+
+  async activate_input_mode() {
+    self.postMessage({ type: "activate_input_mode" });
+  },
+
+  async show_choices(text, choices) {
+    // PyProxy нельзя передать через postMessage — конвертируем в обычные объекты
+    const options =
+      choices && typeof choices.toJs === "function"
+        ? choices.toJs({ dict_converter: Object.fromEntries })
+        : choices;
+    self.postMessage({ type: "show_choices", text, choices: options });
+  },
+
+  bindPythonCallbacks(onText, onChoice) {
+    this.pyCallbackText = onText;
+    this.pyCallbackChoice = onChoice;
+  },
+};
+
+async function loadPythonFiles(names) {
+  const missing = names.filter((name) => !loadedFiles.has(name));
+  await Promise.all(
+    missing.map(async (name) => {
+      // Добавляем timestamp для сброса кэша
+      const response = await fetch(`/python/${name}?t=${Date.now()}`);
+      if (!response.ok) throw new Error(`Failed to fetch ${name}`);
+      pyodide.FS.writeFile(`/python/${name}`, await response.text());
+      loadedFiles.add(name);
+    })
+  );
+  if (missing.length && mainModule) {
+    // Файлы появились после старта интерпретатора - сбрасываем кэш поиска модулей
+    pyodide.runPython("import importlib; importlib.invalidate_caches()");
+  }
+}
+
+function parseBlockTypes(jsonModel) {
+  try {
+    const model = JSON.parse(jsonModel);
+    return new Set((model.Blocks || []).map((b) => b.Type));
+  } catch {
+    return new Set();
+  }
+}
+
+function scenarioPythonFiles(blockTypes) {
+  return [...blockTypes].flatMap((type) => BLOCK_PYTHON_FILES[type] || []);
+}
+
+async function boot() {
+  const startedAt = performance.now();
+
+  importScripts(`${PYODIDE_URL}pyodide.js`);
+  pyodide = await self.loadPyodide({
+    indexURL: PYODIDE_URL,
+    stdout: (text) => console.log("[Py]:", text),
+    stderr: (text) => console.error("[Py Err]:", text),
+  });
+
+  const FS = pyodide.FS;
+  if (!FS.analyzePath("/python").exists) {
+    FS.mkdir("/python");
+  }
+
+  await loadPythonFiles(PYTHON_FILES);
+
+  pyodide.runPython(`
+    import sys
+    if '/python' not in sys.path:
+        sys.path.append('/python')
+  `);
+
+  mainModule = pyodide.pyimport("main_preview");
+  mainModule.init_preview(workerBridge);
+
+  return Math.round(performance.now() - startedAt);
+}
+
+// Блоки, которые ходят в сеть через HttpClient интерпретатора
+const NETWORK_BLOCK_TYPES = new Set(["apiRequest", "parallelApi"]);
+
+/**
+ * aiohttp и pyodide-http ставим только если в сценарии есть сетевой блок (NETWORK_BLOCK_TYPES).
+ */
+function ensureNetwork() {
+  if (!networkReady) {
+    networkReady = (async () => {
+      await pyodide.loadPackage("micropip");
+      const micropip = pyodide.pyimport("micropip");
+      await micropip.install(["pyodide-http", "aiohttp"]);
+      pyodide.runPython(`
+        import pyodide_http
+        pyodide_http.patch_all()
+      `);
+    })();
+  }
+  return networkReady;
+}
+
+function scenarioNeedsNetwork(blockTypes) {
+  return [...blockTypes].some((type) => NETWORK_BLOCK_TYPES.has(type));
+}
+
+async function handleRequest(msg) {
+  await bootPromise;
+  switch (msg.type) {
+    case "start_preview": {
+      const blockTypes = parseBlockTypes(msg.model);
+      await loadPythonFiles(scenarioPythonFiles(blockTypes));
+      if (scenarioNeedsNetwork(blockTypes)) {
+        await ensureNetwork();
+      }
+      // undefined превращается в Python None -> старт с блока Start
+      await mainModule.start_preview(msg.model, msg.fromBlock || undefined);
+      return null;
+    }
+    case "user_text":
+      if (workerBridge.pyCallbackText) await workerBridge.pyCallbackText(msg.text);
+      return null;
+    case "user_choice":
+      if (workerBridge.pyCallbackChoice) await workerBridge.pyCallbackChoice(msg.id);
+      return null;
+    default:
+      throw new Error(`Unknown request: ${msg.type}`);
+  }
+}
+
+self.onmessage = async (event) => {
+  const msg = event.data;
+
+  if (msg.type === "boot") {
+    if (!bootPromise) bootPromise = boot();
+    try {
+      const bootMs = await bootPromise;
+      self.postMessage({ type: "ready", bootMs });
+    } catch (err) {
+      self.postMessage({ type: "boot_error", error: err.message });
+    }
+    return;
+  }
+
+  try {
+    const result = await handleRequest(msg);
+    self.postMessage({ type: "reply", requestId: msg.requestId, result });
+  } catch (err) {
+    self.postMessage({ type: "reply", requestId: msg.requestId, error: err.message });
+  }
+};
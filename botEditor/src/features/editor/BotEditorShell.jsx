@@ -1,5 +1,6 @@
 import React, {
   useCallback,
+  useMemo,
   useRef,
   useState,
   useEffect,
@@ -19,6 +20,7 @@ import { fromScenario, toScenario } from "../../utils/scenarioUtils";
 import { validateScenario } from "../../utils/validation";
 
 import ChatPreview from "../../components/ChatPreview";
+import { preloadPreviewRuntime } from "../../components/PreviewRuntime";
 import BotsManager from "../../components/BotsManager";
 import Canvas from "../../components/Canvas";
 
@@ -40,9 +42,11 @@ import DefaultInspector from "../../components/inspectors/DefaultInspector";
 import { useAuth } from "../../auth/AuthContext";
 import {
   fetchBotsApi,
+  fetchBotApi,
   createBotApi,
   updateBotApi,
   deleteBotApi,
+  fetchBotStatsApi,
 } from "../../api/botsApi";
 
 const nodeTypes = {
@@ -83,6 +87,10 @@ export default function BotEditorShell() {
   const [view, setView] = useState("editor");
   const [bots, setBots] = useState([]);
   const [loadingBots, setLoadingBots] = useState(false);
+  const [currentBotId, setCurrentBotId] = useState(null);
+
+  // Оверлей статистики: block_id -> {entries, exits, median_dwell_sec}; null - выключен
+  const [blockStats, setBlockStats] = useState(null);
 
   const onConnect = useCallback(
     (params) => setEdges((eds) => addEdge(params, eds)),
@@ -155,6 +163,39 @@ export default function BotEditorShell() {
     setShowInspectorModal(false);
   }, [selectedNodeId, setNodes, setEdges]);
 
+  const toggleStats = async () => {
+    if (blockStats) {
+      setBlockStats(null);
+      return;
+    }
+    try {
+      const data = await fetchBotStatsApi(currentBotId);
+      setBlockStats(data.blocks || {});
+    } catch (e) {
+      alert("Не удалось загрузить статистику: " + e.message);
+    }
+  };
+
+  // Статистика подмешивается только в отображение: в сценарий и состояние холста она не попадает
+  const displayNodes = useMemo(
+    () =>
+      blockStats
+        ? nodes.map((n) => ({ ...n, data: { ...n.data, stats: blockStats[n.id] } }))
+        : nodes,
+    [nodes, blockStats]
+  );
+
+  const displayEdges = useMemo(
+    () =>
+      blockStats
+        ? edges.map((e) => {
+            const count = blockStats[e.source]?.exits?.[e.target];
+            return count ? { ...e, label: String(count) } : e;
+          })
+        : edges,
+    [edges, blockStats]
+  );
+
   const extractUsedVariables = useCallback(() => {
     const vars = new Set();
     if (globalVariables) {
@@ -171,6 +212,11 @@ export default function BotEditorShell() {
     return Array.from(vars).sort();
   }, [nodes, globalVariables]);
 
+  // Python-окружение превью грузим в фоне сразу после открытия редактора
+  useEffect(() => {
+    preloadPreviewRuntime();
+  }, []);
+
   useEffect(() => {
     setLoadingBots(true);
     fetchBotsApi()
@@ -222,9 +268,11 @@ export default function BotEditorShell() {
         setBots((prev) =>
           prev.map((b) => (b.id === existing.id ? updated : b))
         );
+        setCurrentBotId(existing.id);
       } else {
         const created = await createBotApi({ name, scenario });
         setBots((prev) => [...prev, created]);
+        setCurrentBotId(created.id);
       }
       alert("Бот сохранён.");
     } catch (e) {
@@ -242,11 +290,20 @@ export default function BotEditorShell() {
     }
   };
 
-  const handleSelectBot = (bot) => {
+  const handleSelectBot = async (summary) => {
+    let bot;
+    try {
+      bot = await fetchBotApi(summary.id);
+    } catch (e) {
+      alert("Не удалось загрузить бота: " + e.message);
+      return;
+    }
     const { nodes: newNodes, edges: newEdges } = fromScenario(bot.scenario);
     setNodes(newNodes);
     setEdges(newEdges);
     setSelectedNodeId(null);
+    setCurrentBotId(summary.id);
+    setBlockStats(null);
     setBotName(bot.scenario.BotName || bot.name);
     setBotToken(bot.scenario.Token || "");
     if (bot.scenario.GlobalVariables && Array.isArray(bot.scenario.GlobalVariables)) {
@@ -261,6 +318,8 @@ export default function BotEditorShell() {
     setNodes([]);
     setEdges([]);
     setSelectedNodeId(null);
+    setCurrentBotId(null);
+    setBlockStats(null);
     setBotName(name || "Bot");
     setBotToken("");
     setGlobalVariables("");
@@ -273,6 +332,10 @@ export default function BotEditorShell() {
     try {
       await deleteBotApi(botId);
       setBots((prev) => prev.filter((b) => b.id !== botId));
+      if (botId === currentBotId) {
+        setCurrentBotId(null);
+        setBlockStats(null);
+      }
     } catch (e) {
       alert("Не удалось удалить бота: " + e.message);
     }
@@ -445,6 +508,14 @@ export default function BotEditorShell() {
           <button onClick={handleValidate} className="mt8">
             Проверить
           </button>
+          <button
+            onClick={toggleStats}
+            className="mt8"
+            disabled={!currentBotId}
+            title={currentBotId ? "" : "Статистика доступна для сохранённого бота"}
+          >
+            {blockStats ? "Скрыть статистику" : "Статистика"}
+          </button>
           <input
             type="file"
             accept="application/json"
@@ -455,8 +526,8 @@ export default function BotEditorShell() {
         </div>
 
         <Canvas
-          nodes={nodes}
-          edges={edges}
+          nodes={displayNodes}
+          edges={displayEdges}
           nodeTypes={nodeTypes}
           onNodesChange={onNodesChange}
           onEdgesChange={onEdgesChange}
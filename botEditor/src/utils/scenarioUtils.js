@@ -37,12 +37,16 @@ export function renderTextWithVariables(text) {
   return parts.length > 0 ? parts : text;
 }
 
+// Тип узла холста -> тип блока сценария. Превью и раннер получают только типы сценария:
+// по ним интерпретатор выбирает обработчик, а воркер превью - модули и сеть.
 export function nodeTypeFromScenarioType(type) {
   switch (type) {
     case "sendMessage":
       return "message";
     case "getMessage":
       return "input";
+    case "apiRequest":
+      return "api";
     default:
       return type;
   }
@@ -54,6 +58,8 @@ export function scenarioTypeFromNodeType(type) {
       return "sendMessage";
     case "input":
       return "getMessage";
+    case "api":
+      return "apiRequest";
     default:
       return type;
   }
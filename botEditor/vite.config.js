@@ -1,6 +1,55 @@
+import fs from 'node:fs';
+import path from 'node:path';
+import { fileURLToPath } from 'node:url';
 import { defineConfig } from 'vite';
 import react from '@vitejs/plugin-react';
 
+// Ядро интерпретатора живет в одном месте (../interpreter) и используется
+// и Telegram-раннером, и превью. Здесь оно отдается Pyodide как /python/*.py.
+const INTERPRETER_DIR = fileURLToPath(new URL('../interpreter', import.meta.url));
+const INTERPRETER_CORE = [
+  'bot_api_interface.py',
+  'state_storage.py',
+  'timers.py',
+  'bot_interpreter.py',
+];
+
+// Модули блоков apiRequest/parallelApi, sharedVar и script: воркер превью
+// скачивает их только для сценариев с такими блоками (BLOCK_PYTHON_FILES)
+const INTERPRETER_OPTIONAL = [
+  'http_metrics.py',
+  'http_client.py',
+  'shared_vars.py',
+  'script_runner.py',
+];
+
+const INTERPRETER_FILES = [...INTERPRETER_CORE, ...INTERPRETER_OPTIONAL];
+
+function interpreterCore() {
+  return {
+    name: 'interpreter-core',
+    // dev: отдаем файлы ядра напрямую из ../interpreter
+    configureServer(server) {
+      server.middlewares.use((req, res, next) => {
+        const name = (req.url || '').split('?')[0].replace(/^\/python\//, '');
+        if (!INTERPRETER_FILES.includes(name)) return next();
+        res.setHeader('Content-Type', 'text/x-python; charset=utf-8');
+        res.end(fs.readFileSync(path.join(INTERPRETER_DIR, name)));
+      });
+    },
+    // build: кладем файлы ядра в dist/python рядом с адаптерами превью
+    generateBundle() {
+      for (const name of INTERPRETER_FILES) {
+        this.emitFile({
+          type: 'asset',
+          fileName: `python/${name}`,
+          source: fs.readFileSync(path.join(INTERPRETER_DIR, name)),
+        });
+      }
+    },
+  };
+}
+
 export default defineConfig({
-  plugins: [react()],
+  plugins: [react(), interpreterCore()],
 });
@@ -0,0 +1,291 @@
+# analytics.py
+"""
+Аналитика диалогов (воронка по блокам).
+
+Интерпретатор сообщает события block_entered / block_answered / dialog_finished в AnalyticsSink.
+emit() никогда не блокирует диалог: событие кладется в ограниченный буфер, а фоновая задача
+пачками сбрасывает его в хранилище (JSON Lines файл, COPY в Postgres или бэкенд редактора).
+Если буфер переполнен, событие отбрасывается и учитывается в счетчике dropped.
+
+Счетчики, которые выгоднее копить в памяти (variant_stats блока split), регистрируются
+через add_collector: при каждом сбросе их приращения пишутся отдельной пачкой (мимо буфера) и
+считаются выгруженными только после успешной записи - при ошибке они попадут в следующий сброс.
+"""
+import asyncio
+import io
+import json
+import logging
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BLOCK_ENTERED = "block_entered"
+BLOCK_ANSWERED = "block_answered"
+DIALOG_FINISHED = "dialog_finished"
+VARIANT_STATS = "variant_stats"     # Приращения входов/завершений по вариантам блока split
+
+
+# -------------------------
+# Хранилища событий
+# -------------------------
+
+class JsonlEventWriter:
+    """Append-only файл: одна строка JSON на событие"""
+    def __init__(self, path: str):
+        self.path = path
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(e, ensure_ascii=False, default=str) + "\n" for e in batch))
+
+    async def write(self, batch: List[Dict[str, Any]]):
+        # Файловый I/O - в отдельном потоке, чтобы не задерживать event loop
+        await asyncio.to_thread(self._write, batch)
+
+
+class PostgresCopyEventWriter:
+    """
+    Пакетная запись через COPY в таблицу:
+        CREATE TABLE dialog_event (ts DOUBLE PRECISION, bot TEXT, user_id BIGINT,
+                                   event TEXT, block_id TEXT, value TEXT, extra JSONB);
+    Поля события сверх основных (from_block, dwell, entries/completions варианта split) - в extra.
+    Для существующей таблицы: ALTER TABLE dialog_event ADD COLUMN IF NOT EXISTS extra JSONB;
+    """
+    COLUMNS = ("ts", "bot", "user_id", "event", "block_id", "value")
+    EXTRA_COLUMN = "extra"
+
+    def __init__(self, dsn: str, table: str = "dialog_event"):
+        self.dsn = dsn
+        self.table = table
+
+    def _copy_rows(self, batch: List[Dict[str, Any]]) -> io.StringIO:
+        """Пачка в текстовом формате COPY"""
+        buf = io.StringIO()
+        for e in batch:
+            row = [self._copy_value(e.get(col)) for col in self.COLUMNS]
+            extra = {k: v for k, v in e.items() if k not in self.COLUMNS}
+            row.append(self._copy_value(json.dumps(extra, ensure_ascii=False, default=str) if extra else None))
+            buf.write("\t".join(row) + "\n")
+        buf.seek(0)
+        return buf
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        import psycopg2
+
+        buf = self._copy_rows(batch)
+        conn = psycopg2.connect(self.dsn)
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    columns = ", ".join(self.COLUMNS + (self.EXTRA_COLUMN,))
+                    cur.copy_expert(f"COPY {self.table} ({columns}) FROM STDIN", buf)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _copy_value(v: Any) -> str:
+        if v is None:
+            return "\\N"
+        return str(v).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+    async def write(self, batch: List[Dict[str, Any]]):
+        await asyncio.to_thread(self._write, batch)
+
+
+class HttpEventWriter:
+    """
+    Отправка пачек в бэкенд редактора (POST /api/bots/{id}/events),
+    где они сразу сворачиваются в счетчики воронки по блокам.
+    """
+    def __init__(self, url: str, token: str, timeout: float = 10.0):
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+        self._session = None
+
+    async def write(self, batch: List[Dict[str, Any]]):
+        import aiohttp
+
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        async with self._session.post(self.url, json=batch, headers={"X-Ingest-Token": self.token}) as resp:
+            resp.raise_for_status()
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+# -------------------------
+# Sink
+# -------------------------
+
+class AnalyticsSink:
+    def __init__(self, writer, bot: str = "", max_buffer: int = 100_000,
+                 batch_size: int = 1000, flush_interval: float = 5.0, stop_timeout: float = 10.0):
+        self.writer = writer
+        self.bot = bot
+        self.max_buffer = max_buffer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Сколько при остановке ждать уже начатого сброса, прежде чем отменить его
+        self.stop_timeout = stop_timeout
+
+        self._buffer: List[Dict[str, Any]] = []
+        self._collectors: List[Callable[[], Optional[Tuple[List[Dict[str, Any]], Callable[[], None]]]]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.counters = {
+            "emitted": 0,
+            "dropped": 0,
+            "flushed": 0,
+            "flush_errors": 0,
+        }
+
+    def record(self, event: str, user_id: Optional[int], block_id: Optional[str] = None, value: Any = None,
+               **extra) -> Dict[str, Any]:
+        record = {"ts": time.time(), "bot": self.bot, "user_id": user_id, "event": event, "block_id": block_id, "value": value}
+        if extra:
+            record.update(extra)
+        return record
+
+    def emit(self, event: str, user_id: int, block_id: Optional[str] = None, value: Any = None, **extra):
+        """Неблокирующая запись события. При переполнении буфера событие отбрасывается."""
+        if len(self._buffer) >= self.max_buffer:
+            self.counters["dropped"] += 1
+            return
+        self._buffer.append(self.record(event, user_id, block_id, value, **extra))
+        self.counters["emitted"] += 1
+
+        if len(self._buffer) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def add_collector(self, collect: Callable[[], Optional[Tuple[List[Dict[str, Any]], Callable[[], None]]]]):
+        """
+        collect() вызывается при каждом сбросе и возвращает (записи приращений, commit) или None.
+        commit() вызывается только после успешной записи: до этого приращения остаются в коллекторе.
+        """
+        self._collectors.append(collect)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Дожидается начатого сброса (не дольше stop_timeout), останавливает фоновую задачу и сбрасывает остаток"""
+        if self._task:
+            self._stopping = True
+            self._wakeup.set()
+            try:
+                await asyncio.wait_for(asyncio.shield(self._task), self.stop_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Analytics flush did not finish in {self.stop_timeout}s, cancelling")
+                self._task.cancel()
+                await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        if hasattr(self.writer, "close"):
+            await self.writer.close()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        for collect in self._collectors:
+            await self._flush_collector(collect)
+        while self._buffer:
+            # Забираем пачку сразу, чтобы новые события копились в свежем буфере
+            batch, self._buffer = self._buffer[:self.batch_size], self._buffer[self.batch_size:]
+            try:
+                await self.writer.write(batch)
+                self.counters["flushed"] += len(batch)
+            except asyncio.CancelledError:
+                self.counters["dropped"] += len(batch)
+                raise
+            except Exception as e:
+                # Хранилище недоступно - пачка теряется, диалоги продолжают работать
+                self.counters["flush_errors"] += 1
+                self.counters["dropped"] += len(batch)
+                logger.error(f"Analytics flush failed ({len(batch)} events dropped): {e}")
+
+    async def _flush_collector(self, collect):
+        try:
+            collected = collect()
+        except Exception as e:
+            logger.error(f"Analytics collector failed: {e}")
+            return
+        if not collected or not collected[0]:
+            return
+        records, commit = collected
+        try:
+            for i in range(0, len(records), self.batch_size):
+                await self.writer.write(records[i:i + self.batch_size])
+        except Exception as e:
+            # Приращения не подтверждены - коллектор вернет их (с новыми) при следующем сбросе
+            self.counters["flush_errors"] += 1
+            logger.error(f"Analytics flush of collected counters failed, will retry: {e}")
+            return
+        self.counters["flushed"] += len(records)
+        commit()
+
+
+# -------------------------
+# Запросы
+# -------------------------
+
+def block_conversion(path: str, bot: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Конверсия по блокам из JSON Lines журнала событий.
+    Для каждого блока: сколько уникальных пользователей вошло, ответило,
+    сколько из вошедших завершили диалог и сколько на нем остановились (drop_off).
+    """
+    entered = defaultdict(set)
+    answered = defaultdict(set)
+    answers = defaultdict(lambda: defaultdict(int))
+    last_block: Dict[int, str] = {}
+    finished = set()
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            e = json.loads(line)
+            if bot is not None and e.get("bot") != bot:
+                continue
+            user_id, block_id = e["user_id"], e.get("block_id")
+            if e["event"] == BLOCK_ENTERED:
+                entered[block_id].add(user_id)
+                last_block[user_id] = block_id
+                finished.discard(user_id)
+            elif e["event"] == BLOCK_ANSWERED:
+                answered[block_id].add(user_id)
+                answers[block_id][str(e.get("value"))] += 1
+            elif e["event"] == DIALOG_FINISHED:
+                finished.add(user_id)
+
+    drop_off = defaultdict(int)
+    for user_id, block_id in last_block.items():
+        if user_id not in finished:
+            drop_off[block_id] += 1
+
+    result = {}
+    for block_id, users in entered.items():
+        n = len(users)
+        result[block_id] = {
+            "entered": n,
+            "answered": len(answered[block_id]),
+            "finished": len(users & finished),
+            "drop_off": drop_off[block_id],
+            "conversion": round(len(users & finished) / n, 4) if n else 0.0,
+            "answers": dict(answers[block_id]),
+        }
+    return result
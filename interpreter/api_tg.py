@@ -1,9 +1,14 @@
 # api_tg.py
 import logging
+import time
+from collections import OrderedDict
 from typing import Optional, List, Dict, Any
 from aiogram import Bot, Dispatcher, types
 from aiogram.filters import CommandStart
 from bot_api_interface import BotAPI
+from rate_limiter import TokenBucket, InboundLimiter
+from dedup import SeenSet
+from lifecycle import InflightTracker
 
 # Настройка логирования для этого файла
 logger = logging.getLogger(__name__)
@@ -14,10 +19,40 @@ class TelegramAPI(BotAPI):
     Работает в асинхронном режиме: отправляет запросы и сразу возвращает управление.
     Входящие сообщения обрабатываются через хендлеры и передаются в resume_dialog.
     """
-    def __init__(self, token: str, interpreter = None):
+    # Глобальный лимит Telegram на исходящие сообщения бота (~30 в секунду)
+    OUTBOUND_RATE = 30
+
+    # Что делать с клавиатурой choice после нажатия:
+    #   keep  - оставить как есть (каждый choice - новое сообщение);
+    #   strip - убрать кнопки из нажатого сообщения;
+    #   edit  - следующий choice перерисовывает это же сообщение, если оно последнее в чате
+    #           и до нового вопроса ничего не отправлено; иначе кнопки убираются и вопрос уходит новым
+    CHOICE_MODES = ("keep", "strip", "edit")
+    STALE_CHOICE_TEXT = "Эта опция уже недоступна"
+    # Для скольких чатов помнить ID последнего отправленного сообщения (LRU)
+    LAST_SENT_SIZE = 100_000
+
+    def __init__(self, token: str, interpreter = None, outbound_rate: float = OUTBOUND_RATE, choice_mode: str = "edit",
+                 seen: Optional[SeenSet] = None, inbound: Optional[InboundLimiter] = None):
+        if choice_mode not in self.CHOICE_MODES:
+            raise ValueError(f"Unknown choice mode: {choice_mode}")
         self.bot = Bot(token=token)
         self.dp = Dispatcher()
         self.interpreter = interpreter
+        # Все исходящие вызовы проходят через общий лимитер (диалоги, рассылки)
+        self.rate_limiter = TokenBucket(rate=outbound_rate)
+        self.choice_mode = choice_mode
+        # user_id -> message_id сообщения с нажатой клавиатурой (только на время обработки нажатия)
+        self._editable: Dict[int, int] = {}
+        # user_id -> message_id последнего отправленного ботом сообщения
+        self._last_sent: "OrderedDict[int, int]" = OrderedDict()
+        # Уже обработанные апдейты: повторная доставка отсекается до загрузки сессии
+        self.seen = seen if seen is not None else SeenSet()
+        self.dp.update.outer_middleware(self._drop_duplicates)
+        # Лимит входящих событий на пользователя: флуд не доходит до хранилища и интерпретатора
+        self.inbound = inbound if inbound is not None else InboundLimiter()
+        # Апдейты в обработке: при остановке их дожидаемся
+        self.inflight = InflightTracker()
         
         # --- Регистрация хендлеров ---
         # 1. Сначала команды (/start)
@@ -36,13 +71,66 @@ class TelegramAPI(BotAPI):
 
     async def run(self):
         logger.info("Starting Telegram Polling...")
-        await self.dp.start_polling(self.bot)
+        # Сигналы и закрытие сессии - забота Lifecycle: после остановки polling
+        # начатые диалоги еще отправляют сообщения
+        await self.dp.start_polling(self.bot, handle_signals=False, close_bot_session=False)
+
+    async def stop_polling(self):
+        try:
+            await self.dp.stop_polling()
+        except RuntimeError:
+            # polling не запущен
+            pass
+
+    async def drain(self, timeout: float) -> bool:
+        """Дождаться начатых обработчиков и отложенных входящих событий"""
+        deadline = time.monotonic() + timeout
+        handlers_done = await self.inflight.wait_idle(timeout)
+        delayed_done = await self.inbound.wait_idle(max(0.0, deadline - time.monotonic()))
+        return handlers_done and delayed_done
+
+    def release_state(self):
+        """Handoff: журнал обработанных апдейтов переходит новому процессу - сохраняем его сейчас и больше не пишем"""
+        self.seen.save()
+        self.seen.path = None
+
+    async def close(self):
+        self.seen.save()
+        await self.bot.session.close()
+
+    async def _drop_duplicates(self, handler, update: types.Update, data: Dict[str, Any]):
+        if self.seen.check(update.update_id):
+            logger.info(f"Duplicate update {update.update_id} dropped")
+            return None
+        # Один и тот же callback может прийти в разных апдейтах (повтор клиента)
+        if update.callback_query is not None and self.seen.check("cb:" + update.callback_query.id):
+            logger.info(f"Duplicate callback {update.callback_query.id} dropped")
+            return None
+        async with self.inflight:
+            return await handler(update, data)
 
     # --- Implementation of BotAPI (Methods called by Interpreter) ---
     
+    def _remember_sent(self, user_id: int, message_id: Optional[int]):
+        if message_id is None:
+            return
+        self._last_sent[user_id] = message_id
+        self._last_sent.move_to_end(user_id)
+        if len(self._last_sent) > self.LAST_SENT_SIZE:
+            self._last_sent.popitem(last=False)
+
+    async def _release_editable(self, user_id: int):
+        # Новое сообщение ляжет ниже нажатого - перерисовывать его уже нельзя, только убрать кнопки
+        message_id = self._editable.pop(user_id, None)
+        if message_id is not None:
+            await self._strip_keyboard(user_id, message_id)
+
     async def send_message(self, user_id: int, text: str):
+        await self._release_editable(user_id)
+        await self.rate_limiter.acquire()
         try:
-            await self.bot.send_message(chat_id=user_id, text=text)
+            message = await self.bot.send_message(chat_id=user_id, text=text)
+            self._remember_sent(user_id, message.message_id)
         except Exception as e:
             logger.error(f"Error sending message to {user_id}: {e}")
 
@@ -66,17 +154,31 @@ class TelegramAPI(BotAPI):
         
         for ch in choices:
             # Важно: callback_data имеет лимит 64 байта.
-            # Мы используем ch['id'], так как это внутренний ID кнопки.
+            # ch['id'] - компактный токен интерпретатора (ID блока, версия блока, номер опции).
             btn = types.InlineKeyboardButton(text=ch["label"], callback_data=str(ch["id"]))
             kb.inline_keyboard.append([btn])
         
+        await self.rate_limiter.acquire()
+        message_id = self._editable.pop(user_id, None)
         try:
-            await self.bot.send_message(chat_id=user_id, text=prompt, reply_markup=kb)
+            if message_id is not None:
+                # Ответ и новый вопрос - одним вызовом: перерисовываем нажатое сообщение
+                await self.bot.edit_message_text(chat_id=user_id, message_id=message_id, text=prompt, reply_markup=kb)
+            else:
+                message = await self.bot.send_message(chat_id=user_id, text=prompt, reply_markup=kb)
+                self._remember_sent(user_id, message.message_id)
         except Exception as e:
             logger.error(f"Error sending choice to {user_id}: {e}")
 
         return None
 
+    async def _strip_keyboard(self, user_id: int, message_id: int):
+        await self.rate_limiter.acquire()
+        try:
+            await self.bot.edit_message_reply_markup(chat_id=user_id, message_id=message_id, reply_markup=None)
+        except Exception as e:
+            logger.error(f"Error removing keyboard for {user_id}: {e}")
+
     # --- Handlers (Events from Telegram) ---
 
     async def cmd_start(self, message: types.Message):
@@ -92,7 +194,7 @@ class TelegramAPI(BotAPI):
         
         # Запускаем диалог с нуля
         if self.interpreter:
-            await self.interpreter.start_dialog(user_id, meta)
+            await self.inbound.submit(user_id, lambda: self.interpreter.start_dialog(user_id, meta))
 
     async def handle_text(self, message: types.Message):
         """Обработка обычного текста"""
@@ -101,7 +203,7 @@ class TelegramAPI(BotAPI):
         
         # Передаем текст в интерпретатор как input_data
         if self.interpreter:
-            await self.interpreter.resume_dialog(user_id, text)
+            await self.inbound.submit(user_id, lambda: self.interpreter.resume_dialog(user_id, text))
 
     async def handle_callback(self, callback: types.CallbackQuery):
         """
@@ -109,14 +211,44 @@ class TelegramAPI(BotAPI):
         Сюда прилетает то, что мы положили в callback_data (id опции).
         """
         user_id = callback.from_user.id
-        data = callback.data # Это ID кнопки
+        data = callback.data # Токен кнопки
         
+        if not self.interpreter:
+            await callback.answer()
+            return
+
+        if self.interpreter.is_stale_choice(data):
+            # Кнопка от старой версии блока: отвечаем сразу, без хранилища и интерпретатора
+            await callback.answer(self.STALE_CHOICE_TEXT)
+            return
+
         # Обязательно отвечаем телеграму, чтобы убрать часики с кнопки
         await callback.answer()
-        
-        # Передаем ID кнопки в интерпретатор
-        if self.interpreter:
-            # Можно опционально удалить кнопки после нажатия, чтобы юзер не кликал дважды:
-            # await callback.message.edit_reply_markup(reply_markup=None)
-            
+
+        message_id = callback.message.message_id if callback.message else None
+        await self.inbound.submit(user_id, lambda: self._process_choice(user_id, data, message_id))
+
+    async def _process_choice(self, user_id: int, data: str, message_id: Optional[int]):
+        if message_id is None or self.choice_mode == "keep":
+            await self.interpreter.resume_dialog(user_id, data)
+            return
+
+        if self.choice_mode == "strip":
+            # Убираем кнопки, чтобы по ним нельзя было нажать повторно
+            await self._strip_keyboard(user_id, message_id)
+            await self.interpreter.resume_dialog(user_id, data)
+            return
+
+        if self._last_sent.get(user_id) != message_id:
+            # После вопроса в чат уже ушли другие сообщения: перерисованный вопрос оказался бы выше них
+            await self._strip_keyboard(user_id, message_id)
+            await self.interpreter.resume_dialog(user_id, data)
+            return
+
+        # edit: если дальше сразу снова choice, get_choice перерисует это сообщение
+        self._editable[user_id] = message_id
+        try:
             await self.interpreter.resume_dialog(user_id, data)
+        finally:
+            if self._editable.pop(user_id, None) is not None:
+                await self._strip_keyboard(user_id, message_id)
@@ -1,14 +1,70 @@
 # bot_interpreter.py
+import asyncio
+import base64
+import bisect
+import hashlib
+import json
 import logging
-import aiohttp
-from typing import Dict, Any, Optional
+import re
+import time
+import uuid
+import zlib
+from collections import OrderedDict, defaultdict, deque
+from typing import TYPE_CHECKING, Dict, Any, Iterable, List, Optional, Tuple
 
 # Импортируем наши интерфейсы
 from bot_api_interface import BotAPI
 from state_storage import StateStorage, MemoryStorage
+from timers import Timer, TimerScheduler
+
+# Необязательные подсистемы (HTTP, аналитика, общие переменные, скрипты) импортируются по требованию
+# в обработчиках своих блоков: превью загружает их файлы, только если они нужны сценарию
+if TYPE_CHECKING:
+    from analytics import AnalyticsSink
+    from http_client import HttpClient
+    from script_runner import ScriptInfo, ScriptRunner
+    from shared_vars import SharedStore
 
 logger = logging.getLogger(__name__)
 
+
+# -------------------------
+# callback_data кнопок choice
+# -------------------------
+
+CHOICE_TOKEN_PREFIX = "~"
+CHOICE_TOKEN_MAX = 64       # Лимит callback_data в Telegram (байт)
+# Минимум: 1 байт ID + 4 байта версии + 1 байт номера = 8 символов base64
+_CHOICE_TOKEN_RE = re.compile(r"~[A-Za-z0-9_-]{8,63}")
+
+
+def encode_choice_token(block_id: str, version: int, index: int) -> Optional[str]:
+    """
+    "~" + base64url(ID блока + версия блока (crc32) + номер опции).
+    UUID упаковывается в 16 байт, прочие ID - как есть; итог укладывается в 64 байта.
+    None, если ID блока слишком длинный.
+    """
+    try:
+        raw_id = uuid.UUID(block_id).bytes
+    except ValueError:
+        raw_id = block_id.encode("utf-8")
+    raw = raw_id + version.to_bytes(4, "big") + bytes([index])
+    token = CHOICE_TOKEN_PREFIX + base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+    return token if len(token) <= CHOICE_TOKEN_MAX and index < 256 else None
+
+
+ChoiceEntry = Tuple[int, Any, Optional[str]]     # (номер опции, значение, следующий блок)
+
+
+def split_point(block_id: str, user_id: int) -> float:
+    """
+    Стабильная точка пользователя в [0, 1) для блока split.
+    Не зависит от процесса и PYTHONHASHSEED: все воркеры отправляют пользователя в одну ветку.
+    """
+    digest = hashlib.blake2b(f"{block_id}:{user_id}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2 ** 64
+
+
 class BotInterpreter:
     """
     Асинхронный интерпретатор сценариев.
@@ -16,13 +72,77 @@ class BotInterpreter:
     Не блокирует поток ожиданиям ввода пользователя.
     """
 
-    def __init__(self, bot_model: Dict[str, Any], api: BotAPI, storage: Optional[StateStorage] = None):
+    # Защита от бесконечных автоматических циклов (condition/sendMessage без ожидания ввода)
+    MAX_AUTO_STEPS = 1000       # Максимум автоматических шагов за один вызов start/resume
+    MAX_AUTO_SECONDS = 5.0      # Максимум времени (сек) на автоматические шаги за один вызов
+    YIELD_EVERY = 50            # Каждые N шагов отдаем управление event loop
+    TRACE_SIZE = 20             # Сколько последних блоков логировать при аварийной остановке
+
+    # Служебный ввод, которым планировщик будит сессию (не может прийти от пользователя)
+    TIMER_EVENT_PREFIX = "\x00timer:"
+
+    # Ответ "Диалог не активен" - не чаще раза в интервал; в это время сессия не загружается
+    INACTIVE_REPLY_INTERVAL = 60.0
+    INACTIVE_CACHE_SIZE = 10_000
+
+    def __init__(self, bot_model: Dict[str, Any], api: BotAPI, storage: Optional[StateStorage] = None,
+                 max_auto_steps: Optional[int] = None, max_auto_seconds: Optional[float] = None,
+                 scheduler: Optional[TimerScheduler] = None, http_client: Optional["HttpClient"] = None,
+                 analytics: Optional["AnalyticsSink"] = None, shared: Optional["SharedStore"] = None,
+                 scripts: Optional["ScriptRunner"] = None):
         self.model = bot_model
         self.api = api
         # Если хранилище не передали, используем in-memory (для тестов)
         self.storage = storage if storage else MemoryStorage()
+
+        # Планировщик для блоков delay/timeout
+        self.scheduler = scheduler if scheduler else TimerScheduler()
+        self.scheduler.set_handler(self._on_timer, self._timer_is_live)
+
+        # Общий HTTP-клиент (пул соединений, таймауты, повторы, circuit breaker); создается при первом запросе
+        self._http = http_client
+
+        # Поток событий для аналитики воронки (None - аналитика выключена)
+        self.analytics = analytics
+
+        # (блок split, номер варианта) -> [входы, завершения]; приращения уходят в аналитику при сбросе
+        self.variant_stats: Dict[Tuple[str, int], List[int]] = defaultdict(lambda: [0, 0])
+        self._variant_flushed: Dict[Tuple[str, int], Tuple[int, int]] = {}
+        if analytics is not None:
+            analytics.add_collector(self._collect_variant_stats)
+
+        # Общие переменные бота (одни на всех пользователей) для блоков sharedVar
+        self._shared = shared
+
+        # Пул процессов для блоков script (создается при первом вызове, если не передан прогретый)
+        self._scripts_runner = scripts
+
+        self.max_auto_steps = max_auto_steps or self.MAX_AUTO_STEPS
+        self.max_auto_seconds = max_auto_seconds or self.MAX_AUTO_SECONDS
+
+        # Простые счетчики для мониторинга
+        self.metrics = {
+            "auto_loop_aborts": 0,
+            "inactive_suppressed": 0,
+        }
+        # user_id -> когда последний раз отвечали "Диалог не активен" (LRU)
+        self._inactive: "OrderedDict[int, float]" = OrderedDict()
         
         self.blocks = {b["Block_id"]: b for b in bot_model["Blocks"]}
+
+        # Пути извлечения переменных из ответов API компилируются один раз при загрузке модели
+        self._var_paths: Dict[str, List[List[tuple]]] = {}
+        # choice: ключ кнопки (токен callback_data или ID опции) -> (номер, значение, следующий блок)
+        self._choice_maps: Dict[str, Dict[str, ChoiceEntry]] = {}
+        self._choice_buttons: Dict[str, List[Dict[str, Any]]] = {}
+        # Все действующие токены кнопок -> ID блока: устаревшее нажатие отсекается без загрузки сессии
+        self._choice_tokens: Dict[str, str] = {}
+        # split: накопленные доли весов веток (последняя = 1.0)
+        self._split_bounds: Dict[str, List[float]] = {}
+        # script: разобранный код с именами входных и выходных переменных
+        self._scripts: Dict[str, "ScriptInfo"] = {}
+        for block in self.blocks.values():
+            self._compile_block(block)
         
         # Глобальные переменные (конфигурация)
         self.global_vars = {v["name"]: v.get("default", "") for v in self.model.get("GlobalVariables", [])}
@@ -34,20 +154,78 @@ class BotInterpreter:
             "choice": self._handle_choice_block,
             "final": self._handle_final_block,
             "condition": self._handle_condition_block,
-            "apiRequest": self._handle_api_request_block
+            "apiRequest": self._handle_api_request_block,
+            "parallelApi": self._handle_parallel_api_block,
+            "delay": self._handle_delay_block,
+            "timeout": self._handle_timeout_block,
+            "sharedVar": self._handle_shared_var_block,
+            "split": self._handle_split_block,
+            "script": self._handle_script_block
         }
 
+    # -------------------------
+    # Необязательные подсистемы
+    # -------------------------
+
+    @property
+    def http(self) -> "HttpClient":
+        if self._http is None:
+            from http_client import HttpClient
+            self._http = HttpClient()
+        return self._http
+
+    @http.setter
+    def http(self, client: "HttpClient"):
+        self._http = client
+
+    @property
+    def shared(self) -> "SharedStore":
+        if self._shared is None:
+            from shared_vars import LocalSharedStore
+            self._shared = LocalSharedStore(bot=self.model.get("BotName", ""))
+        return self._shared
+
+    @property
+    def scripts(self) -> "ScriptRunner":
+        if self._scripts_runner is None:
+            from script_runner import ScriptRunner
+            self._scripts_runner = ScriptRunner()
+        return self._scripts_runner
+
     # -------------------------
     # Публичные методы (Lifecycle)
     # -------------------------
 
-    async def start_dialog(self, user_id: int, init_meta: Dict[str, Any]):
+    def patch_blocks(self, updated: List[Dict[str, Any]], removed: Iterable[str] = (), bot_model: Optional[Dict[str, Any]] = None):
+        """
+        Точечное обновление модели без пересоздания интерпретатора.
+        updated - новые/измененные блоки, removed - ID удаленных блоков.
+        Если передан bot_model, обновляются и верхнеуровневые поля (Start, GlobalVariables).
+        """
+        for block in updated:
+            self._forget_block(block["Block_id"])
+            self.blocks[block["Block_id"]] = block
+            self._compile_block(block)
+        for block_id in removed:
+            self.blocks.pop(block_id, None)
+            self._forget_block(block_id)
+
+        if bot_model is not None:
+            self.model = bot_model
+            self.global_vars = {v["name"]: v.get("default", "") for v in bot_model.get("GlobalVariables", [])}
+
+    async def start_dialog(self, user_id: int, init_meta: Dict[str, Any],
+                           start_block: Optional[str] = None, variables: Optional[Dict[str, Any]] = None):
         """
         Запуск новой сессии.
+        start_block и variables позволяют начать не со Start, а с произвольного блока
+        с заданным снимком переменных (используется превью редактора).
         """
         # 1. Инициализация переменных
-        variables = self.global_vars.copy()
-        variables.update({
+        session_vars = self.global_vars.copy()
+        if variables:
+            session_vars.update(variables)
+        session_vars.update({
             "username": init_meta.get("username", ""),
             "first_name": init_meta.get("first_name", ""),
             "user_id": user_id
@@ -55,13 +233,14 @@ class BotInterpreter:
 
         # 2. Создание структуры сессии
         session = {
-            "current_block": self.model["Start"],
-            "variables": variables,
+            "current_block": start_block or self.model["Start"],
+            "variables": session_vars,
             "step": 0,      # Текущий шаг внутри блока (0 - вход, 1 - ожидание ввода)
             "active": True
         }
 
         # 3. Сохранение и запуск
+        self._inactive.pop(user_id, None)
         await self.storage.save_state(user_id, session)
         logger.info(f"Session started for user {user_id}")
         await self._process_blocks(user_id)
@@ -70,12 +249,30 @@ class BotInterpreter:
         """
         Обработка входящего события (текст или нажатие кнопки).
         """
+        if self.is_stale_choice(input_data):
+            # Кнопка от удаленного или измененного блока - сессию не загружаем
+            await self.api.send_message(user_id, "Эта опция уже недоступна или неверна.")
+            return
+
+        is_timer_event = isinstance(input_data, str) and input_data.startswith(self.TIMER_EVENT_PREFIX)
+
+        replied_at = self._inactive.get(user_id)
+        if not is_timer_event and replied_at is not None and time.monotonic() - replied_at < self.INACTIVE_REPLY_INTERVAL:
+            # Недавно уже ответили, что диалог не активен: ни хранилища, ни повторного сообщения
+            self.metrics["inactive_suppressed"] += 1
+            return
+
         session = await self.storage.load_state(user_id)
         
         # Если сессии нет или она завершена
         if not session or not session.get("active"):
             # Можно отправить сообщение в духе "Напишите /start"
-            await self.api.send_message(user_id, "Диалог не активен. Напишите /start")
+            if not is_timer_event:
+                self._inactive[user_id] = time.monotonic()
+                self._inactive.move_to_end(user_id)
+                if len(self._inactive) > self.INACTIVE_CACHE_SIZE:
+                    self._inactive.popitem(last=False)
+                await self.api.send_message(user_id, "Диалог не активен. Напишите /start")
             return
 
         block_id = session["current_block"]
@@ -85,11 +282,29 @@ class BotInterpreter:
             logger.error(f"Block {block_id} not found for user {user_id}")
             return
 
+        if is_timer_event:
+            result = self._handle_timer_event(session, input_data[len(self.TIMER_EVENT_PREFIX):])
+            if result is None:
+                return
+            if await self._process_block_result(user_id, session, result):
+                await self._process_blocks(user_id)
+            return
+
+        # Пользователь ответил - ожидающий timeout больше не нужен
+        timer = session.get("timer")
+        if timer and timer["kind"] == "timeout":
+            self.scheduler.cancel(timer["id"])
+            del session["timer"]
+
         handler = self.block_handlers.get(block["Type"])
         if handler:
             # Вызываем обработчик текущего блока, передавая input_data
             result = await handler(block, user_id, session, input_data)
             
+            if result != "wait" and block["Type"] in ("getMessage", "choice") and self.analytics is not None:
+                from analytics import BLOCK_ANSWERED
+                self._emit(BLOCK_ANSWERED, user_id, block_id, session["variables"].get(block["Params"]["var"]))
+
             # Обрабатываем результат (сохраняем state, переходим к следующему блоку и т.д.)
             should_continue = await self._process_block_result(user_id, session, result)
             
@@ -105,7 +320,14 @@ class BotInterpreter:
         """
         Крутит цикл блоков, которые выполняются автоматически (без участия пользователя).
         Останавливается, когда блок возвращает 'wait' (ждет ввода) или 'break' (конец).
+
+        Цикл ограничен бюджетом шагов и времени: сценарий, в котором condition/sendMessage
+        образуют цикл без ожидающего блока, не должен вешать event loop для остальных пользователей.
         """
+        steps = 0
+        started_at = time.monotonic()
+        trace = deque(maxlen=self.TRACE_SIZE)
+
         while True:
             # Всегда перезагружаем состояние, чтобы иметь актуальные данные
             session = await self.storage.load_state(user_id)
@@ -117,10 +339,25 @@ class BotInterpreter:
             if not block:
                 break
 
+            # Проверка бюджета автоматических шагов
+            steps += 1
+            trace.append(block_id)
+            elapsed = time.monotonic() - started_at
+            if steps > self.max_auto_steps or elapsed > self.max_auto_seconds:
+                await self._abort_auto_loop(user_id, session, steps, elapsed, trace)
+                break
+
+            # Периодически отдаем управление другим корутинам
+            if steps % self.YIELD_EVERY == 0:
+                await asyncio.sleep(0)
+
             handler = self.block_handlers.get(block["Type"])
             if not handler:
                 logger.error(f"No handler for block type {block.get('Type')}")
                 break
+
+            if session.get("step", 0) == 0:
+                self._emit_entered(user_id, session, block_id)
             
             # Вызов handler БЕЗ input_data (автоматический шаг)
             # step должен быть 0 (или специфичный для логики блока)
@@ -133,6 +370,19 @@ class BotInterpreter:
                 # Если wait или break — выходим из цикла, освобождаем worker
                 break
 
+    async def _abort_auto_loop(self, user_id: int, session: Dict[str, Any], steps: int, elapsed: float, trace):
+        """
+        Аварийная остановка сессии при превышении бюджета автоматических шагов.
+        """
+        self.metrics["auto_loop_aborts"] += 1
+        logger.error(
+            f"Auto loop aborted for user {user_id}: {steps} steps, {elapsed:.3f}s. "
+            f"Last blocks: {' -> '.join(trace)}"
+        )
+        session["active"] = False
+        await self.storage.save_state(user_id, session)
+        await self.api.send_message(user_id, "Сценарий зациклился и был остановлен. Напишите /start")
+
     async def _process_block_result(self, user_id: int, session: Dict[str, Any], result: str) -> bool:
         """
         Логика переходов и сохранения.
@@ -153,6 +403,7 @@ class BotInterpreter:
             else:
                 # Тупик — завершаем диалог
                 session["active"] = False
+                self._finish(user_id, session, session["current_block"])
                 await self.storage.save_state(user_id, session)
                 return False
 
@@ -229,25 +480,23 @@ class BotInterpreter:
 
         # --- ФАЗА 1: Обработка выбора ---
         if step == 1 and input_data is not None:
-            options = block["Params"]["options"]
-            # input_data — это ID кнопки (callback_data)
-            selected = next((o for o in options if str(o["id"]) == str(input_data)), None)
+            # input_data — токен кнопки (callback_data) или ID опции
+            selected = self._choice_maps.get(block["Block_id"], {}).get(str(input_data))
             
             if not selected:
                 # Если нажата старая кнопка или мусор
                 await self.api.send_message(user_id, "Эта опция уже недоступна или неверна.")
                 return "wait"
 
+            idx, value, target = selected
+
             # Сохраняем значение
             var_name = block["Params"]["var"]
-            session["variables"][var_name] = selected["value"]
+            session["variables"][var_name] = value
 
             # Определяем, куда идти (manual switch)
-            idx = options.index(selected)
-            out_conns = block["Connections"].get("Out", [])
-            
-            if idx < len(out_conns):
-                session["current_block"] = out_conns[idx]
+            if target is not None:
+                session["current_block"] = target
                 return "manual_switch"
             else:
                 # Ветка не подключена
@@ -257,8 +506,8 @@ class BotInterpreter:
         # --- ФАЗА 0: Отрисовка кнопок ---
         if step == 0:
             prompt = self._format_text(block["Params"]["prompt"], session["variables"])
-            # Формируем список для API
-            api_choices = [{"label": o["label"], "id": o["id"]} for o in block["Params"]["options"]]
+            # Кнопки с токенами callback_data собраны при компиляции блока
+            api_choices = self._choice_buttons.get(block["Block_id"], [])
             
             await self.api.get_choice(user_id, prompt, api_choices)
             
@@ -296,45 +545,19 @@ class BotInterpreter:
         Асинхронный HTTP запрос.
         """
         params = block["Params"]
-        url = params.get("url")
-        method = params.get("method", "GET").upper()
-        headers = params.get("headers", {})
-        body = params.get("body", {})
-        var_mapping = params.get("variables", {}) # {"resp_field": "bot_var"}
-
-        if not url:
+        if not params.get("url"):
             return "break"
 
-        status = 0
-        resp_data = {}
-
         try:
-            # Используем aiohttp для асинхронности
-            async with aiohttp.ClientSession() as client:
-                if method == "GET":
-                    async with client.get(url, headers=headers) as resp:
-                        status = resp.status
-                        if "application/json" in resp.headers.get("Content-Type", ""):
-                            resp_data = await resp.json()
-                        else:
-                            # Можно сохранить text если нужно
-                            pass
-                elif method == "POST":
-                    async with client.post(url, json=body, headers=headers) as resp:
-                        status = resp.status
-                        if "application/json" in resp.headers.get("Content-Type", ""):
-                            resp_data = await resp.json()
+            # При разомкнутой цепи хоста HttpClient сразу бросает CircuitOpenError -> ветка Fail
+            status, resp_data = await self.http.request(params, (self.model.get("BotName", ""), block["Block_id"]))
 
             # Успех (2xx) или Провал
             is_success = 200 <= status < 300
             
             # Сохраняем переменные (только при успехе, или всегда - зависит от логики)
             if is_success:
-                for json_field, var_name in var_mapping.items():
-                    # Поддержка вложенности типа "user.id" не реализована для простоты, 
-                    # но тут можно доставать значения из resp_data
-                    if json_field in resp_data:
-                        session["variables"][var_name] = resp_data[json_field]
+                self._apply_var_mapping(session, self._var_paths[block["Block_id"]][0], resp_data)
 
             # Выбираем выход: 0 - Success, 1 - Fail
             out_idx = 0 if is_success else 1
@@ -354,17 +577,365 @@ class BotInterpreter:
 
         return "break"
 
+    async def _handle_parallel_api_block(self, block, user_id, session, input_data):
+        """
+        Несколько HTTP запросов одновременно (asyncio.gather).
+        Задержка для пользователя - максимум из запросов, а не сумма.
+        Out[0] - все запросы успешны, Out[1] - хотя бы один провалился или истек deadline.
+        """
+        params = block["Params"]
+        requests = params.get("requests", [])
+        deadline = params.get("deadline")
+
+        async def call(req):
+            status, resp_data = await asyncio.wait_for(
+                self.http.request(req, (self.model.get("BotName", ""), block["Block_id"])), req.get("timeout")
+            )
+            return 200 <= status < 300, resp_data
+
+        all_success = False
+        try:
+            results = await asyncio.wait_for(
+                asyncio.gather(*(call(req) for req in requests), return_exceptions=True),
+                deadline
+            )
+
+            all_success = True
+            for req, var_paths, result in zip(requests, self._var_paths[block["Block_id"]], results):
+                if isinstance(result, BaseException) or not result[0]:
+                    all_success = False
+                    logger.warning(f"Parallel API call {req.get('url')} failed: {repr(result) if isinstance(result, BaseException) else 'bad status'}")
+                    continue
+                # Переменные раскладываем по каждому успешному запросу отдельно
+                self._apply_var_mapping(session, var_paths, result[1])
+
+        except asyncio.TimeoutError:
+            logger.error(f"Parallel API block {block['Block_id']}: deadline {deadline}s exceeded")
+        except Exception as e:
+            logger.error(f"Parallel API block failed: {e}")
+
+        out_idx = 0 if all_success else 1
+        out_conns = block["Connections"].get("Out", [])
+        if out_idx < len(out_conns):
+            session["current_block"] = out_conns[out_idx]
+            return "manual_switch"
+        return "break"
+
+    async def _handle_shared_var_block(self, block, user_id, session, input_data):
+        """
+        Атомарная операция над общей переменной бота: get, set, incr (с границами min/max), cas.
+        value/expected - выражения над переменными сессии (как в condition) или числа.
+        Значение после операции записывается в Params.var.
+        Out[0] - операция выполнена, Out[1] - incr вышел за границу, cas не совпал или ошибка.
+        """
+        from shared_vars import GET, SET, INCR, CAS
+
+        params = block["Params"]
+        variables = session["variables"]
+        op = params.get("op", INCR)
+        try:
+            if op == INCR:
+                operation = (INCR, self._eval_param(params.get("value", 1), variables), params.get("min"), params.get("max"))
+            elif op == SET:
+                operation = (SET, self._eval_param(params.get("value"), variables))
+            elif op == CAS:
+                operation = (CAS, self._eval_param(params.get("expected"), variables),
+                             self._eval_param(params.get("value"), variables))
+            else:
+                operation = (GET,)
+            ok, value = await self.shared.execute(params["name"], operation)
+            if params.get("var"):
+                variables[params["var"]] = value
+        except Exception as e:
+            logger.error(f"Shared variable {params.get('name')} ({op}) failed for user {user_id}: {e}")
+            ok = False
+
+        out_idx = 0 if ok else 1
+        out_conns = block["Connections"].get("Out", [])
+        if out_idx < len(out_conns):
+            session["current_block"] = out_conns[out_idx]
+            return "manual_switch"
+        return "break"
+
+    async def _handle_split_block(self, block, user_id, session, input_data):
+        """
+        A/B-тест: ветка Out[i] выбирается по стабильному хэшу user_id + ID блока с весами Params.weights.
+        Ни хранилища, ни координации воркеров не нужно - повторный вход дает ту же ветку.
+        Номер варианта запоминается в сессии (для счетчика завершений) и, если задан Params.var, в переменной.
+        """
+        block_id = block["Block_id"]
+        bounds = self._split_bounds.get(block_id)
+        if not bounds:
+            return "break"
+        idx = bisect.bisect_right(bounds, split_point(block_id, user_id))
+
+        session.setdefault("variants", {})[block_id] = idx
+        if block["Params"].get("var"):
+            session["variables"][block["Params"]["var"]] = idx
+        self.variant_stats[(block_id, idx)][0] += 1
+
+        out_conns = block["Connections"].get("Out", [])
+        if idx < len(out_conns):
+            session["current_block"] = out_conns[idx]
+            return "manual_switch"
+        logger.warning(f"Split block {block_id}: branch {idx} not connected")
+        return "break"
+
+    async def _handle_script_block(self, block, user_id, session, input_data):
+        """
+        Пользовательский Python в пуле процессов (event loop не блокируется).
+        Скрипт читает переменные сессии и присваивает новые; Params.outputs ограничивает,
+        какие из них вернуть. Params.pure - результат кэшируется по входным переменным.
+        Out[0] - успех, Out[1] - ошибка, превышение лимитов или перегрузка пула.
+        """
+        from script_runner import ScriptError
+
+        params = block["Params"]
+        script = self._scripts.get(block["Block_id"])
+        ok = False
+        if script is not None:
+            try:
+                outputs = params.get("outputs")
+                result = await self.scripts.run(script, session["variables"],
+                                                outputs=tuple(outputs) if outputs is not None else None,
+                                                pure=params.get("pure", False), cpu_limit=params.get("timeout"))
+                session["variables"].update(result)
+                ok = True
+            except ScriptError as e:
+                logger.warning(f"Script block {block['Block_id']} failed for user {user_id}: {e}")
+
+        out_idx = 0 if ok else 1
+        out_conns = block["Connections"].get("Out", [])
+        if out_idx < len(out_conns):
+            session["current_block"] = out_conns[out_idx]
+            return "manual_switch"
+        return "break"
+
+    def _compile_script(self, block: Dict[str, Any]):
+        if block["Type"] != "script":
+            return
+        from script_runner import ScriptError, analyze_script
+
+        try:
+            self._scripts[block["Block_id"]] = analyze_script(block["Params"].get("code", ""))
+        except ScriptError as e:
+            logger.error(f"Block {block['Block_id']}: {e}")
+
+    def _compile_split_bounds(self, block: Dict[str, Any]):
+        if block["Type"] != "split":
+            return
+        n_out = len(block["Connections"].get("Out", []))
+        weights = block["Params"].get("weights") or [1] * n_out
+        total = float(sum(weights))
+        if total <= 0:
+            return
+        bounds, acc = [], 0.0
+        for w in weights:
+            acc += w
+            bounds.append(acc / total)
+        # bisect_right по точке из [0, 1) никогда не выйдет за последнюю ветку
+        bounds[-1] = 1.0
+        self._split_bounds[block["Block_id"]] = bounds
+
+    def _collect_variant_stats(self):
+        """
+        Коллектор AnalyticsSink: приращения входов/завершений по вариантам с прошлой успешной записи.
+        Выгруженными они считаются только в commit - после ошибки записи вернутся в следующий сброс.
+        """
+        from analytics import VARIANT_STATS
+
+        records, snapshot = [], {}
+        for key, (entries, completions) in list(self.variant_stats.items()):
+            prev_entries, prev_completions = self._variant_flushed.get(key, (0, 0))
+            if entries == prev_entries and completions == prev_completions:
+                continue
+            block_id, idx = key
+            records.append(self.analytics.record(VARIANT_STATS, None, block_id, idx,
+                                                 entries=entries - prev_entries,
+                                                 completions=completions - prev_completions))
+            snapshot[key] = (entries, completions)
+
+        def commit():
+            self._variant_flushed.update(snapshot)
+
+        return records, commit
+
+    def _compile_block(self, block: Dict[str, Any]):
+        self._compile_var_paths(block)
+        self._compile_choice_map(block)
+        self._compile_split_bounds(block)
+        self._compile_script(block)
+
+    def _forget_block(self, block_id: str):
+        self._var_paths.pop(block_id, None)
+        self._split_bounds.pop(block_id, None)
+        self._scripts.pop(block_id, None)
+        self._choice_maps.pop(block_id, None)
+        for button in self._choice_buttons.pop(block_id, []):
+            self._choice_tokens.pop(button["id"], None)
+
+    def _compile_choice_map(self, block: Dict[str, Any]):
+        """
+        Для choice: токены кнопок и словарь ключ -> (номер опции, значение, следующий блок).
+        Версия блока (crc32 опций и выходов) входит в токен: после правки блока старые кнопки
+        перестают совпадать с картой.
+        """
+        if block["Type"] != "choice":
+            return
+
+        block_id = block["Block_id"]
+        options = block["Params"].get("options", [])
+        out_conns = block["Connections"].get("Out", [])
+        version = zlib.crc32(json.dumps([options, out_conns], sort_keys=True, default=str).encode("utf-8"))
+
+        choice_map: Dict[str, ChoiceEntry] = {}
+        buttons = []
+        for idx, option in enumerate(options):
+            entry = (idx, option.get("value"), out_conns[idx] if idx < len(out_conns) else None)
+            # Ввод ID опции текстом (превью, старые кнопки) тоже поддерживается
+            choice_map.setdefault(str(option["id"]), entry)
+            token = encode_choice_token(block_id, version, idx)
+            if token is None:
+                buttons.append({"label": option["label"], "id": option["id"]})
+                continue
+            choice_map[token] = entry
+            self._choice_tokens[token] = block_id
+            buttons.append({"label": option["label"], "id": token})
+
+        self._choice_maps[block_id] = choice_map
+        self._choice_buttons[block_id] = buttons
+
+    def is_stale_choice(self, input_data) -> bool:
+        """Токен кнопки, которого нет среди действующих (блок удален или изменен)"""
+        return (isinstance(input_data, str) and input_data.startswith(CHOICE_TOKEN_PREFIX)
+                and input_data not in self._choice_tokens and _CHOICE_TOKEN_RE.fullmatch(input_data) is not None)
+
+    def _compile_var_paths(self, block: Dict[str, Any]):
+        """
+        Params.variables {"путь.в[0].ответе": "переменная"} -> [(скомпилированный путь, переменная)].
+        Params.resultVariable (редактор) - весь ответ, пустой путь.
+        Для apiRequest - один список, для parallelApi - по списку на каждый запрос.
+        """
+        if block["Type"] == "apiRequest":
+            requests = [block["Params"]]
+        elif block["Type"] == "parallelApi":
+            requests = block["Params"].get("requests", [])
+        else:
+            return
+        from http_client import compile_path
+
+        compiled = []
+        for req in requests:
+            paths = []
+            for path, var_name in req.get("variables", {}).items():
+                try:
+                    paths.append((compile_path(path), var_name))
+                except ValueError as e:
+                    logger.error(f"Block {block['Block_id']}: {e}")
+            if req.get("resultVariable"):
+                paths.append(((), req["resultVariable"]))
+            compiled.append(paths)
+        self._var_paths[block["Block_id"]] = compiled
+
+    def _apply_var_mapping(self, session: Dict[str, Any], var_paths: List[tuple], resp_data):
+        from http_client import extract_path, _MISSING
+
+        for keys, var_name in var_paths:
+            value = extract_path(resp_data, keys)
+            if value is not _MISSING:
+                session["variables"][var_name] = value
+
+    async def _handle_delay_block(self, block, user_id, session, input_data):
+        """
+        Step 0: Запланировать таймер, step=1, 'wait'.
+        Step 1: Сообщения пользователя во время паузы игнорируются; дальше ведет срабатывание таймера.
+        """
+        if session.get("step", 0) == 0:
+            seconds = float(block["Params"].get("seconds", 0))
+            timer_id = self.scheduler.schedule(user_id, seconds)
+            session["timer"] = {"id": timer_id, "kind": "delay"}
+            session["step"] = 1
+        return "wait"
+
+    async def _handle_timeout_block(self, block, user_id, session, input_data):
+        """
+        Ставит таймаут на ожидание ответа в следующем блоке.
+        Out[0] - блок, ответ на который ждем; Out[1] - куда перейти, если ответа не было.
+        """
+        out_conns = block["Connections"].get("Out", [])
+        if len(out_conns) > 1:
+            seconds = float(block["Params"].get("seconds", 0))
+            timer_id = self.scheduler.schedule(user_id, seconds)
+            session["timer"] = {"id": timer_id, "kind": "timeout", "target": out_conns[1]}
+        return "continue"
+
+    def _handle_timer_event(self, session: Dict[str, Any], timer_id: str) -> Optional[str]:
+        """
+        Срабатывание таймера. Возвращает результат для _process_block_result
+        или None, если таймер устарел (сессию перезапустили или пользователь уже ответил).
+        """
+        timer = session.get("timer")
+        if not timer or timer["id"] != timer_id:
+            return None
+        del session["timer"]
+
+        if timer["kind"] == "timeout":
+            session["current_block"] = timer["target"]
+            return "manual_switch"
+        return "continue"
+
+    async def _on_timer(self, timer: Timer):
+        await self.resume_dialog(timer.user_id, self.TIMER_EVENT_PREFIX + timer.timer_id)
+
+    async def _timer_is_live(self, timer: Timer) -> bool:
+        session = await self.storage.load_state(timer.user_id)
+        return bool(session and session.get("active") and (session.get("timer") or {}).get("id") == timer.timer_id)
+
     async def _handle_final_block(self, block, user_id, session, input_data):
         msg = "Диалог завершён. Результаты:\n"
         for k, v in session["variables"].items():
             if k not in ("username", "first_name", "user_id"):
                 msg += f"{k}: {v}\n"
         await self.api.send_message(user_id, msg)
+        self._finish(user_id, session, block["Block_id"])
         return "break"
 
     # -------------------------
     # Утилиты
     # -------------------------
+    def _emit(self, event: str, user_id: int, block_id: str, value: Any = None):
+        # Аналитика не должна ломать диалог: emit только кладет событие в буфер
+        if self.analytics is not None:
+            self.analytics.emit(event, user_id, block_id, value)
+
+    def _finish(self, user_id: int, session: Dict[str, Any], block_id: str):
+        # Завершение диалога засчитывается каждому варианту split, через который прошел пользователь
+        for split_id, idx in session.get("variants", {}).items():
+            self.variant_stats[(split_id, idx)][1] += 1
+        if self.analytics is not None:
+            from analytics import DIALOG_FINISHED
+            self._emit(DIALOG_FINISHED, user_id, block_id)
+
+    def _emit_entered(self, user_id: int, session: Dict[str, Any], block_id: str):
+        # Предыдущий блок и время на нем нужны для переходов по веткам и времени пребывания
+        if self.analytics is None:
+            return
+        from analytics import BLOCK_ENTERED
+
+        now = time.time()
+        prev = session.get("entered")
+        if prev:
+            self.analytics.emit(BLOCK_ENTERED, user_id, block_id, from_block=prev[0], dwell=round(now - prev[1], 3))
+        else:
+            self.analytics.emit(BLOCK_ENTERED, user_id, block_id)
+        session["entered"] = [block_id, now]
+
+    def _eval_param(self, expr: Any, variables: Dict[str, Any]) -> Any:
+        # Строка - выражение над переменными сессии, остальное (числа, bool) - как есть
+        if isinstance(expr, str):
+            return eval(expr, {"__builtins__": {}}, variables)
+        return expr
+
     def _format_text(self, text: str, variables: Dict[str, Any]) -> str:
         # Простая подстановка ${var}
         for k, v in variables.items():
@@ -0,0 +1,277 @@
+# broadcast.py
+"""
+Массовый запуск сценария (рассылки, напоминания).
+
+Получатели читаются потоком (файл, курсор БД, генератор) и не загружаются в память целиком.
+Запуск диалогов идет через ограниченный пул воркеров и (опционально) общий лимитер,
+прогресс периодически сохраняется в checkpoint-файл, чтобы упавшую рассылку можно было продолжить.
+
+Гарантия доставки - at-least-once: после перезапуска может повториться не более
+`concurrency` получателей, которые были в работе в момент падения (завершенные не по порядку
+сохраняются в checkpoint вместе со смещением).
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, asdict
+from typing import Any, AsyncIterator, Dict, Iterable, Optional, Union
+
+from rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------
+# Источники получателей
+# -------------------------
+
+async def recipients_from_file(path: str) -> AsyncIterator[int]:
+    """Читает user_id построчно (пустые строки и строки с # пропускаются)"""
+    with open(path, "r", encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield int(line)
+            # Чтение файла синхронное - периодически отдаем управление event loop
+            if i % 1000 == 0:
+                await asyncio.sleep(0)
+
+
+async def recipients_from_cursor(cursor, batch_size: int = 1000) -> AsyncIterator[int]:
+    """
+    Читает user_id из DB-API курсора пачками (fetchmany), например серверного курсора psycopg2.
+    Первый столбец строки - user_id.
+    """
+    while True:
+        rows = await asyncio.to_thread(cursor.fetchmany, batch_size)
+        if not rows:
+            break
+        for row in rows:
+            yield int(row["user_id"] if isinstance(row, dict) else row[0])
+
+
+async def synthetic_recipients(count: int, start: int = 1) -> AsyncIterator[int]:
+    """Синтетические user_id для нагрузочных прогонов"""
+    for user_id in range(start, start + count):
+        yield user_id
+        if user_id % 1000 == 0:
+            await asyncio.sleep(0)
+
+
+async def _aiter(source: Union[Iterable[int], AsyncIterator[int]]) -> AsyncIterator[int]:
+    if hasattr(source, "__aiter__"):
+        async for item in source:
+            yield item
+    else:
+        for item in source:
+            yield item
+
+
+# -------------------------
+# Рассылка
+# -------------------------
+
+@dataclass
+class BroadcastProgress:
+    offset: int = 0         # Сколько первых получателей гарантированно обработано
+    sent: int = 0
+    failed: int = 0
+    started_at: float = 0.0
+    resumed_from: int = 0   # sent + failed из checkpoint: скорость считается только по этому запуску
+
+    def throughput(self) -> float:
+        elapsed = time.monotonic() - self.started_at
+        return (self.sent + self.failed - self.resumed_from) / elapsed if elapsed > 0 else 0.0
+
+    def eta(self, total: Optional[int]) -> Optional[float]:
+        rate = self.throughput()
+        if not total or rate <= 0:
+            return None
+        return max(0.0, (total - self.offset) / rate)
+
+
+class Broadcast:
+    """
+    Запуск start_dialog для большого количества пользователей.
+
+    interpreter  - BotInterpreter, чей сценарий запускается
+    recipients   - поток user_id (sync/async итерируемый)
+    concurrency  - сколько диалогов стартует одновременно
+    rate_limiter - отдельный лимит запусков диалогов; None - без ограничения. Лимитер самого API
+                   (TelegramAPI.rate_limiter) уже берет токен на каждое сообщение, повторно он не берется
+    checkpoint_path - файл с прогрессом; если он есть, рассылка продолжается с сохраненного места
+    total        - ожидаемое количество получателей (только для ETA)
+    """
+
+    CHECKPOINT_EVERY = 1000     # Как часто (в получателях) сохранять прогресс
+    REPORT_EVERY = 10.0         # Как часто (сек) логировать скорость и ETA
+    MAX_AHEAD = 10_000          # На сколько получателей выдача может опережать непрерывный префикс
+
+    def __init__(self, interpreter, recipients, concurrency: int = 50,
+                 rate_limiter: Optional[TokenBucket] = None, checkpoint_path: Optional[str] = None,
+                 total: Optional[int] = None, init_meta: Optional[Dict[str, Any]] = None):
+        self.interpreter = interpreter
+        self.recipients = recipients
+        self.concurrency = concurrency
+        if rate_limiter is not None and rate_limiter is getattr(interpreter.api, "rate_limiter", None):
+            rate_limiter = None
+        self.rate_limiter = rate_limiter
+        self.checkpoint_path = checkpoint_path
+        self.total = total
+        self.init_meta = init_meta or {}
+
+        # Индексы, завершенные не по порядку: не больше окна, на которое выдача опережает offset
+        self._done_ahead = set()
+        self._window = max(self.MAX_AHEAD, concurrency * 4)
+        self._advanced = asyncio.Event()
+        self.progress = self._load_checkpoint()
+        self._last_checkpoint = self.progress.offset
+        self._last_report = 0.0
+
+    async def run(self) -> BroadcastProgress:
+        self.progress.started_at = time.monotonic()
+        self.progress.resumed_from = self.progress.sent + self.progress.failed
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.concurrency)]
+        try:
+            await self._produce(queue)
+            await queue.join()
+        finally:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            self._save_checkpoint()
+
+        self._report(final=True)
+        return self.progress
+
+    async def _produce(self, queue: asyncio.Queue):
+        skip = self.progress.offset
+        if skip:
+            logger.info(f"Broadcast resumed from checkpoint: skipping {skip} recipients")
+
+        index = 0
+        async for user_id in _aiter(self.recipients):
+            if index >= skip and index not in self._done_ahead:
+                # Зависший получатель держит offset: дальше окна не уходим, иначе _done_ahead растет без границ
+                while index - self.progress.offset >= self._window:
+                    self._advanced.clear()
+                    await self._advanced.wait()
+                await queue.put((index, user_id))
+            index += 1
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            index, user_id = await queue.get()
+            try:
+                if self.rate_limiter:
+                    await self.rate_limiter.acquire()
+                await self.interpreter.start_dialog(user_id, dict(self.init_meta, user_id=user_id))
+                self.progress.sent += 1
+            except Exception as e:
+                self.progress.failed += 1
+                logger.error(f"Broadcast to {user_id} failed: {e}")
+            # При отмене/падении процесса получатель не отмечается - он повторится после рестарта
+            self._mark_done(index)
+            queue.task_done()
+
+    def _mark_done(self, index: int):
+        # offset сдвигается только по непрерывному префиксу завершенных получателей
+        if index == self.progress.offset:
+            self.progress.offset += 1
+            while self.progress.offset in self._done_ahead:
+                self._done_ahead.remove(self.progress.offset)
+                self.progress.offset += 1
+            self._advanced.set()
+        else:
+            self._done_ahead.add(index)
+
+        if self.progress.offset - self._last_checkpoint >= self.CHECKPOINT_EVERY:
+            self._save_checkpoint()
+
+        now = time.monotonic()
+        if now - self._last_report >= self.REPORT_EVERY:
+            self._last_report = now
+            self._report()
+
+    def _report(self, final: bool = False):
+        eta = self.progress.eta(self.total)
+        eta_str = f", ETA {eta:.0f} s" if eta is not None and not final else ""
+        logger.info(
+            f"Broadcast {'finished' if final else 'progress'}: "
+            f"{self.progress.sent} sent, {self.progress.failed} failed, "
+            f"{self.progress.throughput():.1f} users/s{eta_str}"
+        )
+
+    # -------------------------
+    # Checkpoint
+    # -------------------------
+
+    def _load_checkpoint(self) -> BroadcastProgress:
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return BroadcastProgress()
+        with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self._done_ahead = set(data.get("done_ahead", []))
+        return BroadcastProgress(offset=data["offset"], sent=data.get("sent", 0), failed=data.get("failed", 0))
+
+    def _save_checkpoint(self):
+        self._last_checkpoint = self.progress.offset
+        if not self.checkpoint_path:
+            return
+        data = asdict(self.progress)
+        data.pop("started_at")
+        data.pop("resumed_from")
+        data["done_ahead"] = sorted(self._done_ahead)
+        # Атомарная запись: сначала во временный файл, потом rename
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+
+# Нагрузочный прогон на синтетических получателях с поддельным API
+if __name__ == "__main__":
+    import sys
+    from collections import OrderedDict
+    from bot_api_interface import BotAPI
+    from bot_interpreter import BotInterpreter
+    from state_storage import StateStorage
+    from validator import parse_bot_config_from_file
+
+    class NullAPI(BotAPI):
+        async def send_message(self, user_id, text):
+            pass
+
+        async def get_message(self, user_id, prompt=None):
+            return None
+
+        async def get_choice(self, user_id, prompt, choices):
+            return None
+
+    class BoundedStorage(StateStorage):
+        """Хранит только последние сессии - чтобы замер не упирался в память на миллионах пользователей"""
+        def __init__(self, size=10_000):
+            self._data = OrderedDict()
+            self._size = size
+
+        async def save_state(self, user_id, state):
+            self._data[user_id] = state
+            self._data.move_to_end(user_id)
+            if len(self._data) > self._size:
+                self._data.popitem(last=False)
+
+        async def load_state(self, user_id):
+            return self._data.get(user_id)
+
+    logging.basicConfig(level=logging.INFO)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    model = parse_bot_config_from_file("bot_model.json")
+    interpreter = BotInterpreter(model, NullAPI(), BoundedStorage())
+    broadcast = Broadcast(interpreter, synthetic_recipients(count), concurrency=200, total=count)
+    result = asyncio.run(broadcast.run())
+    print(f"Обработано {result.offset} получателей, {result.throughput():.0f} users/s")
@@ -0,0 +1,143 @@
+# conformance.py
+"""
+Проверка одинакового поведения ядра интерпретатора в Telegram-раннере и в превью редактора.
+
+Один и тот же сценарий прогоняется через общий BotInterpreter с двумя адаптерами:
+  - production: адаптер с семантикой TelegramAPI (отправил и вышел), без сети;
+  - preview: PreviewAPI из botEditor/public/python с поддельным JS-мостом.
+Транскрипты сравниваются, затем оба варианта прогоняются N раз для замера скорости.
+
+Запуск:
+    python conformance.py [bot_model.json] [--inputs ...] [--runs N]
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from bot_api_interface import BotAPI
+from bot_interpreter import BotInterpreter
+from state_storage import MemoryStorage
+from validator import parse_bot_config_from_file
+
+PREVIEW_DIR = Path(__file__).resolve().parent.parent / "botEditor" / "public" / "python"
+
+# Ответы пользователя для bot_model.json по умолчанию
+DEFAULT_INPUTS = ["Иван", "15.05.1985", "1", "2", "20.10.2023", "+79990000000", "opt2"]
+
+
+class RecordingAPI(BotAPI):
+    """Адаптер с семантикой TelegramAPI: ничего не ждет, только записывает исходящие события"""
+    def __init__(self):
+        self.events: List[tuple] = []
+
+    async def send_message(self, user_id: int, text: str):
+        self.events.append(("message", text))
+
+    async def get_message(self, user_id: int, prompt: Optional[str] = None) -> Optional[str]:
+        if prompt:
+            await self.send_message(user_id, prompt)
+        return None
+
+    async def get_choice(self, user_id: int, prompt: str, choices: List[Dict[str, Any]]) -> Optional[str]:
+        self.events.append(("choice", prompt, [str(c["id"]) for c in choices]))
+        return None
+
+
+class FakeJsBridge:
+    """Подмена PreviewJSBridge: записывает вызовы в том же формате, что и RecordingAPI"""
+    def __init__(self):
+        self.events: List[tuple] = []
+
+    async def add_message(self, text, is_bot=True):
+        self.events.append(("message", text))
+
+    async def activate_input_mode(self):
+        pass
+
+    async def show_choices(self, text, choices):
+        self.events.append(("choice", text, [str(c["id"]) for c in choices]))
+
+
+def make_production_adapter():
+    api = RecordingAPI()
+    return api, api.events
+
+
+def make_preview_adapter():
+    if str(PREVIEW_DIR) not in sys.path:
+        sys.path.append(str(PREVIEW_DIR))
+    from api_preview import PreviewAPI
+
+    bridge = FakeJsBridge()
+    return PreviewAPI(bridge), bridge.events
+
+
+ADAPTERS = {
+    "production": make_production_adapter,
+    "preview": make_preview_adapter,
+}
+
+
+async def run_dialog(model: Dict[str, Any], make_adapter, inputs: List[str], user_id: int = 1) -> List[tuple]:
+    api, events = make_adapter()
+    interpreter = BotInterpreter(model, api, MemoryStorage())
+    await interpreter.start_dialog(user_id, {"username": "user", "first_name": "Test"})
+    for text in inputs:
+        await interpreter.resume_dialog(user_id, text)
+    return events
+
+
+async def check_parity(model: Dict[str, Any], inputs: List[str]) -> bool:
+    transcripts = {name: await run_dialog(model, factory, inputs) for name, factory in ADAPTERS.items()}
+    reference_name, reference = next(iter(transcripts.items()))
+
+    ok = True
+    for name, events in transcripts.items():
+        if events != reference:
+            ok = False
+            print(f"❌ Расхождение: {name} vs {reference_name}")
+            for i, (a, b) in enumerate(zip(reference, events)):
+                if a != b:
+                    print(f"   событие {i}: {a!r} != {b!r}")
+                    break
+            if len(reference) != len(events):
+                print(f"   длина: {len(reference)} != {len(events)}")
+    if ok:
+        print(f"✅ Транскрипты совпадают ({len(reference)} событий, адаптеры: {', '.join(transcripts)})")
+    return ok
+
+
+async def benchmark(model: Dict[str, Any], inputs: List[str], runs: int):
+    for name, factory in ADAPTERS.items():
+        api, _ = factory()
+        interpreter = BotInterpreter(model, api, MemoryStorage())
+        started = time.perf_counter()
+        for user_id in range(runs):
+            await interpreter.start_dialog(user_id, {})
+            for text in inputs:
+                await interpreter.resume_dialog(user_id, text)
+        elapsed = time.perf_counter() - started
+        print(f"{name:>10}: {runs} диалогов за {elapsed:.3f} с ({elapsed / runs * 1000:.3f} мс/диалог)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка паритета production/preview адаптеров")
+    parser.add_argument("model", nargs="?", default="bot_model.json")
+    parser.add_argument("--inputs", nargs="*", default=None, help="Ответы пользователя по порядку")
+    parser.add_argument("--runs", type=int, default=1000, help="Количество диалогов в замере")
+    args = parser.parse_args()
+
+    model = parse_bot_config_from_file(args.model)
+    inputs = args.inputs if args.inputs is not None else DEFAULT_INPUTS
+
+    ok = asyncio.run(check_parity(model, inputs))
+    asyncio.run(benchmark(model, inputs, args.runs))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# dedup.py
+"""
+Отсев повторно доставленных апдейтов.
+
+После перезапуска polling или повторов webhook Telegram может прислать тот же апдейт еще раз,
+и диалог продвинулся бы дважды. SeenSet помнит ключи (update_id, id callback-запроса)
+в кольцевом буфере фиксированного размера и в пределах временного окна:
+память не растет с трафиком, проверка - O(1).
+"""
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SeenSet:
+    def __init__(self, capacity: int = 100_000, window: float = 3600.0, path: Optional[str] = None):
+        self.capacity = capacity
+        self.window = window
+        self.path = path                            # Файл для сохранения между перезапусками
+        self._order = deque()                       # (ключ, время) в порядке появления
+        self._seen: Dict[Hashable, float] = {}
+        self.counters = {
+            "checked": 0,
+            "duplicates": 0,
+        }
+
+    def __len__(self):
+        return len(self._seen)
+
+    def check(self, key: Hashable, now: Optional[float] = None) -> bool:
+        """True, если ключ уже встречался в окне (дубликат); иначе запоминает его"""
+        now = now if now is not None else time.time()
+        self.counters["checked"] += 1
+        self._expire(now)
+
+        if key in self._seen:
+            self.counters["duplicates"] += 1
+            return True
+
+        if len(self._order) >= self.capacity:
+            old_key, _ = self._order.popleft()
+            self._seen.pop(old_key, None)
+        self._order.append((key, now))
+        self._seen[key] = now
+        return False
+
+    def _expire(self, now: float):
+        while self._order and now - self._order[0][1] > self.window:
+            old_key, _ = self._order.popleft()
+            self._seen.pop(old_key, None)
+
+    # -------------------------
+    # Сохранение между перезапусками
+    # -------------------------
+
+    def save(self, path: Optional[str] = None):
+        path = path or self.path
+        if not path:
+            return
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump([[key, ts] for key, ts in self._order], f)
+        os.replace(tmp_path, path)
+
+    def load(self, path: Optional[str] = None):
+        path = path or self.path
+        if not path or not os.path.exists(path):
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                records = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load seen updates from {path}: {e}")
+            return
+
+        now = time.time()
+        for key, ts in records[-self.capacity:]:
+            if now - ts <= self.window and key not in self._seen:
+                self._order.append((key, ts))
+                self._seen[key] = ts
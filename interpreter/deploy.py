@@ -0,0 +1,179 @@
+# deploy.py
+"""
+Запуск ботов прямо из базы редактора.
+
+Раннер подписывается на NOTIFY bot_model_changed (или опрашивает updated_at) и по каждому
+уведомлению перечитывает только измененного бота: модель берется из ModelCache, компилируется
+и активируется без перезапуска процесса. Одновременных запросов к БД не больше, чем
+max_concurrent_fetches кэша, а серия уведомлений по одному боту схлопывается в одну перезагрузку.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from lifecycle import drain_runtime, release_state
+from model_cache import CompiledModel, ModelCache
+
+logger = logging.getLogger(__name__)
+
+
+class BotDeployment:
+    """Активный бот: адаптер платформы, интерпретатор и задача приема апдейтов"""
+    def __init__(self, bot_id: str, entry: CompiledModel, api, interpreter):
+        self.bot_id = bot_id
+        self.entry = entry
+        self.api = api
+        self.interpreter = interpreter
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def token(self) -> str:
+        return self.entry.token
+
+    def start(self):
+        self.interpreter.scheduler.start()
+        self.interpreter.shared.start()
+        if self.interpreter.analytics is not None:
+            self.interpreter.analytics.start()
+        self.task = asyncio.get_running_loop().create_task(self.api.run())
+
+    async def stop(self, drain_timeout: float = 30.0):
+        """Плавная остановка: начатые шаги диалогов доделываются не дольше drain_timeout"""
+        await drain_runtime(self.api, self.interpreter, drain_timeout)
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def activate(self, entry: CompiledModel):
+        """Подмена модели на лету: активные сессии продолжают работу на новых блоках"""
+        old_ids = set(self.interpreter.blocks)
+        new_blocks = entry.model["Blocks"]
+        removed = old_ids - {b["Block_id"] for b in new_blocks}
+        self.interpreter.patch_blocks(new_blocks, removed, bot_model=entry.model)
+        self.entry = entry
+
+
+class BotDeployer:
+    def __init__(self, cache: ModelCache, make_runtime: Callable[[str, CompiledModel], Tuple[Any, Any]],
+                 bot_ids: Optional[Iterable[str]] = None):
+        """
+        make_runtime(bot_id, entry) -> (api, interpreter) создает адаптер и интерпретатор бота.
+        bot_ids - какие боты запускать; None - все боты из таблицы, включая новые.
+        """
+        self.cache = cache
+        self.make_runtime = make_runtime
+        self.bot_ids: Optional[Set[str]] = set(bot_ids) if bot_ids is not None else None
+        self.deployments: Dict[str, BotDeployment] = {}
+        self._reloads: Dict[str, asyncio.Task] = {}
+        self._again: Set[str] = set()
+        self.counters = {
+            "deployed": 0,
+            "activated": 0,
+            "restarted": 0,
+            "stopped": 0,
+            "failed": 0,
+        }
+
+    async def start(self, use_notify: bool = True, poll_interval: float = 5.0):
+        # Подписка до первой загрузки, чтобы не пропустить изменения между ними
+        if use_notify:
+            self.cache.subscribe(self.on_change)
+        else:
+            self.cache.start_polling(poll_interval, callback=self.on_change)
+
+        bot_ids = self.bot_ids if self.bot_ids is not None else await self.cache.source.list_ids()
+        for bot_id in bot_ids:
+            self._schedule_reload(bot_id)
+        await asyncio.gather(*list(self._reloads.values()), return_exceptions=True)
+        logger.info(f"Deployed {len(self.deployments)} bots")
+
+    async def stop(self, drain_timeout: float = 30.0, on_polling_stopped: Optional[Callable[[], None]] = None,
+                   handoff: bool = False):
+        await self.cache.stop()
+        tasks = list(self._reloads.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        deployments = list(self.deployments.values())
+        # Сначала все боты перестают принимать апдейты, затем параллельно доделывают начатое
+        await asyncio.gather(*(d.api.stop_polling() for d in deployments), return_exceptions=True)
+        if handoff:
+            for d in deployments:
+                release_state(d.api, d.interpreter)
+        if on_polling_stopped is not None:
+            on_polling_stopped()
+        await asyncio.gather(*(d.stop(drain_timeout) for d in deployments), return_exceptions=True)
+        self.deployments.clear()
+
+    def on_change(self, bot_id: str):
+        """Уведомление об изменении бота (вызывается синхронно из event loop)"""
+        if self.bot_ids is not None and bot_id not in self.bot_ids:
+            return
+        self.cache.invalidate(bot_id)
+        self._schedule_reload(bot_id)
+
+    def _schedule_reload(self, bot_id: str):
+        # Не больше одной перезагрузки бота одновременно
+        task = self._reloads.get(bot_id)
+        if task is not None and not task.done():
+            # Перезагрузка уже идет - после нее перечитаем еще раз
+            self._again.add(bot_id)
+            return
+        self._reloads[bot_id] = asyncio.get_running_loop().create_task(self._reload_loop(bot_id))
+
+    async def _reload_loop(self, bot_id: str):
+        try:
+            while True:
+                await self._reload(bot_id)
+                if bot_id not in self._again:
+                    break
+                self._again.discard(bot_id)
+        finally:
+            self._reloads.pop(bot_id, None)
+
+    async def _reload(self, bot_id: str):
+        started = time.monotonic()
+        try:
+            entry = await self.cache.get(bot_id)
+        except Exception as e:
+            # Невалидный сценарий не должен останавливать работающую версию бота
+            self.counters["failed"] += 1
+            logger.error(f"Bot {bot_id}: failed to load new version, keeping the current one: {e}")
+            return
+
+        deployment = self.deployments.get(bot_id)
+        if entry is None:
+            if deployment is not None:
+                del self.deployments[bot_id]
+                await deployment.stop()
+                self.counters["stopped"] += 1
+                logger.info(f"Bot {bot_id} removed - stopped")
+            return
+
+        if deployment is not None and deployment.entry.hash == entry.hash:
+            deployment.entry = entry
+            return
+
+        token = entry.token
+        if deployment is not None and deployment.token == token:
+            deployment.activate(entry)
+            self.counters["activated"] += 1
+        else:
+            if deployment is not None:
+                # Сменился токен - это другой бот в Telegram, нужен новый адаптер
+                del self.deployments[bot_id]
+                await deployment.stop()
+                self.counters["restarted"] += 1
+            if not token:
+                logger.warning(f"Bot {bot_id} has no token - not deployed")
+                return
+            api, interpreter = self.make_runtime(bot_id, entry)
+            deployment = BotDeployment(bot_id, entry, api, interpreter)
+            self.deployments[bot_id] = deployment
+            deployment.start()
+            self.counters["deployed"] += 1
+
+        logger.info(f"Bot {bot_id} version {entry.version} active in {(time.monotonic() - started) * 1000:.1f} ms")
@@ -0,0 +1,307 @@
+# http_client.py
+"""
+HTTP-клиент для блоков apiRequest/parallelApi.
+
+- один пул соединений (aiohttp.ClientSession) на весь процесс вместо сессии на каждый запрос;
+- таймауты connect/read/total;
+- повторы с экспоненциальной задержкой и джиттером (только для идемпотентных методов);
+- circuit breaker на каждый хост: при открытой цепи запрос сразу завершается ошибкой без сети;
+- ограничение размера ответа: тело читается в память не больше maxBodyBytes, при превышении
+  соединение рвется; JSON разбирается целиком уже после чтения.
+"""
+import asyncio
+import json
+import logging
+import random
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+from urllib.parse import urlparse
+
+from http_metrics import HttpMetrics
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------
+# Пути извлечения значений из ответа ("user.id", "items[0].name", "$body")
+# -------------------------
+
+_PATH_TOKEN = re.compile(r"([^.\[\]]+)|\[(\d+)\]")
+PathKey = Union[str, int]
+
+
+def compile_path(path: str) -> Tuple[PathKey, ...]:
+    """
+    "a.b[0].c" -> ("a", "b", 0, "c"). Компилируется один раз при загрузке модели.
+    Бросает ValueError для некорректного пути.
+    """
+    keys: List[PathKey] = []
+    pos = 0
+    while pos < len(path):
+        if path[pos] == "." and keys and pos + 1 < len(path) and path[pos + 1] != "[":
+            pos += 1
+        match = _PATH_TOKEN.match(path, pos)
+        if not match:
+            raise ValueError(f"Некорректный путь: {path}")
+        keys.append(match.group(1) if match.group(1) is not None else int(match.group(2)))
+        pos = match.end()
+    if not keys:
+        raise ValueError("Пустой путь")
+    return tuple(keys)
+
+
+_MISSING = object()
+
+
+def extract_path(data: Any, keys: Tuple[PathKey, ...]) -> Any:
+    """Значение по скомпилированному пути или _MISSING"""
+    for key in keys:
+        if isinstance(key, int):
+            if not isinstance(data, list) or key >= len(data):
+                return _MISSING
+        elif not isinstance(data, dict) or key not in data:
+            return _MISSING
+        data = data[key]
+    return data
+
+
+class ResponseTooLargeError(Exception):
+    """Тело ответа превысило лимит - чтение прервано"""
+    pass
+
+
+class CircuitOpenError(Exception):
+    """Запрос отклонен: цепь для хоста разомкнута"""
+    pass
+
+
+class UpstreamError(Exception):
+    """Хост ответил 5xx - считается сбоем для повторов и circuit breaker"""
+    def __init__(self, status: int):
+        self.status = status
+        super().__init__(f"Upstream responded with {status}")
+
+
+class CircuitBreaker:
+    """
+    closed    - запросы идут, ошибки считаются;
+    open      - после failure_threshold ошибок подряд запросы отклоняются reset_timeout секунд;
+    half_open - пропускается один пробный запрос: успех замыкает цепь, ошибка снова размыкает,
+                отмена (таймаут parallelApi, остановка) освобождает место для следующей пробы.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def release_probe(self):
+        self._probe_in_flight = False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self._probe_in_flight = False
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"Circuit opened after {self.failures} failures")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class HttpClient:
+    DEFAULT_TOTAL_TIMEOUT = 30.0
+    IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+    BACKOFF_BASE = 0.2          # Задержка перед первым повтором (сек)
+    BACKOFF_MAX = 5.0
+    MAX_BODY_BYTES = 1024 * 1024    # Лимит тела ответа по умолчанию
+    READ_SIZE = 64 * 1024       # Сколько байт тела читать за один вызов
+    METHODS_WITHOUT_BODY = {"GET", "HEAD", "OPTIONS"}
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._session = None
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        # Тайминги фаз по (бот, блок, хост)
+        self.stats = HttpMetrics()
+        self.counters = {
+            "requests": 0,
+            "retries": 0,
+            "failures": 0,
+            "circuit_rejections": 0,
+        }
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            # aiohttp импортируем по требованию: превью без apiRequest-блоков
+            # не должно тянуть сетевой стек при загрузке
+            import aiohttp
+            self._session = aiohttp.ClientSession(trace_configs=[self.stats.trace_config()])
+        return self._session
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        if host not in self._breakers:
+            self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+        return self._breakers[host]
+
+    def metrics(self) -> Dict[str, Any]:
+        """Счетчики и состояния circuit breaker по хостам"""
+        pool = {}
+        if self._session is not None and not self._session.closed:
+            connector = self._session.connector
+            pool = {"limit": connector.limit, "waits": self.stats.pool_waits}
+        return {
+            **self.counters,
+            "circuits": {host: b.state for host, b in self._breakers.items()},
+            "pool": pool,
+        }
+
+    async def close(self):
+        await self.stats.stop()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def request(self, params: Dict[str, Any], context: Optional[Tuple[str, str]] = None) -> Tuple[int, Any]:
+        """
+        Выполняет запрос по параметрам блока (url, method, headers, body, timeouts, retries).
+        context - (бот, block_id) для метрик.
+        Возвращает (status, resp_data). 4xx возвращается как есть, 5xx и сетевые ошибки
+        повторяются (для идемпотентных методов) и в итоге бросают исключение.
+        """
+        method = params.get("method", "GET").upper()
+        host = urlparse(params["url"]).netloc
+        breaker = self.breaker(host)
+
+        retries = params.get("retries", 0) if method in self.IDEMPOTENT_METHODS else 0
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                self.counters["circuit_rejections"] += 1
+                raise CircuitOpenError(f"Circuit open for {host}")
+            is_probe = breaker.state == CircuitBreaker.HALF_OPEN
+
+            self.counters["requests"] += 1
+            try:
+                status, resp_data = await self._send(params, method, (context or ("", "")) + (host,))
+                if status >= 500:
+                    raise UpstreamError(status)
+                breaker.record_success()
+                return status, resp_data
+            except (UpstreamError, asyncio.TimeoutError, OSError) as e:
+                breaker.record_failure()
+                self.counters["failures"] += 1
+                if attempt >= retries:
+                    raise
+                # Экспоненциальная задержка с джиттером, чтобы повторы от разных пользователей не совпадали
+                delay = min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.5)
+                attempt += 1
+                self.counters["retries"] += 1
+                logger.info(f"Retry {attempt}/{retries} for {params['url']} in {delay:.2f}s after {e!r}")
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                # Отмененная проба не должна навсегда занять half-open цепь
+                if is_probe:
+                    breaker.release_probe()
+                raise
+            except Exception:
+                # Хост ответил (слишком большое тело, битый JSON) - связность в порядке
+                breaker.record_success()
+                raise
+
+    def _timeout(self, params: Dict[str, Any]):
+        import aiohttp
+
+        timeouts = params.get("timeouts", {})
+        return aiohttp.ClientTimeout(
+            total=timeouts.get("total", params.get("timeout", self.DEFAULT_TOTAL_TIMEOUT)),
+            connect=timeouts.get("connect"),
+            sock_read=timeouts.get("read"),
+        )
+
+    async def _send(self, params: Dict[str, Any], method: str, stats_key) -> Tuple[int, Any]:
+        import aiohttp
+
+        client = self._get_session()
+        url = params["url"]
+        headers = params.get("headers", {})
+        body = params.get("body", {})
+        size_cap = params.get("maxBodyBytes", self.MAX_BODY_BYTES)
+
+        kwargs = {}
+        if method not in self.METHODS_WITHOUT_BODY and body not in (None, "", {}):
+            if isinstance(body, str):
+                kwargs["data"] = body.encode("utf-8")
+            else:
+                kwargs["json"] = body
+
+        timings: Dict[str, float] = {}
+        started = time.monotonic()
+        error = None
+        try:
+            async with client.request(method, url, headers=headers, timeout=self._timeout(params),
+                                      trace_request_ctx=timings, **kwargs) as resp:
+                raw = await self._read_capped(resp, size_cap)
+                if resp.status >= 400:
+                    error = f"http_{resp.status // 100}xx"
+                return resp.status, self._decode(resp, raw)
+        except aiohttp.ClientConnectionError as e:
+            error = type(e).__name__
+            # Сетевые ошибки aiohttp приводим к OSError, чтобы их обрабатывала логика повторов
+            raise OSError(str(e)) from e
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            timings["total"] = time.monotonic() - started
+            self.stats.record(stats_key, timings, error)
+
+    async def _read_capped(self, resp, size_cap: int) -> bytes:
+        """
+        Читает тело ответа целиком, но не больше size_cap байт: при превышении рвет соединение,
+        не дочитывая ответ. Разбор JSON (_decode) идет после чтения, по всему телу сразу.
+        """
+        if resp.content_length is not None and resp.content_length > size_cap:
+            resp.close()
+            raise ResponseTooLargeError(f"Content-Length {resp.content_length} > {size_cap}")
+
+        parts = []
+        size = 0
+        async for data in resp.content.iter_chunked(self.READ_SIZE):
+            size += len(data)
+            if size > size_cap:
+                resp.close()
+                raise ResponseTooLargeError(f"Response body exceeds {size_cap} bytes")
+            parts.append(data)
+        return b"".join(parts)
+
+    def _decode(self, resp, raw: bytes) -> Any:
+        """JSON разбирается как есть, любой другой ответ доступен по пути "$body" (текст)"""
+        if not raw:
+            return {}
+        text = raw.decode(resp.charset or "utf-8", errors="replace")
+        if "json" in resp.headers.get("Content-Type", ""):
+            return json.loads(text)
+        return {"$body": text}
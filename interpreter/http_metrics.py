@@ -0,0 +1,158 @@
+# http_metrics.py
+"""
+Метрики исходящих HTTP-запросов ботов.
+
+Тайминги фаз (DNS, connect, TTFB, total) собираются через aiohttp TraceConfig
+и агрегируются по ключу (бот, блок, хост). Периодически в лог выводится
+сводка самых медленных эндпоинтов.
+"""
+import asyncio
+import logging
+from collections import Counter, deque
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+StatsKey = Tuple[str, str, str]     # (bot, block_id, host)
+
+
+class EndpointStats:
+    """Агрегат по одному эндпоинту; хранит последние SAMPLE_SIZE замеров для перцентилей"""
+    SAMPLE_SIZE = 256
+    PHASES = ("dns", "connect", "queued", "ttfb", "total")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = Counter()
+        self.reused = 0
+        self.phase_sums = {phase: 0.0 for phase in self.PHASES}
+        self.max_total = 0.0
+        self.totals = deque(maxlen=self.SAMPLE_SIZE)
+
+    def add(self, timings: Dict[str, float], error: Optional[str]):
+        self.count += 1
+        if error:
+            self.errors[error] += 1
+        if timings.get("reused"):
+            self.reused += 1
+        for phase in self.PHASES:
+            self.phase_sums[phase] += timings.get(phase, 0.0)
+        total = timings.get("total", 0.0)
+        self.max_total = max(self.max_total, total)
+        self.totals.append(total)
+
+    def percentile(self, q: float) -> float:
+        if not self.totals:
+            return 0.0
+        ordered = sorted(self.totals)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "errors": dict(self.errors),
+            "reused_connections": self.reused,
+            "avg_ms": {phase: round(s / self.count * 1000, 1) for phase, s in self.phase_sums.items()} if self.count else {},
+            "p95_total_ms": round(self.percentile(0.95) * 1000, 1),
+            "max_total_ms": round(self.max_total * 1000, 1),
+        }
+
+
+class HttpMetrics:
+    def __init__(self):
+        self.endpoints: Dict[StatsKey, EndpointStats] = {}
+        self.pool_waits = 0             # Сколько запросов ждали свободное соединение в пуле
+        self._summary_task: Optional[asyncio.Task] = None
+
+    def trace_config(self):
+        """TraceConfig, который пишет тайминги фаз в dict, переданный как trace_request_ctx"""
+        import aiohttp
+
+        def now():
+            return asyncio.get_running_loop().time()
+
+        def phase_start(name):
+            async def hook(session, ctx, params):
+                ctx.trace_request_ctx[name + "_start"] = now()
+            return hook
+
+        def phase_end(name):
+            async def hook(session, ctx, params):
+                timings = ctx.trace_request_ctx
+                started = timings.pop(name + "_start", None)
+                if started is not None:
+                    timings[name] = timings.get(name, 0.0) + now() - started
+            return hook
+
+        async def on_request_start(session, ctx, params):
+            ctx.trace_request_ctx["request_start"] = now()
+
+        async def on_request_end(session, ctx, params):
+            # Заголовки ответа получены - время до первого байта
+            timings = ctx.trace_request_ctx
+            timings["ttfb"] = now() - timings.get("request_start", now())
+
+        async def on_connection_queued_start(session, ctx, params):
+            self.pool_waits += 1
+            await phase_start("queued")(session, ctx, params)
+
+        async def on_connection_reuseconn(session, ctx, params):
+            ctx.trace_request_ctx["reused"] = True
+
+        config = aiohttp.TraceConfig(trace_config_ctx_factory=self._ctx_factory)
+        config.on_request_start.append(on_request_start)
+        config.on_request_end.append(on_request_end)
+        config.on_dns_resolvehost_start.append(phase_start("dns"))
+        config.on_dns_resolvehost_end.append(phase_end("dns"))
+        # connect включает TLS-рукопожатие: aiohttp не выделяет его в отдельную фазу
+        config.on_connection_create_start.append(phase_start("connect"))
+        config.on_connection_create_end.append(phase_end("connect"))
+        config.on_connection_queued_start.append(on_connection_queued_start)
+        config.on_connection_queued_end.append(phase_end("queued"))
+        config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return config
+
+    @staticmethod
+    def _ctx_factory(trace_request_ctx=None):
+        from types import SimpleNamespace
+        # Запросы без контекста пишут тайминги во временный dict
+        return SimpleNamespace(trace_request_ctx=trace_request_ctx if trace_request_ctx is not None else {})
+
+    def record(self, key: StatsKey, timings: Dict[str, float], error: Optional[str] = None):
+        stats = self.endpoints.get(key)
+        if stats is None:
+            stats = self.endpoints[key] = EndpointStats()
+        stats.add(timings, error)
+
+    def slowest(self, top: int = 10) -> List[Dict[str, Any]]:
+        """Самые медленные эндпоинты по p95 общего времени"""
+        ranked = sorted(self.endpoints.items(), key=lambda item: item[1].percentile(0.95), reverse=True)
+        return [
+            {"bot": bot, "block_id": block_id, "host": host, **stats.to_dict()}
+            for (bot, block_id, host), stats in ranked[:top]
+        ]
+
+    def log_summary(self, top: int = 5):
+        if not self.endpoints:
+            return
+        lines = [
+            f"  {e['bot']} / {e['block_id']} / {e['host']}: n={e['count']} p95={e['p95_total_ms']}ms "
+            f"max={e['max_total_ms']}ms avg={e['avg_ms']} errors={e['errors']}"
+            for e in self.slowest(top)
+        ]
+        logger.info(f"Slowest HTTP endpoints (pool waits: {self.pool_waits}):\n" + "\n".join(lines))
+
+    def start_periodic_log(self, interval: float = 300.0, top: int = 5):
+        async def loop():
+            while True:
+                await asyncio.sleep(interval)
+                self.log_summary(top)
+
+        if self._summary_task is None or self._summary_task.done():
+            self._summary_task = asyncio.get_running_loop().create_task(loop())
+
+    async def stop(self):
+        if self._summary_task:
+            self._summary_task.cancel()
+            await asyncio.gather(self._summary_task, return_exceptions=True)
+            self._summary_task = None
@@ -0,0 +1,190 @@
+# lifecycle.py
+"""
+Жизненный цикл раннера: плавная остановка и передача polling новому процессу.
+
+Остановка (SIGTERM/SIGINT):
+  1. прекращаем получать апдейты (stop polling);
+  2. ждем завершения начатых шагов диалогов не дольше drain_timeout, остальные отменяем -
+     сессия остается на последнем сохраненном шаге (переживает рестарт только в постоянном
+     StateStorage; MemoryStorage пропадает вместе с процессом);
+  3. сбрасываем буферы (аналитика, общие переменные, журнал обработанных апдейтов), останавливаем таймеры,
+     закрываем HTTP-пулы и сессию бота.
+
+Передача (handoff): новый процесс через handoff-файл просит старый (SIGUSR1) отпустить polling,
+начинает получать апдейты сразу после этого, а старый в это время доделывает начатое.
+Telegram допускает только одного получателя getUpdates, поэтому окно без polling - только
+время остановки long-poll запроса в старом процессе.
+
+Handoff гарантирует только отсутствие паузы в приеме апдейтов. Файлы состояния передаются владельцу
+по очереди: старый процесс, остановив polling, сохраняет журнал обработанных апдейтов и перестает
+писать в него и в журнал таймеров, и лишь затем отмечает polling отпущенным; новый читает эти файлы
+только после этой отметки. Сессии при этом не передаются: в MemoryStorage они живут только в памяти
+старого процесса, поэтому начатые там диалоги в новом не продолжаются, а их таймеры новый процесс
+отбрасывает как осиротевшие. Общие переменные в файле (FileSharedBackend) так не координируются -
+для handoff нужен backend в Postgres.
+"""
+import asyncio
+import json
+import logging
+import os
+import signal
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class InflightTracker:
+    """Счетчик обрабатываемых апдейтов: async with tracker: ..."""
+    def __init__(self):
+        self._tasks = set()
+        self._idle: Optional[asyncio.Event] = None
+
+    def __len__(self):
+        return len(self._tasks)
+
+    async def __aenter__(self):
+        if self._idle is None:
+            self._idle = asyncio.Event()
+        self._idle.clear()
+        self._tasks.add(asyncio.current_task())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._tasks.discard(asyncio.current_task())
+        if not self._tasks:
+            self._idle.set()
+        return False
+
+    async def wait_idle(self, timeout: float) -> bool:
+        """True, если все обработчики завершились за timeout; иначе оставшиеся отменяются"""
+        if not self._tasks:
+            return True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            pending = list(self._tasks)
+            logger.warning(f"Drain timeout: cancelling {len(pending)} in-flight updates")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            return False
+
+
+def release_state(api, interpreter):
+    """Handoff: отдать файлы состояния новому процессу (вызывается после остановки polling)"""
+    api.release_state()
+    interpreter.scheduler.release_store()
+
+
+async def drain_runtime(api, interpreter, timeout: float, on_polling_stopped: Optional[Callable[[], None]] = None,
+                        handoff: bool = False):
+    """
+    Плавная остановка одного бота: апдейты -> начатые диалоги -> буферы -> соединения.
+    on_polling_stopped вызывается сразу после остановки polling (handoff: новый процесс может начинать);
+    при handoff до этого освобождаются файлы состояния.
+    """
+    started = time.monotonic()
+    await api.stop_polling()
+    if handoff:
+        release_state(api, interpreter)
+    if on_polling_stopped is not None:
+        on_polling_stopped()
+    drained = await api.drain(timeout)
+
+    await interpreter.scheduler.stop()
+    await interpreter.shared.stop()
+    if interpreter.analytics is not None:
+        await interpreter.analytics.stop()
+    await api.close()
+    logger.info(f"Runtime drained in {time.monotonic() - started:.2f}s (clean: {drained})")
+    return drained
+
+
+class Lifecycle:
+    HANDOFF_POLL = 0.05         # Как часто новый процесс проверяет, отпустил ли старый polling
+
+    def __init__(self, drain_timeout: float = 30.0, handoff_file: Optional[str] = None,
+                 handoff_timeout: float = 10.0):
+        self.drain_timeout = drain_timeout
+        self.handoff_file = handoff_file
+        self.handoff_timeout = handoff_timeout
+        self.handoff_requested = False
+        self._stop: Optional[asyncio.Event] = None
+
+    # -------------------------
+    # Сигналы
+    # -------------------------
+
+    def install_signal_handlers(self):
+        loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.request_stop)
+        if hasattr(signal, "SIGUSR1"):
+            loop.add_signal_handler(signal.SIGUSR1, self.request_stop, True)
+
+    def request_stop(self, handoff: bool = False):
+        if handoff:
+            logger.info("Handoff requested by a new process")
+            self.handoff_requested = True
+        if self._stop is not None:
+            self._stop.set()
+
+    async def wait_stop(self, *tasks: asyncio.Task):
+        """Ждать сигнала остановки или завершения любой из задач (например, упавшего polling)"""
+        stop = asyncio.get_running_loop().create_task(self._stop.wait())
+        try:
+            await asyncio.wait({stop, *tasks}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stop.cancel()
+
+    # -------------------------
+    # Передача polling
+    # -------------------------
+
+    def _read_handoff(self) -> dict:
+        try:
+            with open(self.handoff_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_handoff(self, state: str):
+        tmp_path = self.handoff_file + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"pid": os.getpid(), "state": state}, f)
+        os.replace(tmp_path, self.handoff_file)
+
+    @staticmethod
+    def _alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+            return True
+        except OSError:
+            return False
+
+    async def acquire_polling(self):
+        """Перед запуском polling: попросить предыдущий процесс отпустить его и дождаться этого"""
+        if not self.handoff_file:
+            return
+        record = self._read_handoff()
+        pid = record.get("pid")
+        if pid and pid != os.getpid() and record.get("state") == "polling" and self._alive(pid):
+            logger.info(f"Taking over polling from process {pid}")
+            os.kill(pid, signal.SIGUSR1)
+            deadline = time.monotonic() + self.handoff_timeout
+            while time.monotonic() < deadline:
+                record = self._read_handoff()
+                if record.get("pid") != pid or record.get("state") == "released" or not self._alive(pid):
+                    break
+                await asyncio.sleep(self.HANDOFF_POLL)
+            else:
+                logger.warning(f"Process {pid} did not release polling in {self.handoff_timeout}s")
+        self._write_handoff("polling")
+
+    def release_polling(self):
+        """Polling остановлен - новый процесс может начинать, пока мы доделываем начатое"""
+        if self.handoff_file and self._read_handoff().get("pid") == os.getpid():
+            self._write_handoff("released")
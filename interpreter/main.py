@@ -12,6 +12,17 @@ from bot_interpreter import BotInterpreter
 from api_tg import TelegramAPI
 # Импортируем хранилище (важно для явности)
 from state_storage import MemoryStorage 
+from timers import TimerScheduler, FileTimerStore
+from analytics import AnalyticsSink, JsonlEventWriter, PostgresCopyEventWriter, HttpEventWriter
+from http_client import HttpClient
+from model_cache import ModelCache, PostgresModelSource
+from deploy import BotDeployer
+from dedup import SeenSet
+from rate_limiter import InboundLimiter
+from lifecycle import Lifecycle, drain_runtime
+from script_runner import ScriptRunner
+from replay import Recorder
+from shared_vars import LocalSharedStore, PostgresSharedStore, FileSharedBackend, PostgresSharedBackend
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -24,25 +35,118 @@ def load_json_file(path: str):
     return json.loads(p.read_text(encoding="utf-8"))
 
 
+def make_inbound_limiter(cfg):
+    # Входящие события от одного пользователя: rate в секунду, всплеск burst, политика drop/coalesce/delay
+    return InboundLimiter(rate=cfg.get("inbound-rate", 1.0), burst=cfg.get("inbound-burst", 5),
+                          policy=cfg.get("inbound-policy", "delay"))
+
+
+def make_lifecycle(cfg):
+    # drain-timeout - сколько ждать начатые диалоги при остановке;
+    # handoff-file - общий файл старого и нового процесса для передачи polling без простоя
+    return Lifecycle(drain_timeout=cfg.get("drain-timeout", 30), handoff_file=cfg.get("handoff-file"),
+                     handoff_timeout=cfg.get("handoff-timeout", 10))
+
+
+def make_shared_backend(cfg):
+    # Общие переменные: в Postgres (согласованы между воркерами) или в файле (один процесс)
+    dsn = cfg.get("shared-dsn") or cfg.get("database-url")
+    if dsn:
+        return PostgresSharedBackend(dsn)
+    return FileSharedBackend(cfg.get("shared-file", "shared_vars.json"))
+
+
+def make_shared_store(backend, bot: str):
+    if isinstance(backend, PostgresSharedBackend):
+        return PostgresSharedStore(backend, bot=bot)
+    return LocalSharedStore(backend, bot=bot)
+
+
+def make_script_runner(cfg):
+    # Пул процессов для блоков script: лимиты процессорного времени (на вызов) и памяти (на процесс);
+    # запущенные от root процессы пула работают от script-user
+    return ScriptRunner(workers=cfg.get("script-workers", 2), cpu_limit=cfg.get("script-cpu-limit", 1.0),
+                        memory_limit=cfg.get("script-memory-mb", 256) * 1024 * 1024,
+                        run_as=cfg.get("script-user", "nobody"))
+
+
+def make_analytics_writer(cfg, bot_id: str = ""):
+    # События воронки пишутся пачками: в бэкенд редактора (счетчики для холста),
+    # в Postgres (COPY) или в файл
+    if cfg.get("analytics-url"):
+        return HttpEventWriter(cfg["analytics-url"].replace("{bot_id}", bot_id), cfg.get("analytics-token", ""))
+    if cfg.get("analytics-dsn"):
+        return PostgresCopyEventWriter(cfg["analytics-dsn"])
+    return JsonlEventWriter(cfg.get("analytics-file", "analytics.jsonl"))
+
+
+async def run_from_database(cfg):
+    """
+    Боты берутся из таблицы bot_model редактора и обновляются по NOTIFY без перезапуска.
+    bot-ids в конфиге ограничивает набор ботов, иначе запускаются все.
+    """
+    http = HttpClient()
+    shared_backend = make_shared_backend(cfg)
+    scripts = make_script_runner(cfg)
+    timers_dir = Path(cfg.get("timers-dir", "."))
+
+    def make_runtime(bot_id, entry):
+        seen = SeenSet(path=str(timers_dir / f"seen-{bot_id}.json"))
+        seen.load()
+        api = TelegramAPI(token=entry.token, interpreter=None, choice_mode=cfg.get("choice-mode", "edit"), seen=seen,
+                          inbound=make_inbound_limiter(cfg))
+        scheduler = TimerScheduler(FileTimerStore(str(timers_dir / f"timers-{bot_id}.jsonl")))
+        analytics = AnalyticsSink(make_analytics_writer(cfg, bot_id), bot=entry.model.get("BotName", ""))
+        interpreter = BotInterpreter(bot_model=entry.model, api=api, storage=MemoryStorage(), scheduler=scheduler,
+                                     http_client=http, analytics=analytics,
+                                     shared=make_shared_store(shared_backend, bot_id), scripts=scripts)
+        api.set_interpreter(interpreter)
+        return api, interpreter
+
+    cache = ModelCache(PostgresModelSource(cfg["database-url"]),
+                       max_concurrent_fetches=cfg.get("max-concurrent-fetches", 8))
+    deployer = BotDeployer(cache, make_runtime, bot_ids=cfg.get("bot-ids"))
+
+    lifecycle = make_lifecycle(cfg)
+    http.stats.start_periodic_log(cfg.get("http-stats-interval", 300))
+    try:
+        await lifecycle.acquire_polling()
+        lifecycle.install_signal_handlers()
+        await scripts.start()
+        await deployer.start(use_notify=cfg.get("use-notify", True), poll_interval=cfg.get("poll-interval", 5))
+        await lifecycle.wait_stop()
+    finally:
+        await deployer.stop(lifecycle.drain_timeout, on_polling_stopped=lifecycle.release_polling,
+                            handoff=lifecycle.handoff_requested)
+        await http.close()
+        shared_backend.close()
+        await scripts.stop()
+
+
 async def main_async():
     # Загрузить bot-model и bot-config
     bot_model_path = "bot_model.json"
     bot_config_path = "bot_config.json"
 
-    # 1. Загрузка модели
+    # 1. Загрузка конфига
     try:
-        # Если validator.py нет, можно временно использовать load_json_file
-        bot_model = parse_bot_config_from_file(bot_model_path)
-        logger.info("Бот-модель загружена и валидирована.")
+        cfg = load_json_file(bot_config_path)
     except Exception as e:
-        logger.error(f"Ошибка загрузки бот-модели: {e}")
+        logger.error(f"Ошибка загрузки конфига: {e}")
         return
 
-    # 2. Загрузка конфига
+    # Боты из базы редактора вместо bot_model.json
+    if cfg.get("database-url"):
+        await run_from_database(cfg)
+        return
+
+    # 2. Загрузка модели
     try:
-        cfg = load_json_file(bot_config_path)
+        # Если validator.py нет, можно временно использовать load_json_file
+        bot_model = parse_bot_config_from_file(bot_model_path)
+        logger.info("Бот-модель загружена и валидирована.")
     except Exception as e:
-        logger.error(f"Ошибка загрузки конфига: {e}")
+        logger.error(f"Ошибка загрузки бот-модели: {e}")
         return
 
     # Берём токен из bot-config
@@ -56,7 +160,11 @@ async def main_async():
     platform_name = cfg.get("platform-name", "telegram").lower()
     
     if platform_name == "telegram":
-        api = TelegramAPI(token=token, interpreter=None)
+        # Обработанные апдейты сохраняются между перезапусками: повторная доставка после рестарта отсекается
+        # Файл читается после acquire_polling: при handoff им до этого владеет старый процесс
+        seen = SeenSet(path=cfg.get("dedup-file", "seen_updates.json"))
+        api = TelegramAPI(token=token, interpreter=None, choice_mode=cfg.get("choice-mode", "edit"), seen=seen,
+                          inbound=make_inbound_limiter(cfg))
     else:
         logger.error(f"Неподдерживаемая платформа: {platform_name}")
         return
@@ -65,9 +173,29 @@ async def main_async():
     # Создаем хранилище здесь, чтобы потом легко заменить MemoryStorage на RedisStorage
     storage = MemoryStorage()
 
+    # Таймеры блоков delay/timeout пишутся в журнал и переживают перезапуск
+    scheduler = TimerScheduler(FileTimerStore(cfg.get("timers-file", "timers.jsonl")))
+
+    analytics = AnalyticsSink(make_analytics_writer(cfg, cfg.get("bot-id", "")), bot=bot_model.get("BotName", ""))
+
+    # Общие переменные бота переживают перезапуск: значения из файла/БД загружаются до запуска
+    shared_backend = make_shared_backend(cfg)
+    shared = make_shared_store(shared_backend, cfg.get("bot-id") or bot_model.get("BotName", ""))
+    await shared.load()
+
+    # Процессы для блоков script запускаются заранее, чтобы первый вызов не ждал их старта
+    scripts = make_script_runner(cfg)
+    await scripts.start()
+
     # 5. Инициализация Интерпретатора
     # Связываем его с API и Хранилищем
-    interpreter = BotInterpreter(bot_model=bot_model, api=api, storage=storage)
+    interpreter = BotInterpreter(bot_model=bot_model, api=api, storage=storage, scheduler=scheduler,
+                                 analytics=analytics, shared=shared, scripts=scripts)
+
+    # Запись входящих событий для воспроизведения (python replay.py) - только если задан record-file
+    recorder = Recorder(cfg["record-file"]) if cfg.get("record-file") else None
+    if recorder is not None:
+        recorder.attach(interpreter)
 
     # 6. Замыкаем круг зависимостей
     # Теперь сообщаем API, кто его интерпретатор
@@ -75,7 +203,30 @@ async def main_async():
 
     # 7. Запуск
     logger.info("Запуск бота...")
-    await api.run()
+    lifecycle = make_lifecycle(cfg)
+    await lifecycle.acquire_polling()
+    # Журналы апдейтов и таймеров - только после того, как старый процесс их отпустил
+    seen.load()
+    scheduler.start()
+    analytics.start()
+    shared.start()
+    # Раз в 5 минут - сводка самых медленных внешних API в лог
+    interpreter.http.stats.start_periodic_log(cfg.get("http-stats-interval", 300))
+    lifecycle.install_signal_handlers()
+    polling = asyncio.get_running_loop().create_task(api.run())
+    try:
+        await lifecycle.wait_stop(polling)
+    finally:
+        # Новые апдейты больше не принимаем, начатые диалоги доделываем, буферы сбрасываем
+        await drain_runtime(api, interpreter, lifecycle.drain_timeout, on_polling_stopped=lifecycle.release_polling,
+                            handoff=lifecycle.handoff_requested)
+        await asyncio.gather(polling, return_exceptions=True)
+        await interpreter.http.close()
+        if hasattr(shared_backend, "close"):
+            shared_backend.close()
+        await scripts.stop()
+        if recorder is not None:
+            await recorder.close()
 
 
 if __name__ == "__main__":
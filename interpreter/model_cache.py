@@ -0,0 +1,308 @@
+# model_cache.py
+"""
+Кэш скомпилированных бот-моделей в процессе раннера.
+
+Сценарии живут в таблице bot_model (JSONB scenario). Без кэша каждый воркер при каждом
+обращении заново читает сценарий из БД, валидирует и компилирует его.
+ModelCache хранит результат компиляции по bot_id с версией (updated_at) и хэшем содержимого,
+вытесняет давно не использованные модели (LRU) и сбрасывает запись по NOTIFY bot_model_changed
+или по опросу updated_at.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from validator import parse_bot_config, scenario_hash
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "bot_model_changed"
+
+
+@dataclass
+class CompiledModel:
+    bot_id: str
+    version: Any                # updated_at строки bot_model
+    hash: str                   # Хэш содержимого сценария
+    model: Dict[str, Any]       # Провалидированная модель, готовая для BotInterpreter
+    compiled_at: float
+    token: str = ""             # Токен платформы (в модель после валидации не попадает)
+
+
+# -------------------------
+# Источник моделей
+# -------------------------
+
+class PostgresModelSource:
+    """Чтение сценариев из bot_model и подписка на изменения"""
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self._listen_conn = None
+
+    def _connect(self):
+        import psycopg2
+        return psycopg2.connect(self.dsn)
+
+    def _fetch(self, bot_id: str) -> Optional[Tuple[Any, Dict[str, Any]]]:
+        conn = self._connect()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT updated_at, scenario FROM bot_model WHERE id = %s", (bot_id,))
+                    row = cur.fetchone()
+        finally:
+            conn.close()
+        return (row[0], row[1]) if row else None
+
+    async def fetch(self, bot_id: str) -> Optional[Tuple[Any, Dict[str, Any]]]:
+        """(updated_at, scenario) или None, если бота нет"""
+        return await asyncio.to_thread(self._fetch, bot_id)
+
+    def _list_ids(self) -> List[str]:
+        conn = self._connect()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT id FROM bot_model")
+                    return [str(row[0]) for row in cur.fetchall()]
+        finally:
+            conn.close()
+
+    async def list_ids(self) -> List[str]:
+        return await asyncio.to_thread(self._list_ids)
+
+    def _changed_since(self, since: datetime) -> List[Tuple[str, Any]]:
+        conn = self._connect()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT id, updated_at FROM bot_model WHERE updated_at > %s", (since,))
+                    return [(str(bot_id), updated_at) for bot_id, updated_at in cur.fetchall()]
+        finally:
+            conn.close()
+
+    async def changed_since(self, since: datetime) -> List[Tuple[str, Any]]:
+        return await asyncio.to_thread(self._changed_since, since)
+
+    def listen(self, callback: Callable[[str], None]):
+        """
+        LISTEN bot_model_changed на отдельном соединении; уведомления читаются
+        через add_reader event loop, без отдельного потока.
+        """
+        import psycopg2.extensions
+
+        conn = self._connect()
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {NOTIFY_CHANNEL}")
+        self._listen_conn = conn
+
+        def on_readable():
+            conn.poll()
+            while conn.notifies:
+                callback(conn.notifies.pop(0).payload)
+
+        asyncio.get_running_loop().add_reader(conn.fileno(), on_readable)
+
+    def close(self):
+        if self._listen_conn is not None:
+            asyncio.get_running_loop().remove_reader(self._listen_conn.fileno())
+            self._listen_conn.close()
+            self._listen_conn = None
+
+
+# -------------------------
+# Кэш
+# -------------------------
+
+class ModelCache:
+    def __init__(self, source, capacity: int = 256, compile: Callable[[Dict[str, Any]], Dict[str, Any]] = parse_bot_config,
+                 max_concurrent_fetches: int = 8):
+        self.source = source
+        self.capacity = capacity
+        self.compile = compile
+        # Массовое обновление сценариев не должно открыть сотни соединений к БД одновременно
+        self._fetch_slots = asyncio.Semaphore(max_concurrent_fetches)
+        self._entries: "OrderedDict[str, CompiledModel]" = OrderedDict()
+        # Один запрос в БД на бота, даже если модель одновременно нужна многим корутинам
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # Компиляции инвалидированных моделей: переиспользуются, если содержимое не изменилось
+        self._stale: "OrderedDict[str, CompiledModel]" = OrderedDict()
+        # Боты, измененные во время загрузки: загруженная версия может быть уже устаревшей
+        self._dirty = set()
+        self._poll_task: Optional[asyncio.Task] = None
+        self.counters = {
+            "hits": 0,
+            "misses": 0,
+            "compiles": 0,
+            "hash_reuses": 0,
+            "evictions": 0,
+            "invalidations": 0,
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def get(self, bot_id: str) -> Optional[CompiledModel]:
+        entry = self._entries.get(bot_id)
+        if entry is not None:
+            self._entries.move_to_end(bot_id)
+            self.counters["hits"] += 1
+            return entry
+
+        self.counters["misses"] += 1
+        task = self._inflight.get(bot_id)
+        if task is None:
+            # Загрузка - отдельная задача: отмена первого запросившего не оставляет остальных ждать вечно
+            task = asyncio.get_running_loop().create_task(self._load(bot_id))
+            self._inflight[bot_id] = task
+            task.add_done_callback(lambda t: self._load_done(bot_id, t))
+        return await asyncio.shield(task)
+
+    def _load_done(self, bot_id: str, task: asyncio.Task):
+        if self._inflight.get(bot_id) is task:
+            del self._inflight[bot_id]
+        # Ошибку получат ожидающие; если их не осталось, она не должна попасть в лог как "never retrieved"
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Model {bot_id} load failed: {task.exception()}")
+
+    async def _load(self, bot_id: str) -> Optional[CompiledModel]:
+        async with self._fetch_slots:
+            row = await self.source.fetch(bot_id)
+        if row is None:
+            return None
+        version, scenario = row
+
+        content_hash = scenario_hash(scenario)
+        stale = self._stale.pop(bot_id, None)
+        if stale is not None and stale.hash == content_hash:
+            # updated_at сменился, а содержимое нет (например, переименование) - компиляция не нужна
+            self.counters["hash_reuses"] += 1
+            entry = CompiledModel(bot_id, version, content_hash, stale.model, stale.compiled_at, stale.token)
+        else:
+            self.counters["compiles"] += 1
+            # Полная валидация сценария - CPU-работа; в потоке она не останавливает опрос остальных ботов
+            model = await asyncio.to_thread(self.compile, scenario)
+            entry = CompiledModel(bot_id, version, content_hash, model, time.time(), scenario.get("Token", ""))
+
+        if bot_id in self._dirty:
+            # Пока шла загрузка, пришло уведомление - в кэш не кладем, следующий get перечитает
+            self._dirty.discard(bot_id)
+            return entry
+
+        self._entries[bot_id] = entry
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            self.counters["evictions"] += 1
+        return entry
+
+    def invalidate(self, bot_id: str):
+        if bot_id in self._inflight:
+            self._dirty.add(bot_id)
+        entry = self._entries.pop(bot_id, None)
+        if entry is not None:
+            self.counters["invalidations"] += 1
+            # Старую компиляцию держим до следующей загрузки: если хэш совпадет, она переиспользуется
+            self._stale[bot_id] = entry
+            while len(self._stale) > self.capacity:
+                self._stale.popitem(last=False)
+
+    def subscribe(self, callback: Optional[Callable[[str], None]] = None):
+        """
+        Инвалидация по NOTIFY (триггер на bot_model, см. models.sql).
+        callback вызывается вместо invalidate и должен вызвать его сам.
+        """
+        self.source.listen(callback or self.invalidate)
+
+    def start_polling(self, interval: float = 5.0, callback: Optional[Callable[[str], None]] = None):
+        """Запасной вариант без LISTEN/NOTIFY: опрос updated_at"""
+        callback = callback or self.invalidate
+
+        async def loop():
+            since = datetime.now().astimezone()
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    for bot_id, updated_at in await self.source.changed_since(since):
+                        entry = self._entries.get(bot_id)
+                        if entry is None or entry.version != updated_at:
+                            callback(bot_id)
+                        since = max(since, updated_at)
+                except Exception as e:
+                    logger.error(f"Model cache polling failed: {e}")
+
+        if self._poll_task is None or self._poll_task.done():
+            self._poll_task = asyncio.get_running_loop().create_task(loop())
+
+    async def stop(self):
+        if self._poll_task:
+            self._poll_task.cancel()
+            await asyncio.gather(self._poll_task, return_exceptions=True)
+            self._poll_task = None
+        if hasattr(self.source, "close"):
+            self.source.close()
+
+
+# -------------------------
+# Бенчмарк: холодное и теплое получение модели
+# -------------------------
+
+if __name__ == "__main__":
+    import json
+    import uuid
+
+    class FakeSource:
+        """Имитация bot_model: задержка сети/БД и десериализация JSONB"""
+        def __init__(self, scenarios: Dict[str, str], latency: float = 0.002):
+            self.scenarios = scenarios
+            self.latency = latency
+
+        async def fetch(self, bot_id):
+            await asyncio.sleep(self.latency)
+            return 1, json.loads(self.scenarios[bot_id])
+
+    def make_scenario(n_messages: int) -> Dict[str, Any]:
+        ids = [str(uuid.uuid4()) for _ in range(n_messages + 2)]
+        blocks = [{"Block_id": ids[0], "Type": "start", "Params": {}, "Connections": {"In": [], "Out": [ids[1]]}}]
+        for i in range(1, n_messages + 1):
+            blocks.append({
+                "Block_id": ids[i], "Type": "sendMessage", "Params": {"message": f"Сообщение {i} " * 10},
+                "Connections": {"In": [ids[i - 1]], "Out": [ids[i + 1]]},
+            })
+        blocks.append({"Block_id": ids[-1], "Type": "final", "Params": {}, "Connections": {"In": [ids[-2]], "Out": []}})
+        return {"BotName": "bench", "Start": ids[0], "Final": ids[-1], "GlobalVariables": [], "Blocks": blocks}
+
+    async def bench():
+        n_bots = 50
+        scenarios = {str(uuid.uuid4()): json.dumps(make_scenario(200)) for _ in range(n_bots)}
+        cache = ModelCache(FakeSource(scenarios), capacity=n_bots)
+
+        started = time.perf_counter()
+        for bot_id in scenarios:
+            await cache.get(bot_id)
+        cold = (time.perf_counter() - started) / n_bots
+
+        rounds = 100
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for bot_id in scenarios:
+                await cache.get(bot_id)
+        warm = (time.perf_counter() - started) / (n_bots * rounds)
+
+        # NOTIFY без изменения содержимого: перечитывание из БД, но без повторной компиляции
+        for bot_id in scenarios:
+            cache.invalidate(bot_id)
+        started = time.perf_counter()
+        for bot_id in scenarios:
+            await cache.get(bot_id)
+        reused = (time.perf_counter() - started) / n_bots
+
+        print(f"cold: {cold * 1000:.3f} мс/модель, warm: {warm * 1_000_000:.2f} мкс/модель (x{cold / warm:.0f}), "
+              f"после инвалидации (тот же хэш): {reused * 1000:.3f} мс/модель")
+        print(cache.counters)
+
+    asyncio.run(bench())
@@ -0,0 +1,175 @@
+# rate_limiter.py
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Асинхронный token bucket.
+    rate - сколько токенов пополняется в секунду, capacity - максимальный всплеск.
+    acquire() ждет, пока не появится токен; try_acquire() не ждет.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    async def acquire(self, tokens: float = 1):
+        # Лок выстраивает ожидающих в очередь, чтобы не было гонки за пополнение
+        async with self._lock:
+            while not self.try_acquire(tokens):
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+class _UserBucket:
+    __slots__ = ("tokens", "updated_at", "pending", "draining")
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated_at = now
+        self.pending = deque()      # Отложенные события (coalesce - не больше одного)
+        self.draining = False
+
+
+class InboundLimiter:
+    """
+    Ограничение входящих событий от одного пользователя (token bucket на пользователя).
+    Что делать с событием сверх лимита, задает policy:
+      drop     - отбросить;
+      coalesce - оставить только последнее и обработать, когда появится токен;
+      delay    - поставить в очередь (не длиннее max_queue) и обработать по мере появления токенов.
+    По умолчанию delay: drop и coalesce теряют ввод пользователя без ответа ему, поэтому включаются явно.
+    Состояние пользователя - несколько чисел; неактивные пользователи вытесняются через idle_ttl.
+    """
+    POLICIES = ("drop", "coalesce", "delay")
+
+    def __init__(self, rate: float = 1.0, burst: float = 5, policy: str = "delay",
+                 max_queue: int = 5, idle_ttl: float = 600.0, max_users: int = 100_000):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown inbound policy: {policy}")
+        self.rate = rate
+        self.burst = burst
+        self.policy = policy
+        self.max_queue = max_queue if policy == "delay" else 1
+        self.idle_ttl = idle_ttl
+        self.max_users = max_users
+        # Порядок вставки = порядок последней активности: вытеснение с начала за O(1)
+        self._users: "OrderedDict[int, _UserBucket]" = OrderedDict()
+        self._drains = set()        # Ссылки на фоновые задачи, чтобы их не собрал GC
+        self.counters = {
+            "passed": 0,
+            "dropped": 0,
+            "coalesced": 0,
+            "delayed": 0,
+            "evicted": 0,
+        }
+
+    def __len__(self):
+        return len(self._users)
+
+    def _bucket(self, user_id: int, now: float) -> _UserBucket:
+        bucket = self._users.get(user_id)
+        if bucket is None:
+            bucket = self._users[user_id] = _UserBucket(self.burst, now)
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated_at) * self.rate)
+            bucket.updated_at = now
+            self._users.move_to_end(user_id)
+        return bucket
+
+    def _evict(self, now: float):
+        victims = []
+        for user_id, bucket in self._users.items():
+            over = len(self._users) - len(victims) > self.max_users
+            if not over and now - bucket.updated_at <= self.idle_ttl:
+                break
+            # Пользователя с очередью не трогаем, но и не останавливаемся на нем: дальше могут быть простаивающие
+            if bucket.draining:
+                continue
+            victims.append(user_id)
+        for user_id in victims:
+            del self._users[user_id]
+        self.counters["evicted"] += len(victims)
+
+    async def submit(self, user_id: int, process: Callable[[], Awaitable[Any]]):
+        """process() вызывается сразу, позже или не вызывается вовсе - в зависимости от лимита"""
+        now = time.monotonic()
+        self._evict(now)
+        bucket = self._bucket(user_id, now)
+
+        if not bucket.draining and bucket.tokens >= 1:
+            bucket.tokens -= 1
+            self.counters["passed"] += 1
+            await process()
+            return
+
+        if self.policy == "drop":
+            self.counters["dropped"] += 1
+            return
+
+        if self.policy == "coalesce":
+            if bucket.pending:
+                bucket.pending.clear()
+                self.counters["coalesced"] += 1
+        elif len(bucket.pending) >= self.max_queue:
+            self.counters["dropped"] += 1
+            return
+        bucket.pending.append(process)
+        self.counters["delayed"] += 1
+
+        if not bucket.draining:
+            bucket.draining = True
+            task = asyncio.get_running_loop().create_task(self._drain(user_id, bucket))
+            self._drains.add(task)
+            task.add_done_callback(self._drains.discard)
+
+    async def _drain(self, user_id: int, bucket: _UserBucket):
+        try:
+            while bucket.pending:
+                await asyncio.sleep(max(0.0, (1 - bucket.tokens) / self.rate))
+                now = time.monotonic()
+                bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated_at) * self.rate)
+                bucket.updated_at = now
+                if user_id in self._users:
+                    # Порядок в _users - порядок активности, по нему идет вытеснение
+                    self._users.move_to_end(user_id)
+                if bucket.tokens < 1:
+                    continue
+                bucket.tokens -= 1
+                process = bucket.pending.popleft()
+                self.counters["passed"] += 1
+                try:
+                    await process()
+                except Exception as e:
+                    logger.error(f"Delayed inbound event for user {user_id} failed: {e}")
+        finally:
+            bucket.draining = False
+
+    async def wait_idle(self, timeout: float) -> bool:
+        """Дождаться обработки отложенных событий (при остановке); True, если успели"""
+        if not self._drains:
+            return True
+        _, pending = await asyncio.wait(set(self._drains), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        return not pending
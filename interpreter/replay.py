@@ -0,0 +1,408 @@
+# replay.py
+"""
+Запись и воспроизведение production-диалогов для проверки производительности и поведения.
+
+Запись (Recorder.attach(interpreter)): входящие события (start_dialog/resume_dialog, срабатывания
+таймеров), исходящие вызовы BotAPI и ответы внешних API пишутся в компактный журнал JSON Lines
+(gzip, если путь оканчивается на .gz). user_id анонимизируется (HMAC со случайной солью,
+соль не сохраняется); имя, username и user_id в исходящих текстах и во входящих сообщениях
+заменяются на плейсхолдеры, с которыми же диалог стартует при воспроизведении.
+
+Строка журнала: [смещение в мс, тип, анонимный user_id, данные]
+  s - start_dialog, r - resume_dialog (текст/токен кнопки), t - срабатывание таймера,
+  o - исходящий вызов ("m", текст) / ("c", текст, [id кнопок]),
+  h - ответ API (ID блока, статус, тело, длительность мс) или ошибка (ID блока, null, текст ошибки, мс).
+
+Воспроизведение (python replay.py журнал bot_model.json --speed 1|N|max [--core путь]):
+входящие события подаются в интерпретатор (текущий или из другого дерева --core) с исходными
+интервалами, ускоренными в N раз или без пауз. API - поддельный, HTTP отвечает записанными ответами.
+Отчет: распределение задержек обработки событий и расхождения исходящих сообщений с записью.
+Блок split выбирает ветку по user_id, поэтому после анонимизации варианты могут не совпасть с записью.
+"""
+import argparse
+import asyncio
+import contextvars
+import gzip
+import hashlib
+import hmac
+import importlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+from collections import defaultdict, deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from bot_api_interface import BotAPI
+
+logger = logging.getLogger(__name__)
+
+START, RESUME, TIMER, OUTBOUND, HTTP = "s", "r", "t", "o", "h"
+
+# Данные пользователя при воспроизведении; в записанных текстах на их месте те же строки
+REPLAY_META = {"username": "${username}", "first_name": "${first_name}"}
+
+# Пользователь, чье событие сейчас обрабатывается (HTTP-запрос блока не знает user_id)
+_current_user: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("replay_user", default=None)
+
+
+def _open(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _outbound_choice(prompt: str, choices: List[Dict[str, Any]]) -> list:
+    return ["c", prompt, [str(c["id"]) for c in choices]]
+
+
+# -------------------------
+# Запись
+# -------------------------
+
+class RecordingBotAPI(BotAPI):
+    """Обертка BotAPI: записывает исходящие вызовы и передает их дальше"""
+    def __init__(self, inner: BotAPI, recorder: "Recorder"):
+        self.inner = inner
+        self.recorder = recorder
+
+    async def send_message(self, user_id: int, text: str):
+        self.recorder.write(OUTBOUND, user_id, ["m", self.recorder.mask(user_id, text)])
+        return await self.inner.send_message(user_id, text)
+
+    async def get_message(self, user_id: int, prompt: Optional[str] = None) -> Optional[str]:
+        if prompt:
+            self.recorder.write(OUTBOUND, user_id, ["m", self.recorder.mask(user_id, prompt)])
+        return await self.inner.get_message(user_id, prompt)
+
+    async def get_choice(self, user_id: int, prompt: str, choices: List[Dict[str, Any]]) -> Optional[str]:
+        self.recorder.write(OUTBOUND, user_id, _outbound_choice(self.recorder.mask(user_id, prompt), choices))
+        return await self.inner.get_choice(user_id, prompt, choices)
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+
+class RecordingHttpClient:
+    """Обертка HttpClient: записывает ответ (или ошибку) каждого запроса блока"""
+    def __init__(self, inner, recorder: "Recorder"):
+        self.inner = inner
+        self.recorder = recorder
+
+    async def request(self, params: Dict[str, Any], context: Optional[Tuple[str, str]] = None):
+        block_id = context[1] if context else None
+        started = time.monotonic()
+        try:
+            status, data = await self.inner.request(params, context)
+        except Exception as e:
+            self.recorder.write(HTTP, _current_user.get(), [block_id, None, f"{type(e).__name__}: {e}",
+                                                            round((time.monotonic() - started) * 1000, 1)])
+            raise
+        self.recorder.write(HTTP, _current_user.get(), [block_id, status, data,
+                                                        round((time.monotonic() - started) * 1000, 1)])
+        return status, data
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+
+class Recorder:
+    FLUSH_EVERY = 500       # Строк в буфере до фоновой записи в файл
+    MIN_MASKED_ID = 5       # Короткие user_id (тесты) не маскируются в текстах - совпали бы с числами
+
+    def __init__(self, path: str, salt: Optional[bytes] = None):
+        self.path = path
+        self._salt = salt or os.urandom(16)
+        self._started = time.monotonic()
+        self._buffer: List[str] = []
+        self._anon: Dict[int, int] = {}
+        self._masks: Dict[int, List[Tuple["re.Pattern", str]]] = {}
+        self._writes = set()
+        self.counters = {
+            "events": 0,
+            "write_errors": 0,
+        }
+
+    def anonymize(self, user_id: Optional[int]) -> Optional[int]:
+        if user_id is None:
+            return None
+        anon = self._anon.get(user_id)
+        if anon is None:
+            digest = hmac.new(self._salt, str(user_id).encode("utf-8"), hashlib.sha256).digest()
+            anon = self._anon[user_id] = int.from_bytes(digest[:6], "big")
+        return anon
+
+    def remember_user(self, user_id: int, init_meta: Dict[str, Any]):
+        # Длинные значения заменяются первыми, чтобы имя внутри username не разбило его;
+        # только целыми словами, чтобы user_id не задел числа в тексте
+        pairs = [(str(init_meta.get(key) or ""), placeholder) for key, placeholder in REPLAY_META.items()]
+        if len(str(user_id)) >= self.MIN_MASKED_ID:
+            pairs.append((str(user_id), str(self.anonymize(user_id))))
+        pairs = sorted((p for p in pairs if len(p[0]) > 1), key=lambda p: -len(p[0]))
+        self._masks[user_id] = [(re.compile(r"(?<!\w)" + re.escape(value) + r"(?!\w)"), placeholder)
+                                for value, placeholder in pairs]
+
+    def mask(self, user_id: int, text: str) -> str:
+        for pattern, placeholder in self._masks.get(user_id, ()):
+            text = pattern.sub(lambda _: placeholder, text)
+        return text
+
+    def write(self, kind: str, user_id: Optional[int], data: Any):
+        offset = round((time.monotonic() - self._started) * 1000, 1)
+        self._buffer.append(json.dumps([offset, kind, self.anonymize(user_id), data],
+                                       ensure_ascii=False, separators=(",", ":"), default=str))
+        self.counters["events"] += 1
+        if len(self._buffer) >= self.FLUSH_EVERY:
+            try:
+                task = asyncio.get_running_loop().create_task(self.flush())
+            except RuntimeError:
+                return
+            self._writes.add(task)
+            task.add_done_callback(self._writes.discard)
+
+    def _append(self, lines: List[str]):
+        with _open(self.path, "a") as f:
+            f.write("\n".join(lines) + "\n")
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        try:
+            await asyncio.to_thread(self._append, lines)
+        except OSError as e:
+            self.counters["write_errors"] += 1
+            logger.error(f"Failed to write {len(lines)} recorded events: {e}")
+
+    async def close(self):
+        await asyncio.gather(*list(self._writes), return_exceptions=True)
+        await self.flush()
+
+    def attach(self, interpreter):
+        """Подключает запись к интерпретатору: входящие события, исходящие вызовы и HTTP"""
+        start_dialog, resume_dialog = interpreter.start_dialog, interpreter.resume_dialog
+        timer_prefix = interpreter.TIMER_EVENT_PREFIX
+
+        async def recorded_start(user_id, init_meta, *args, **kwargs):
+            self.remember_user(user_id, init_meta)
+            self.write(START, user_id, None)
+            _current_user.set(user_id)
+            return await start_dialog(user_id, init_meta, *args, **kwargs)
+
+        async def recorded_resume(user_id, input_data):
+            if isinstance(input_data, str) and input_data.startswith(timer_prefix):
+                # ID таймера при воспроизведении будет другим - пишем только факт срабатывания
+                self.write(TIMER, user_id, None)
+            else:
+                # Пользователь может ввести свое имя: без маски оно попадет в журнал и разойдется с ответом бота
+                self.write(RESUME, user_id, self.mask(user_id, input_data) if isinstance(input_data, str) else input_data)
+            _current_user.set(user_id)
+            return await resume_dialog(user_id, input_data)
+
+        interpreter.start_dialog = recorded_start
+        interpreter.resume_dialog = recorded_resume
+        interpreter.api = RecordingBotAPI(interpreter.api, self)
+        interpreter.http = RecordingHttpClient(interpreter.http, self)
+        return interpreter
+
+
+# -------------------------
+# Воспроизведение
+# -------------------------
+
+def load_log(path: str) -> List[list]:
+    with _open(path, "r") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    # Пачки пишутся в фоне и могут лечь в файл не по порядку
+    records.sort(key=lambda r: r[0])
+    return records
+
+
+class ReplayAPI(BotAPI):
+    """Поддельный API: исходящие вызовы в формате журнала, по пользователям"""
+    def __init__(self):
+        self.outbound: Dict[int, List[list]] = defaultdict(list)
+
+    async def send_message(self, user_id: int, text: str):
+        self.outbound[user_id].append(["m", text])
+
+    async def get_message(self, user_id: int, prompt: Optional[str] = None) -> Optional[str]:
+        if prompt:
+            await self.send_message(user_id, prompt)
+        return None
+
+    async def get_choice(self, user_id: int, prompt: str, choices: List[Dict[str, Any]]) -> Optional[str]:
+        self.outbound[user_id].append(_outbound_choice(prompt, choices))
+        return None
+
+
+class StubHttpClient:
+    """Записанные ответы по (пользователь, блок) в порядке поступления; задержка - исходная / speed"""
+    def __init__(self, records: List[list], speed: Optional[float]):
+        self.speed = speed
+        self.missing = 0
+        self._responses: Dict[Tuple[Optional[int], Optional[str]], deque] = defaultdict(deque)
+        for _, _, user_id, data in records:
+            self._responses[(user_id, data[0])].append(data)
+
+    async def request(self, params: Dict[str, Any], context: Optional[Tuple[str, str]] = None):
+        queue = self._responses.get((_current_user.get(), context[1] if context else None))
+        if not queue:
+            self.missing += 1
+            raise ConnectionError("No recorded response")
+        _, status, data, duration_ms = queue.popleft()
+        if self.speed:
+            await asyncio.sleep(duration_ms / 1000 / self.speed)
+        if status is None:
+            raise ConnectionError(data)
+        return status, data
+
+    async def close(self):
+        pass
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+class Replayer:
+    def __init__(self, model: Dict[str, Any], core: Dict[str, Any], speed: Optional[float] = 1.0):
+        """
+        core - модули ядра (load_core), speed - 1 (исходный темп), N (в N раз быстрее), None (без пауз).
+        """
+        self.model = model
+        self.core = core
+        self.speed = speed
+
+    async def run(self, records: List[list]) -> Dict[str, Any]:
+        inbound = [r for r in records if r[1] in (START, RESUME, TIMER)]
+        api = ReplayAPI()
+        http = StubHttpClient([r for r in records if r[1] == HTTP], self.speed)
+        storage = self.core["MemoryStorage"]()
+        # Планировщик не запускается: таймеры срабатывают по записанным событиям t
+        interpreter = self.core["BotInterpreter"](self.model, api, storage, scheduler=self.core["TimerScheduler"](),
+                                                  http_client=http)
+
+        latencies: Dict[str, List[float]] = defaultdict(list)
+        chains: Dict[int, asyncio.Task] = {}
+        errors = 0
+
+        async def handle(event, previous: Optional[asyncio.Task]):
+            nonlocal errors
+            if previous is not None:
+                # События одного пользователя - строго по порядку, разных - параллельно
+                await asyncio.gather(previous, return_exceptions=True)
+            # Задержка - от момента, когда событие могло начать обрабатываться, включая ожидание event loop
+            began = time.perf_counter()
+            _, kind, user_id, data = event
+            _current_user.set(user_id)
+            try:
+                if kind == START:
+                    await interpreter.start_dialog(user_id, dict(REPLAY_META))
+                elif kind == RESUME:
+                    await interpreter.resume_dialog(user_id, data)
+                else:
+                    session = await storage.load_state(user_id)
+                    timer = (session or {}).get("timer")
+                    if timer:
+                        await interpreter.resume_dialog(user_id, interpreter.TIMER_EVENT_PREFIX + timer["id"])
+            except Exception as e:
+                errors += 1
+                logger.error(f"Replay event {kind} for user {user_id} failed: {e}")
+            latencies[kind].append(time.perf_counter() - began)
+
+        started = time.perf_counter()
+        for event in inbound:
+            if self.speed:
+                delay = event[0] / 1000 / self.speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            user_id = event[2]
+            chains[user_id] = asyncio.get_running_loop().create_task(
+                handle(event, chains.get(user_id)))
+        await asyncio.gather(*chains.values(), return_exceptions=True)
+        elapsed = time.perf_counter() - started
+
+        return {
+            "elapsed": elapsed,
+            "events": len(inbound),
+            "errors": errors,
+            "http_missing": http.missing,
+            "latency": {kind: sorted(values) for kind, values in latencies.items()},
+            "diff": diff_outbound(records, api.outbound),
+        }
+
+
+def diff_outbound(records: List[list], replayed: Dict[int, List[list]]) -> Dict[int, Tuple[int, Any, Any]]:
+    """user_id -> (номер первого расходящегося вызова, записано, воспроизведено)"""
+    recorded: Dict[int, List[list]] = defaultdict(list)
+    for _, kind, user_id, data in records:
+        if kind == OUTBOUND:
+            recorded[user_id].append(data)
+
+    diffs = {}
+    for user_id in recorded.keys() | replayed.keys():
+        a, b = recorded.get(user_id, []), replayed.get(user_id, [])
+        if a == b:
+            continue
+        idx = next((i for i, (x, y) in enumerate(zip(a, b)) if x != y), min(len(a), len(b)))
+        diffs[user_id] = (idx, a[idx] if idx < len(a) else None, b[idx] if idx < len(b) else None)
+    return diffs
+
+
+def print_report(report: Dict[str, Any], max_diffs: int = 5):
+    print(f"{report['events']} событий за {report['elapsed']:.3f} с "
+          f"({report['events'] / report['elapsed']:.0f} событий/с), ошибок: {report['errors']}, "
+          f"нет записанного HTTP-ответа: {report['http_missing']}")
+    names = {START: "start", RESUME: "resume", TIMER: "timer"}
+    for kind, values in report["latency"].items():
+        print(f"  {names[kind]:>6}: n={len(values):<7} p50={percentile(values, 0.5) * 1000:8.2f} мс  "
+              f"p90={percentile(values, 0.9) * 1000:8.2f} мс  p99={percentile(values, 0.99) * 1000:8.2f} мс  "
+              f"max={values[-1] * 1000:8.2f} мс")
+
+    diffs = report["diff"]
+    if not diffs:
+        print("✅ Исходящие сообщения совпадают с записью")
+        return
+    print(f"❌ Расхождения у {len(diffs)} пользователей")
+    for user_id, (idx, recorded, replayed) in list(diffs.items())[:max_diffs]:
+        print(f"   пользователь {user_id}, вызов {idx}: записано {recorded!r}, воспроизведено {replayed!r}")
+
+
+def load_core(path: Optional[str] = None) -> Dict[str, Any]:
+    """Модули ядра интерпретатора: из текущего дерева или из другого (сравнение сборок)"""
+    if path:
+        sys.path.insert(0, os.path.abspath(path))
+    return {
+        "BotInterpreter": importlib.import_module("bot_interpreter").BotInterpreter,
+        "MemoryStorage": importlib.import_module("state_storage").MemoryStorage,
+        "TimerScheduler": importlib.import_module("timers").TimerScheduler,
+        "parse_bot_config_from_file": importlib.import_module("validator").parse_bot_config_from_file,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение записанных диалогов")
+    parser.add_argument("log", help="Журнал Recorder (.jsonl или .jsonl.gz)")
+    parser.add_argument("model", nargs="?", default="bot_model.json")
+    parser.add_argument("--speed", default="max", help="1 - исходный темп, N - в N раз быстрее, max - без пауз")
+    parser.add_argument("--core", default=None, help="Каталог с другой сборкой интерпретатора")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    core = load_core(args.core)
+    model = core["parse_bot_config_from_file"](args.model)
+    speed = None if args.speed == "max" else float(args.speed)
+
+    report = asyncio.run(Replayer(model, core, speed).run(load_log(args.log)))
+    print_report(report)
+    sys.exit(0 if not report["diff"] and not report["errors"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,455 @@
+# script_runner.py
+"""
+Выполнение блоков script: короткий пользовательский Python в пуле процессов.
+
+- Ограниченное подмножество языка: без import, global/nonlocal, async и имен с "_"; атрибуты и встроенные
+  функции - только из белых списков (+ модуль math). Проверка - по AST при загрузке модели.
+- Процессы пула, запущенные от root, сбрасывают привилегии до непривилегированного пользователя (nobody)
+  и не могут порождать новые процессы (RLIMIT_NPROC).
+- Пул процессов создается и прогревается заранее (start), event loop только ждет future.
+- В каждом процессе лимит памяти (RLIMIT_AS) и лимит процессорного времени на вызов (ITIMER_PROF).
+  Исключение лимита - BaseException, перехватить его скрипт не может (bare except, except BaseException
+  и break/continue/return в finally запрещены), а таймер повторяется, пока вызов не завершится;
+  зависший в C-коде вызов прерывается по wall-таймауту вместе с пулом.
+- Переменные передаются компактно: в процесс уходят только те, которые скрипт читает,
+  обратно - только присвоенные им, в JSON (объекты из песочницы не распаковываются в раннере).
+- Для скриптов с pure=true результат кэшируется по хэшу кода и входных переменных.
+- Одновременно выполняется не больше max_pending вызовов (по умолчанию - по одному на процесс);
+  остальные ждут слота не дольше queue_timeout и завершаются ScriptBusy (ветка ошибки блока).
+"""
+import ast
+import asyncio
+import builtins
+import hashlib
+import json
+import logging
+import math
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ScriptError(ValueError):
+    """Скрипт не прошел проверку или завершился ошибкой"""
+
+
+class ScriptBusy(ScriptError):
+    """Пул перегружен: свободный слот не появился за queue_timeout"""
+
+
+SAFE_BUILTINS = {
+    name: getattr(builtins, name)
+    for name in (
+        "abs", "all", "any", "bool", "dict", "divmod", "enumerate", "filter", "float", "int",
+        "isinstance", "len", "list", "map", "max", "min", "pow", "range", "reversed", "round",
+        "set", "sorted", "str", "sum", "tuple", "zip",
+        "ValueError", "TypeError", "KeyError", "IndexError", "ZeroDivisionError", "Exception",
+    )
+}
+SCRIPT_GLOBALS = frozenset(SAFE_BUILTINS) | {"math"}
+
+_FORBIDDEN_NODES = (ast.Import, ast.ImportFrom, ast.Global, ast.Nonlocal, ast.ClassDef,
+                    ast.AsyncFunctionDef, ast.Await, ast.AsyncFor, ast.AsyncWith, ast.With,
+                    ast.Yield, ast.YieldFrom)
+
+# Атрибуты - только из белого списка: методы str/list/dict/set/tuple, числа, модуль math и args исключения.
+# Атрибуты генераторов, кадров и трейсбэков (gi_frame, f_back, f_globals, tb_frame...) ведут к глобальным
+# переменным процесса пула, а str.format умеет обращаться к атрибутам ("{0.__class__}") - их в списке нет.
+ALLOWED_ATTRS = frozenset({
+    # str
+    "capitalize", "casefold", "center", "count", "endswith", "expandtabs", "find", "index", "isalnum",
+    "isalpha", "isascii", "isdecimal", "isdigit", "isidentifier", "islower", "isnumeric", "isprintable",
+    "isspace", "istitle", "isupper", "join", "ljust", "lower", "lstrip", "partition", "removeprefix",
+    "removesuffix", "replace", "rfind", "rindex", "rjust", "rpartition", "rsplit", "rstrip", "split",
+    "splitlines", "startswith", "strip", "swapcase", "title", "upper", "zfill",
+    # list, tuple
+    "append", "clear", "copy", "extend", "insert", "pop", "remove", "reverse", "sort",
+    # dict
+    "fromkeys", "get", "items", "keys", "popitem", "setdefault", "update", "values",
+    # set
+    "add", "difference", "difference_update", "discard", "intersection", "intersection_update",
+    "isdisjoint", "issubset", "issuperset", "symmetric_difference", "symmetric_difference_update", "union",
+    # int, float
+    "as_integer_ratio", "bit_count", "bit_length", "conjugate", "denominator", "imag", "is_integer",
+    "numerator", "real",
+    # исключения
+    "args",
+    # math
+    "acos", "acosh", "asin", "asinh", "atan", "atan2", "atanh", "ceil", "comb", "copysign", "cos", "cosh",
+    "degrees", "dist", "e", "erf", "erfc", "exp", "expm1", "fabs", "factorial", "floor", "fmod", "frexp",
+    "fsum", "gamma", "gcd", "hypot", "inf", "isclose", "isfinite", "isinf", "isnan", "isqrt", "lcm", "ldexp",
+    "lgamma", "log", "log10", "log1p", "log2", "modf", "nan", "perm", "pi", "prod", "radians", "remainder",
+    "sin", "sinh", "sqrt", "tan", "tanh", "tau", "trunc",
+})
+
+
+@dataclass(frozen=True)
+class ScriptInfo:
+    hash: str
+    source: str
+    reads: FrozenSet[str]       # Переменные сессии, которые скрипт может прочитать
+    writes: FrozenSet[str]      # Имена, присвоенные на верхнем уровне (кандидаты на выход)
+
+
+class _TopLevelStores(ast.NodeVisitor):
+    """Присваивания верхнего уровня: тела функций и comprehension - свои области видимости"""
+    def __init__(self):
+        self.names = set()
+        self.functions = set()
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Store):
+            self.names.add(node.id)
+
+    def visit_FunctionDef(self, node):
+        self.functions.add(node.name)
+
+    def visit_Lambda(self, node):
+        pass
+
+    visit_ListComp = visit_SetComp = visit_DictComp = visit_GeneratorExp = visit_Lambda
+
+
+_TRY_NODES = (ast.Try, getattr(ast, "TryStar", ast.Try))
+
+
+def _check_handlers(node: ast.AST):
+    """Лимит процессорного времени - BaseException: скрипт не должен уметь его перехватить или погасить"""
+    if isinstance(node, ast.ExceptHandler):
+        caught = node.type.elts if isinstance(node.type, ast.Tuple) else [node.type]
+        for exc in caught:
+            if exc is None or (isinstance(exc, ast.Name) and exc.id == "BaseException"):
+                raise ScriptError(f"Перехват всех исключений (except: / except BaseException) недоступен "
+                                  f"в скриптах (строка {node.lineno})")
+    if isinstance(node, _TRY_NODES):
+        for stmt in node.finalbody:
+            for inner in ast.walk(stmt):
+                if isinstance(inner, (ast.Break, ast.Continue, ast.Return)):
+                    raise ScriptError(f"{type(inner).__name__} в блоке finally недоступен в скриптах "
+                                      f"(строка {inner.lineno})")
+
+
+def analyze_script(source: str) -> ScriptInfo:
+    """Синтаксис + ограничения подмножества. Бросает ScriptError."""
+    try:
+        tree = ast.parse(source, mode="exec")
+    except SyntaxError as e:
+        raise ScriptError(f"Синтаксическая ошибка в строке {e.lineno}: {e.msg}")
+
+    reads = set()
+    for node in ast.walk(tree):
+        if isinstance(node, _FORBIDDEN_NODES):
+            raise ScriptError(f"Конструкция {type(node).__name__} недоступна в скриптах (строка {node.lineno})")
+        _check_handlers(node)
+        if isinstance(node, ast.Attribute) and node.attr not in ALLOWED_ATTRS:
+            raise ScriptError(f"Атрибут '{node.attr}' недоступен в скриптах (строка {node.lineno})")
+        if isinstance(node, ast.Name):
+            if node.id.startswith("_"):
+                raise ScriptError(f"Имя '{node.id}' недоступно в скриптах (строка {node.lineno})")
+            if isinstance(node.ctx, ast.Load) and node.id not in SCRIPT_GLOBALS:
+                reads.add(node.id)
+
+    stores = _TopLevelStores()
+    for stmt in tree.body:
+        stores.visit(stmt)
+    digest = hashlib.blake2b(source.encode("utf-8"), digest_size=16).hexdigest()
+    return ScriptInfo(digest, source, frozenset(reads), frozenset(stores.names - stores.functions))
+
+
+# -------------------------
+# Сторона процесса пула
+# -------------------------
+
+_code_cache: "OrderedDict[str, Any]" = OrderedDict()
+_CODE_CACHE_SIZE = 256
+
+
+# Если скрипт все же продолжил работу после сигнала (например, в finally), сигнал повторяется с этим шагом
+_CPU_LIMIT_REPEAT = 0.05
+_cpu_armed = False
+
+
+class _CpuLimitExceeded(BaseException):
+    # Не Exception: except Exception в скрипте не должен гасить лимит
+    pass
+
+
+def _on_cpu_limit(signum, frame):
+    # Сигнал, пришедший уже после вызова, игнорируется
+    if _cpu_armed:
+        raise _CpuLimitExceeded()
+
+
+def _drop_privileges(run_as: Optional[str]):
+    """Процесс пула, запущенный от root, переходит под run_as. Ошибка здесь ломает пул - скрипты не
+    выполняются от root."""
+    import os
+
+    if run_as and hasattr(os, "geteuid") and os.geteuid() == 0:
+        import pwd
+
+        entry = pwd.getpwnam(run_as)
+        os.setgroups([])
+        os.setgid(entry.pw_gid)
+        os.setuid(entry.pw_uid)
+    try:
+        import resource
+        # Новые процессы (fork/popen) из скрипта недоступны, даже если песочницу обойдут
+        resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+    except (ImportError, ValueError, OSError) as e:
+        logger.warning(f"Script worker: process limit not applied: {e}")
+
+
+def _init_worker(memory_limit: Optional[int], run_as: Optional[str] = None):
+    import signal
+
+    if memory_limit:
+        try:
+            import resource
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+        except (ImportError, ValueError, OSError) as e:
+            logger.warning(f"Script worker: memory limit not applied: {e}")
+    _drop_privileges(run_as)
+    if hasattr(signal, "ITIMER_PROF"):
+        signal.signal(signal.SIGPROF, _on_cpu_limit)
+
+
+def _warmup() -> int:
+    import os
+    return os.getpid()
+
+
+def execute_script(script_hash: str, source: str, inputs_json: str, outputs: Tuple[str, ...],
+                   cpu_limit: Optional[float]) -> str:
+    """Выполняется в процессе пула (или inline в превью). Возвращает JSON {"ok", "vars"|"error"}."""
+    import signal
+    global _cpu_armed
+
+    code = _code_cache.get(script_hash)
+    if code is None:
+        code = _code_cache[script_hash] = compile(source, "<script>", "exec")
+        if len(_code_cache) > _CODE_CACHE_SIZE:
+            _code_cache.popitem(last=False)
+    else:
+        _code_cache.move_to_end(script_hash)
+
+    scope = {"__builtins__": SAFE_BUILTINS, "math": math}
+    scope.update(json.loads(inputs_json))
+    use_timer = bool(cpu_limit) and hasattr(signal, "ITIMER_PROF")
+    try:
+        if use_timer:
+            _cpu_armed = True
+            signal.setitimer(signal.ITIMER_PROF, cpu_limit, _CPU_LIMIT_REPEAT)
+        try:
+            exec(code, scope)
+        finally:
+            if use_timer:
+                _cpu_armed = False
+                signal.setitimer(signal.ITIMER_PROF, 0)
+        result = {name: scope[name] for name in outputs if name in scope and not callable(scope[name])}
+        return json.dumps({"ok": True, "vars": result}, ensure_ascii=False, separators=(",", ":"))
+    except _CpuLimitExceeded:
+        return json.dumps({"ok": False, "error": f"CPU time limit {cpu_limit}s exceeded"})
+    except MemoryError:
+        return json.dumps({"ok": False, "error": "Memory limit exceeded"})
+    except Exception as e:
+        # В том числе выходные значения, которые нельзя сериализовать в JSON
+        return json.dumps({"ok": False, "error": f"{type(e).__name__}: {e}"})
+
+
+# -------------------------
+# Сторона раннера
+# -------------------------
+
+class ScriptRunner:
+    # Pyodide (превью) не умеет процессы: там скрипт выполняется inline с теми же ограничениями подмножества
+    INLINE = sys.platform == "emscripten"
+
+    def __init__(self, workers: int = 2, max_pending: Optional[int] = None, cpu_limit: float = 1.0,
+                 wall_timeout: float = 5.0, memory_limit: Optional[int] = 256 * 1024 * 1024,
+                 queue_timeout: float = 2.0, cache_size: int = 10_000, run_as: Optional[str] = "nobody"):
+        self.workers = workers
+        # Очередь - на семафоре, а не внутри пула: wall_timeout считает только время выполнения
+        self.max_pending = max_pending or workers
+        self.cpu_limit = cpu_limit
+        self.wall_timeout = wall_timeout
+        self.memory_limit = memory_limit
+        # Пользователь процессов пула, если раннер запущен от root
+        self.run_as = run_as
+        self.queue_timeout = queue_timeout
+        self.cache_size = cache_size
+
+        self._pool = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._start_lock: Optional[asyncio.Lock] = None
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.counters = {
+            "runs": 0,
+            "cache_hits": 0,
+            "errors": 0,
+            "busy": 0,
+            "pool_restarts": 0,
+        }
+
+    # -------------------------
+    # Пул
+    # -------------------------
+
+    def _create_pool(self):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        # spawn: процессы не наследуют память и сокеты раннера
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_worker, initargs=(self.memory_limit, self.run_as))
+
+    async def start(self):
+        """Создает и прогревает пул: к первому сообщению пользователя процессы уже запущены"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+            self._start_lock = asyncio.Lock()
+        if self.INLINE:
+            return
+        async with self._start_lock:
+            if self._pool is not None:
+                return
+            started = time.monotonic()
+            self._pool = self._create_pool()
+            loop = asyncio.get_running_loop()
+            pids = await asyncio.gather(*(loop.run_in_executor(self._pool, _warmup) for _ in range(self.workers)))
+            logger.info(f"Script pool ready: {len(set(pids))} processes in {time.monotonic() - started:.2f}s")
+
+    async def stop(self):
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await asyncio.to_thread(pool.shutdown, True, cancel_futures=True)
+
+    def _kill_pool(self):
+        # Процесс, зависший в C-коде, не прерывается ни таймером, ни cancel - пул пересоздается
+        pool, self._pool = self._pool, None
+        if pool is None:
+            return
+        for process in list(getattr(pool, "_processes", {}).values()):
+            process.kill()
+        pool.shutdown(wait=False, cancel_futures=True)
+        self.counters["pool_restarts"] += 1
+
+    # -------------------------
+    # Вызов
+    # -------------------------
+
+    async def run(self, script: ScriptInfo, variables: Dict[str, Any], outputs: Optional[Tuple[str, ...]] = None,
+                  pure: bool = False, cpu_limit: Optional[float] = None) -> Dict[str, Any]:
+        """Возвращает присвоенные скриптом переменные. Бросает ScriptError / ScriptBusy."""
+        if self._slots is None or (self._pool is None and not self.INLINE):
+            await self.start()
+
+        outputs = tuple(sorted(outputs if outputs is not None else script.writes))
+        inputs = {name: variables[name] for name in script.reads if name in variables}
+        try:
+            inputs_json = json.dumps(inputs, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        except (TypeError, ValueError) as e:
+            raise ScriptError(f"Переменные нельзя передать в скрипт: {e}")
+
+        cache_key = None
+        if pure:
+            cache_key = hashlib.blake2b((script.hash + "|" + ",".join(outputs) + "|" + inputs_json).encode("utf-8"),
+                                       digest_size=16).hexdigest()
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                self._cache.move_to_end(cache_key)
+                self.counters["cache_hits"] += 1
+                return dict(cached)
+
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.counters["busy"] += 1
+            raise ScriptBusy(f"Script pool is busy ({self.max_pending} calls in progress)")
+        try:
+            self.counters["runs"] += 1
+            args = (script.hash, script.source, inputs_json, outputs, cpu_limit or self.cpu_limit)
+            if self.INLINE:
+                # Без обработчика SIGPROF таймер завершил бы сам процесс
+                raw = execute_script(*args[:-1], None)
+            else:
+                future = asyncio.get_running_loop().run_in_executor(self._pool, execute_script, *args)
+                try:
+                    raw = await asyncio.wait_for(future, self.wall_timeout)
+                except asyncio.TimeoutError:
+                    self._kill_pool()
+                    raise ScriptError(f"Script did not finish in {self.wall_timeout}s")
+        except ScriptError:
+            self.counters["errors"] += 1
+            raise
+        except Exception as e:
+            # BrokenProcessPool: процесс убит (например, OOM) - следующий вызов создаст пул заново
+            self.counters["errors"] += 1
+            self._kill_pool()
+            raise ScriptError(f"Script worker failed: {type(e).__name__}: {e}")
+        finally:
+            self._slots.release()
+
+        result = json.loads(raw)
+        if not result["ok"]:
+            self.counters["errors"] += 1
+            raise ScriptError(result["error"])
+
+        if cache_key is not None:
+            self._cache[cache_key] = result["vars"]
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result["vars"]
+
+
+# -------------------------
+# Бенчмарк: пул против inline и кэш чистых скриптов
+# -------------------------
+
+if __name__ == "__main__":
+    async def bench():
+        script = analyze_script(
+            "total = 0\n"
+            "for i in range(n):\n"
+            "    total += i * i % 7\n"
+            "label = 'big' if total > 1000 else 'small'\n"
+        )
+        runner = ScriptRunner(workers=4)
+        started = time.perf_counter()
+        await runner.start()
+        print(f"прогрев пула: {(time.perf_counter() - started) * 1000:.0f} мс")
+
+        async def lag_probe():
+            # Event loop продолжает обслуживать других, пока скрипты считаются в процессах
+            while True:
+                before = time.perf_counter()
+                await asyncio.sleep(0.001)
+                max_lag[0] = max(max_lag[0], time.perf_counter() - before - 0.001)
+        max_lag = [0.0]
+        probe = asyncio.get_running_loop().create_task(lag_probe())
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(runner.run(script, {"n": 20_000 + i}) for i in range(200)),
+                                       return_exceptions=True)
+        elapsed = time.perf_counter() - started
+        probe.cancel()
+        print(f"200 вызовов: {elapsed * 1000:.0f} мс, макс. задержка event loop: {max_lag[0] * 1000:.1f} мс, "
+              f"отказов (busy): {sum(isinstance(r, ScriptBusy) for r in results)}")
+
+        started = time.perf_counter()
+        for _ in range(1000):
+            await runner.run(script, {"n": 20_000}, pure=True)
+        print(f"pure, 1000 вызовов с одинаковым входом: {(time.perf_counter() - started) * 1000:.1f} мс")
+
+        try:
+            await runner.run(analyze_script("while True:\n    pass\n"), {}, cpu_limit=0.2)
+        except ScriptError as e:
+            print(f"бесконечный цикл: {e}")
+        print(runner.counters)
+        await runner.stop()
+
+    asyncio.run(bench())
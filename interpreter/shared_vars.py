@@ -0,0 +1,406 @@
+# shared_vars.py
+"""
+Общие переменные бота - одни на всех пользователей: остаток мест, номер билета, счетчик голосов.
+
+global_vars копируются в сессию при старте диалога, поэтому состояние на весь бот в них не сохранить.
+Здесь каждая операция атомарна: get, set, incr (с необязательными границами min/max) и cas
+(compare-and-set). Результат операции - пара (ok, value): value - значение после операции,
+ok=False, если incr вышел бы за границу или cas не совпал с ожидаемым значением.
+
+LocalSharedStore - один процесс: значения в памяти, операция выполняется без await между чтением
+и записью, поэтому в event loop она атомарна без блокировок. Измененные ключи раз в flush_interval
+пачкой сохраняются в backend (файл или Postgres).
+
+PostgresSharedStore - несколько воркеров: источник истины - таблица. Ключи разбиты на шарды;
+пока транзакция шарда идет, новые операции копятся и применяются следующей транзакцией одной пачкой
+(по порядку поступления, под блокировкой строк). Число транзакций растет не с числом операций,
+а с числом тиков, в которые они пришли.
+"""
+import asyncio
+import json
+import logging
+import os
+import zlib
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+GET = "get"
+SET = "set"
+INCR = "incr"
+CAS = "cas"
+OPERATIONS = (GET, SET, INCR, CAS)
+
+Op = Tuple        # (GET,) | (SET, value) | (INCR, delta, min, max) | (CAS, expected, new)
+Result = Tuple[bool, Any]
+
+
+def apply_op(current: Any, op: Op) -> Tuple[Any, Result]:
+    """Чистая функция: (текущее значение, операция) -> (новое значение, результат)"""
+    kind = op[0]
+    if kind == GET:
+        return current, (True, current)
+    if kind == SET:
+        return op[1], (True, op[1])
+    if kind == INCR:
+        _, delta, low, high = op
+        value = (current or 0) + delta
+        if (low is not None and value < low) or (high is not None and value > high):
+            return current, (False, current)
+        return value, (True, value)
+    if kind == CAS:
+        _, expected, new = op
+        if current == expected:
+            return new, (True, new)
+        return current, (False, current)
+    raise ValueError(f"Unknown shared variable operation: {kind}")
+
+
+class SharedStore(ABC):
+    """Общий интерфейс хранилищ; execute(name, op) реализуют наследники"""
+    def __init__(self, bot: str = ""):
+        self.bot = bot
+        self.counters = {
+            "operations": 0,
+            "rejected": 0,
+        }
+
+    @abstractmethod
+    async def execute(self, name: str, op: Op) -> Result:
+        """Атомарно выполнить операцию над переменной name"""
+        pass
+
+    async def get(self, name: str) -> Any:
+        return (await self.execute(name, (GET,)))[1]
+
+    async def set(self, name: str, value: Any) -> Any:
+        return (await self.execute(name, (SET, value)))[1]
+
+    async def incr(self, name: str, delta: float = 1, min: Optional[float] = None,
+                   max: Optional[float] = None) -> Result:
+        return await self.execute(name, (INCR, delta, min, max))
+
+    async def cas(self, name: str, expected: Any, new: Any) -> Result:
+        return await self.execute(name, (CAS, expected, new))
+
+    def _count(self, result: Result) -> Result:
+        self.counters["operations"] += 1
+        if not result[0]:
+            self.counters["rejected"] += 1
+        return result
+
+    async def load(self):
+        pass
+
+    def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+# -------------------------
+# Хранилища значений
+# -------------------------
+
+class FileSharedBackend:
+    """Снимок всех значений в JSON-файле (атомарная замена): {bot: {name: value}}"""
+    def __init__(self, path: str):
+        self.path = path
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save(self, bot: str, values: Dict[str, Any]):
+        data = self._read()
+        data.setdefault(bot, {}).update(values)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    async def load(self, bot: str) -> Dict[str, Any]:
+        return (await asyncio.to_thread(self._read)).get(bot, {})
+
+    async def save(self, bot: str, values: Dict[str, Any]):
+        await asyncio.to_thread(self._save, bot, values)
+
+
+class PostgresSharedBackend:
+    """
+    Таблица shared_variables (bot_id, name, value JSONB) в базе редактора.
+    apply() выполняет пачку операций одной транзакцией: строки блокируются в порядке имен,
+    поэтому транзакции разных воркеров и шардов не взаимоблокируются.
+    """
+    def __init__(self, dsn: str, max_connections: int = 8):
+        self.dsn = dsn
+        self.max_connections = max_connections
+        self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            from psycopg2.pool import ThreadedConnectionPool
+            self._pool = ThreadedConnectionPool(1, self.max_connections, self.dsn)
+        return self._pool
+
+    def _run(self, fn, *args):
+        pool = self._get_pool()
+        conn = pool.getconn()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    return fn(cur, *args)
+        finally:
+            pool.putconn(conn)
+
+    @staticmethod
+    def _upsert(cur, bot: str, values: Dict[str, Any]):
+        from psycopg2.extras import Json, execute_values
+
+        execute_values(
+            cur,
+            """
+            INSERT INTO shared_variables (bot_id, name, value) VALUES %s
+            ON CONFLICT (bot_id, name) DO UPDATE SET value = EXCLUDED.value, updated_at = now()
+            """,
+            [(bot, name, Json(value)) for name, value in values.items()],
+        )
+
+    @staticmethod
+    def _load(cur, bot: str) -> Dict[str, Any]:
+        cur.execute("SELECT name, value FROM shared_variables WHERE bot_id = %s", (bot,))
+        return {name: value for name, value in cur.fetchall()}
+
+    @classmethod
+    def _apply(cls, cur, bot: str, batch: Dict[str, List[Op]]) -> Dict[str, List[Result]]:
+        from psycopg2.extras import execute_values
+
+        names = sorted(batch)
+        # Строки создаются заранее, чтобы FOR UPDATE блокировал и новые переменные
+        execute_values(cur, "INSERT INTO shared_variables (bot_id, name) VALUES %s ON CONFLICT DO NOTHING",
+                       [(bot, name) for name in names])
+        cur.execute(
+            "SELECT name, value FROM shared_variables WHERE bot_id = %s AND name = ANY(%s) ORDER BY name FOR UPDATE",
+            (bot, names),
+        )
+        current = {name: value for name, value in cur.fetchall()}
+
+        results: Dict[str, List[Result]] = {}
+        changed = {}
+        for name in names:
+            value = current.get(name)
+            out = results[name] = []
+            for op in batch[name]:
+                new_value, result = apply_op(value, op)
+                out.append(result)
+                if op[0] != GET and result[0]:
+                    value = new_value
+                    changed[name] = value
+        if changed:
+            cls._upsert(cur, bot, changed)
+        return results
+
+    async def load(self, bot: str) -> Dict[str, Any]:
+        return await asyncio.to_thread(self._run, self._load, bot)
+
+    async def save(self, bot: str, values: Dict[str, Any]):
+        await asyncio.to_thread(self._run, self._upsert, bot, values)
+
+    async def apply(self, bot: str, batch: Dict[str, List[Op]]) -> Dict[str, List[Result]]:
+        return await asyncio.to_thread(self._run, self._apply, bot, batch)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
+
+
+# -------------------------
+# Один процесс: память + отложенная запись
+# -------------------------
+
+class LocalSharedStore(SharedStore):
+    def __init__(self, backend=None, bot: str = "", flush_interval: float = 1.0):
+        super().__init__(bot)
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.values: Dict[str, Any] = {}
+        self._dirty = set()
+        self._task: Optional[asyncio.Task] = None
+        self.counters.update({
+            "flushed": 0,
+            "flush_errors": 0,
+        })
+
+    async def execute(self, name: str, op: Op) -> Result:
+        # Между чтением и записью нет await - операция атомарна в event loop
+        new_value, result = apply_op(self.values.get(name), op)
+        if op[0] != GET and result[0]:
+            self.values[name] = new_value
+            self._dirty.add(name)
+        return self._count(result)
+
+    async def load(self):
+        if self.backend is not None:
+            self.values.update(await self.backend.load(self.bot))
+
+    def start(self):
+        if self.backend is not None and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        if self.backend is None or not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        # Пишем значения на момент сброса: промежуточные изменения одного ключа схлопываются
+        values = {name: self.values[name] for name in dirty}
+        try:
+            await self.backend.save(self.bot, values)
+            self.counters["flushed"] += len(values)
+        except Exception as e:
+            self.counters["flush_errors"] += 1
+            self._dirty |= dirty
+            logger.error(f"Failed to persist {len(values)} shared variables: {e}")
+
+
+# -------------------------
+# Несколько воркеров: операции в БД, объединенные по шардам
+# -------------------------
+
+class _Shard:
+    __slots__ = ("pending", "task")
+
+    def __init__(self):
+        self.pending: List[Tuple[str, Op, asyncio.Future]] = []
+        self.task: Optional[asyncio.Task] = None
+
+
+class PostgresSharedStore(SharedStore):
+    def __init__(self, backend: PostgresSharedBackend, bot: str = "", shards: int = 8):
+        super().__init__(bot)
+        self.backend = backend
+        self._shards = [_Shard() for _ in range(shards)]
+        self.counters.update({
+            "transactions": 0,
+        })
+
+    async def execute(self, name: str, op: Op) -> Result:
+        # Один ключ - всегда один шард: порядок операций над ключом сохраняется
+        shard = self._shards[zlib.crc32(name.encode("utf-8")) % len(self._shards)]
+        future = asyncio.get_running_loop().create_future()
+        shard.pending.append((name, op, future))
+        if shard.task is None or shard.task.done():
+            shard.task = asyncio.get_running_loop().create_task(self._drain(shard))
+        return self._count(await future)
+
+    async def _drain(self, shard: _Shard):
+        while shard.pending:
+            batch, shard.pending = shard.pending, []
+            ops: Dict[str, List[Op]] = defaultdict(list)
+            for name, op, _ in batch:
+                ops[name].append(op)
+            try:
+                results = await self.backend.apply(self.bot, ops)
+                self.counters["transactions"] += 1
+            except Exception as e:
+                logger.error(f"Shared variables transaction failed ({len(batch)} operations): {e}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            offsets = defaultdict(int)
+            for name, _, future in batch:
+                result = results[name][offsets[name]]
+                offsets[name] += 1
+                if not future.done():
+                    future.set_result(result)
+
+    async def stop(self):
+        # Дожидаемся начатых транзакций; пул соединений закрывает владелец backend (он общий для ботов)
+        tasks = [s.task for s in self._shards if s.task is not None]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# -------------------------
+# Бенчмарк: 10 000 одновременных incr одной переменной
+# -------------------------
+
+if __name__ == "__main__":
+    import threading
+    import time
+
+    class FakePostgresBackend(PostgresSharedBackend):
+        """Транзакция с задержкой сети и блокировкой строк (один глобальный лок вместо FOR UPDATE)"""
+        def __init__(self, latency: float = 0.001):
+            super().__init__(dsn="")
+            self.latency = latency
+            self.rows: Dict[str, Any] = {}
+            self._lock = threading.Lock()
+
+        def _apply_sync(self, bot, batch):
+            with self._lock:
+                time.sleep(self.latency)
+                results = {}
+                for name in sorted(batch):
+                    value = self.rows.get(name)
+                    out = results[name] = []
+                    for op in batch[name]:
+                        new_value, result = apply_op(value, op)
+                        out.append(result)
+                        if result[0]:
+                            value = new_value
+                    self.rows[name] = value
+                return results
+
+        async def apply(self, bot, batch):
+            return await asyncio.to_thread(self._apply_sync, bot, batch)
+
+        def close(self):
+            pass
+
+    class PerOperationStore(SharedStore):
+        """Для сравнения: отдельная транзакция на каждую операцию"""
+        def __init__(self, backend):
+            super().__init__()
+            self.backend = backend
+
+        async def execute(self, name, op):
+            return self._count((await self.backend.apply(self.bot, {name: [op]}))[name][0])
+
+    async def run(label: str, store: SharedStore, n: int = 10_000):
+        started = time.perf_counter()
+        results = await asyncio.gather(*(store.incr("tickets") for _ in range(n)))
+        elapsed = time.perf_counter() - started
+        tickets = {value for ok, value in results if ok}
+        assert len(tickets) == n and max(tickets) == n, "increments lost or duplicated"
+        print(f"{label:<40} {elapsed * 1000:9.1f} мс  {elapsed / n * 1_000_000:8.2f} мкс/incr  {store.counters}")
+
+    async def bench():
+        await run("память (LocalSharedStore)", LocalSharedStore())
+        await run("Postgres, пачки по шардам", PostgresSharedStore(FakePostgresBackend()))
+        await run("Postgres, транзакция на операцию", PerOperationStore(FakePostgresBackend()), n=1000)
+
+        # Ограниченный декремент: мест 100, желающих 10 000
+        store = PostgresSharedStore(FakePostgresBackend())
+        await store.set("seats", 100)
+        results = await asyncio.gather(*(store.incr("seats", -1, min=0) for _ in range(10_000)))
+        print(f"места: получили {sum(ok for ok, _ in results)} из 10000, осталось {await store.get('seats')}")
+
+    asyncio.run(bench())
@@ -1,6 +1,10 @@
+import copy
+import logging
 from abc import ABC, abstractmethod
 from typing import Dict, Any, Optional
 
+logger = logging.getLogger(__name__)
+
 class StateStorage(ABC):
     @abstractmethod
     async def save_state(self, user_id: int, state: Dict[str, Any]):
@@ -18,8 +22,23 @@ class MemoryStorage(StateStorage):
         self._data = {}
 
     async def save_state(self, user_id: int, state: Dict[str, Any]):
-        # В реальном коде лучше делать deepcopy, чтобы избежать мутаций по ссылке
-        self._data[user_id] = state
+        """Сохраняет глубокую копию состояния пользователя"""
+        try:
+            # Создаем глубокую копию
+            self._data[user_id] = copy.deepcopy(state)
+        except Exception as e:
+            # Обработка ошибок копирования
+            logger.warning(f"Ошибка при копировании состояния: {e}")
+            # Fallback: поверхностная копия
+            self._data[user_id] = state.copy()
 
     async def load_state(self, user_id: int) -> Optional[Dict[str, Any]]:
-        return self._data.get(user_id)
+        """Возвращает глубокую копию состояния пользователя или None"""
+        if user_id in self._data:
+            try:
+                return copy.deepcopy(self._data[user_id])
+            except Exception as e:
+                logger.warning(f"Ошибка при копировании загружаемого состояния: {e}")
+                # Если не удалось сделать deepcopy, возвращаем поверхностную копию
+                return self._data[user_id].copy()
+        return None
@@ -0,0 +1,6 @@
+# conftest.py
+# Модули интерпретатора импортируются по имени (как при запуске из interpreter/)
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
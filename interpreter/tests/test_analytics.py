@@ -0,0 +1,156 @@
+# test_analytics.py
+import asyncio
+import json
+
+from analytics import VARIANT_STATS, AnalyticsSink, PostgresCopyEventWriter
+from bot_interpreter import BotInterpreter
+from conformance import make_production_adapter
+from state_storage import MemoryStorage
+
+
+class FlakyWriter:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+
+    async def write(self, batch):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("db down")
+        self.batches.append(batch)
+
+
+def test_copy_rows_keep_extra_fields():
+    writer = PostgresCopyEventWriter("dsn")
+    sink = AnalyticsSink(writer, bot="b")
+    record = sink.record(VARIANT_STATS, None, "split-1", 1, entries=5, completions=2)
+    line = writer._copy_rows([record]).getvalue().rstrip("\n").split("\t")
+    assert line[1:6] == ["b", "\\N", VARIANT_STATS, "split-1", "1"]
+    assert json.loads(line[6]) == {"entries": 5, "completions": 2}
+
+
+def test_copy_rows_without_extra_write_null():
+    writer = PostgresCopyEventWriter("dsn")
+    record = AnalyticsSink(writer).record("block_entered", 1, "b\t1", "a\nb")
+    line = writer._copy_rows([record]).getvalue().rstrip("\n").split("\t")
+    assert line[4:] == ["b\\t1", "a\\nb", "\\N"]
+
+
+def test_collected_deltas_survive_failed_write():
+    writer = FlakyWriter(failures=1)
+    sink = AnalyticsSink(writer)
+    counts = {"entries": 3}
+    flushed = {"entries": 0}
+
+    def collect():
+        delta = counts["entries"] - flushed["entries"]
+        snapshot = counts["entries"]
+
+        def commit():
+            flushed["entries"] = snapshot
+
+        return [sink.record(VARIANT_STATS, None, "s", 0, entries=delta)], commit
+
+    sink.add_collector(collect)
+    asyncio.run(sink.flush())
+    assert writer.batches == [] and sink.counters["flush_errors"] == 1
+
+    counts["entries"] = 5
+    asyncio.run(sink.flush())
+    assert [r["entries"] for batch in writer.batches for r in batch] == [5]
+
+    asyncio.run(sink.flush())
+    assert len(writer.batches) == 2 and writer.batches[1][0]["entries"] == 0
+
+
+def test_full_buffer_does_not_drop_collected_deltas():
+    writer = FlakyWriter()
+    sink = AnalyticsSink(writer, max_buffer=1)
+    sink.emit("block_entered", 1, "a")
+    sink.emit("block_entered", 2, "a")
+    sink.add_collector(lambda: ([sink.record(VARIANT_STATS, None, "s", 0, entries=1)], lambda: None))
+    asyncio.run(sink.flush())
+    events = [r["event"] for batch in writer.batches for r in batch]
+    assert events.count(VARIANT_STATS) == 1 and sink.counters["dropped"] == 1
+
+
+def test_interpreter_variant_stats_retried_after_failed_write():
+    from bot_interpreter import BotInterpreter
+
+    writer = FlakyWriter(failures=1)
+    sink = AnalyticsSink(writer)
+    model = {"BotName": "t", "Start": "s", "Final": "f", "Blocks": []}
+    interpreter = BotInterpreter(model, api=None, analytics=sink)
+    interpreter.variant_stats[("split", 0)][0] += 2
+
+    asyncio.run(sink.flush())
+    interpreter.variant_stats[("split", 0)][0] += 1
+    asyncio.run(sink.flush())
+    asyncio.run(sink.flush())
+
+    written = [(r["value"], r["entries"]) for batch in writer.batches for r in batch]
+    assert written == [(0, 3)]
+
+
+class SlowWriter:
+    def __init__(self, delay):
+        self.delay = delay
+        self.batches = []
+        self.started = asyncio.Event()
+
+    async def write(self, batch):
+        self.started.set()
+        await asyncio.sleep(self.delay)
+        self.batches.append(batch)
+
+
+def test_stop_waits_for_inflight_flush():
+    async def run():
+        writer = SlowWriter(delay=0.05)
+        sink = AnalyticsSink(writer, batch_size=2)
+        sink.start()
+        sink.emit("block_entered", 1, "a")
+        sink.emit("block_entered", 2, "a")
+        await writer.started.wait()
+        sink.emit("block_entered", 3, "b")
+        await sink.stop()
+        return sink, writer
+
+    sink, writer = asyncio.run(run())
+    assert [len(b) for b in writer.batches] == [2, 1]
+    assert sink.counters["flushed"] == 3 and sink.counters["dropped"] == 0
+
+
+def test_stop_timeout_counts_cancelled_batch_as_dropped():
+    async def run():
+        writer = SlowWriter(delay=10)
+        sink = AnalyticsSink(writer, batch_size=2, stop_timeout=0.05)
+        sink.start()
+        sink.emit("block_entered", 1, "a")
+        sink.emit("block_entered", 2, "a")
+        await writer.started.wait()
+        writer.delay = 0
+        await sink.stop()
+        return sink
+
+    sink = asyncio.run(run())
+    assert sink.counters["dropped"] == 2
+
+
+def test_block_entered_carries_previous_block_and_dwell():
+    model = {
+        "BotName": "Bot", "Start": "start", "Final": "final",
+        "Blocks": [
+            {"Block_id": "start", "Type": "start", "Params": {}, "Connections": {"In": [], "Out": ["hello"]}},
+            {"Block_id": "hello", "Type": "sendMessage", "Params": {"message": "Привет"},
+             "Connections": {"In": ["start"], "Out": []}},
+        ],
+    }
+    sink = AnalyticsSink(FlakyWriter())
+    api, _ = make_production_adapter()
+    asyncio.run(BotInterpreter(model, api, MemoryStorage(), analytics=sink).start_dialog(1, {}))
+
+    entered = [r for r in sink._buffer if r["event"] == "block_entered"]
+    assert [r["block_id"] for r in entered] == ["start", "hello"]
+    assert "from_block" not in entered[0]
+    assert entered[1]["from_block"] == "start" and entered[1]["dwell"] >= 0
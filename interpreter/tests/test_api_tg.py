@@ -0,0 +1,113 @@
+# test_api_tg.py
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("aiogram")
+
+from api_tg import TelegramAPI
+
+
+class FakeBot:
+    def __init__(self):
+        self.calls = []
+        self.next_id = 100
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        self.next_id += 1
+        self.calls.append(("send", text))
+        return SimpleNamespace(message_id=self.next_id)
+
+    async def edit_message_text(self, chat_id, message_id, text, reply_markup=None):
+        self.calls.append(("edit", message_id, text))
+
+    async def edit_message_reply_markup(self, chat_id, message_id, reply_markup=None):
+        self.calls.append(("strip", message_id))
+
+
+class FakeInterpreter:
+    """resume_dialog отвечает следующим choice или сообщением"""
+    def __init__(self, api, reply):
+        self.api = api
+        self.reply = reply
+        self.resumed = []
+
+    def is_stale_choice(self, data):
+        return data == "~stale-token"
+
+    async def resume_dialog(self, user_id, data):
+        self.resumed.append(data)
+        if self.reply == "choice":
+            await self.api.get_choice(user_id, "Следующий вопрос?", [{"label": "Да", "id": "~next"}])
+        else:
+            await self.api.send_message(user_id, "Готово")
+
+
+def make_api(reply, choice_mode="edit"):
+    api = TelegramAPI(token="42:TEST", choice_mode=choice_mode)
+    api.bot = FakeBot()
+    api.set_interpreter(FakeInterpreter(api, reply))
+    return api
+
+
+async def press(api, message_id):
+    await api._process_choice(1, "~token", message_id)
+
+
+def test_next_choice_edits_pressed_message():
+    async def run():
+        api = make_api("choice")
+        await api.get_choice(1, "Вопрос?", [{"label": "Да", "id": "~token"}])
+        await press(api, api.bot.next_id)
+        return api.bot.calls
+    calls = asyncio.run(run())
+    assert calls == [("send", "Вопрос?"), ("edit", 101, "Следующий вопрос?")]
+
+
+def test_message_after_press_strips_keyboard_first():
+    async def run():
+        api = make_api("message")
+        await api.get_choice(1, "Вопрос?", [{"label": "Да", "id": "~token"}])
+        await press(api, api.bot.next_id)
+        return api.bot.calls
+    assert asyncio.run(run()) == [("send", "Вопрос?"), ("strip", 101), ("send", "Готово")]
+
+
+def test_older_message_is_not_edited():
+    async def run():
+        api = make_api("choice")
+        await api.get_choice(1, "Вопрос?", [{"label": "Да", "id": "~token"}])
+        await api.send_message(1, "Еще сообщение")
+        await press(api, 101)
+        return api.bot.calls
+    calls = asyncio.run(run())
+    assert calls[-2:] == [("strip", 101), ("send", "Следующий вопрос?")]
+
+
+def test_strip_mode_never_edits_text():
+    async def run():
+        api = make_api("choice", choice_mode="strip")
+        await api.get_choice(1, "Вопрос?", [{"label": "Да", "id": "~token"}])
+        await press(api, 101)
+        return api.bot.calls
+    assert [c[0] for c in asyncio.run(run())] == ["send", "strip", "send"]
+
+
+def test_stale_press_answered_without_interpreter():
+    answers = []
+
+    async def answer(text=None):
+        answers.append(text)
+
+    callback = SimpleNamespace(from_user=SimpleNamespace(id=1), data="~stale-token",
+                               message=SimpleNamespace(message_id=101), answer=answer)
+    api = make_api("choice")
+    asyncio.run(api.handle_callback(callback))
+    assert answers == [TelegramAPI.STALE_CHOICE_TEXT]
+    assert api.interpreter.resumed == []
+
+
+def test_unknown_choice_mode_rejected():
+    with pytest.raises(ValueError):
+        TelegramAPI(token="42:TEST", choice_mode="replace")
@@ -0,0 +1,65 @@
+# test_auto_loop.py
+import asyncio
+import logging
+
+from bot_interpreter import BotInterpreter
+from conformance import make_production_adapter
+from state_storage import MemoryStorage
+
+
+def loop_model():
+    # condition -> sendMessage -> condition: ни одного блока ожидания
+    return {
+        "BotName": "Bot", "Start": "start", "Final": "final",
+        "Blocks": [
+            {"Block_id": "start", "Type": "start", "Params": {}, "Connections": {"In": [], "Out": ["check"]}},
+            {"Block_id": "check", "Type": "condition", "Params": {"condition": "True"},
+             "Connections": {"In": ["start", "again"], "Out": ["again", "again"]}},
+            {"Block_id": "again", "Type": "sendMessage", "Params": {"message": "еще раз"},
+             "Connections": {"In": ["check"], "Out": ["check"]}},
+        ],
+    }
+
+
+def test_step_budget_aborts_loop(caplog):
+    async def run():
+        api, events = make_production_adapter()
+        storage = MemoryStorage()
+        interpreter = BotInterpreter(loop_model(), api, storage, max_auto_steps=100)
+        await interpreter.start_dialog(1, {})
+        return interpreter, events, await storage.load_state(1)
+
+    with caplog.at_level(logging.ERROR, logger="bot_interpreter"):
+        interpreter, events, session = asyncio.run(run())
+    assert interpreter.metrics["auto_loop_aborts"] == 1
+    assert session["active"] is False
+    assert events[-1] == ("message", "Сценарий зациклился и был остановлен. Напишите /start")
+    assert "check -> again" in caplog.text
+
+
+def test_time_budget_aborts_loop():
+    async def run():
+        api, events = make_production_adapter()
+        interpreter = BotInterpreter(loop_model(), api, MemoryStorage(), max_auto_steps=10 ** 9, max_auto_seconds=0.05)
+        await asyncio.wait_for(interpreter.start_dialog(1, {}), 5.0)
+        return interpreter
+    assert asyncio.run(run()).metrics["auto_loop_aborts"] == 1
+
+
+def test_loop_yields_to_other_users():
+    async def run():
+        api, _ = make_production_adapter()
+        interpreter = BotInterpreter(loop_model(), api, MemoryStorage(), max_auto_steps=2000)
+        ticks = 0
+
+        async def other_user():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0)
+
+        other = asyncio.ensure_future(other_user())
+        await interpreter.start_dialog(1, {})
+        other.cancel()
+        return ticks
+    assert asyncio.run(run()) >= 2000 // BotInterpreter.YIELD_EVERY - 1
@@ -0,0 +1,65 @@
+# test_broadcast.py
+import asyncio
+import json
+
+from broadcast import Broadcast
+from rate_limiter import TokenBucket
+
+
+class FakeAPI:
+    def __init__(self):
+        self.rate_limiter = TokenBucket(rate=1)
+
+
+class FakeInterpreter:
+    def __init__(self, slow=(), fail=()):
+        self.api = FakeAPI()
+        self.started = []
+        self.slow = set(slow)
+        self.fail = set(fail)
+
+    async def start_dialog(self, user_id, meta):
+        if user_id in self.slow:
+            await asyncio.sleep(0.05)
+        if user_id in self.fail:
+            raise RuntimeError("blocked")
+        self.started.append(user_id)
+
+
+def test_api_rate_limiter_is_not_acquired_twice():
+    interpreter = FakeInterpreter()
+    broadcast = Broadcast(interpreter, range(5), rate_limiter=interpreter.api.rate_limiter)
+    assert broadcast.rate_limiter is None
+
+
+def test_slow_recipient_bounds_out_of_order_window():
+    interpreter = FakeInterpreter(slow={0})
+    broadcast = Broadcast(interpreter, range(200), concurrency=4)
+    broadcast._window = 20
+    peak = 0
+
+    original = broadcast._mark_done
+
+    def mark_done(index):
+        nonlocal peak
+        original(index)
+        peak = max(peak, len(broadcast._done_ahead))
+
+    broadcast._mark_done = mark_done
+    progress = asyncio.run(broadcast.run())
+    assert progress.offset == 200 and progress.sent == 200
+    assert peak < 20
+
+
+def test_resume_skips_done_and_counts_rate_for_this_run(tmp_path):
+    checkpoint = tmp_path / "broadcast.json"
+    checkpoint.write_text(json.dumps({"offset": 3, "sent": 1000, "failed": 0, "done_ahead": [5]}))
+    interpreter = FakeInterpreter(fail={7})
+    broadcast = Broadcast(interpreter, range(10), concurrency=2, checkpoint_path=str(checkpoint))
+    progress = asyncio.run(broadcast.run())
+
+    assert sorted(interpreter.started) == [3, 4, 6, 8, 9]
+    assert progress.offset == 10 and progress.sent == 1005 and progress.failed == 1
+    assert progress.sent + progress.failed - progress.resumed_from == 6
+    saved = json.loads(checkpoint.read_text())
+    assert saved == {"offset": 10, "sent": 1005, "failed": 1, "done_ahead": []}
@@ -0,0 +1,97 @@
+# test_choice.py
+import asyncio
+import copy
+import uuid
+
+from bot_interpreter import CHOICE_TOKEN_MAX, BotInterpreter, encode_choice_token
+from conformance import make_production_adapter
+from state_storage import MemoryStorage
+
+CHOICE_ID = str(uuid.uuid4())
+
+
+class CountingStorage(MemoryStorage):
+    def __init__(self):
+        super().__init__()
+        self.loads = 0
+
+    async def load_state(self, user_id):
+        self.loads += 1
+        return await super().load_state(user_id)
+
+
+def choice_model():
+    return {
+        "BotName": "Bot", "Start": "start", "Final": "final",
+        "Blocks": [
+            {"Block_id": "start", "Type": "start", "Params": {}, "Connections": {"In": [], "Out": [CHOICE_ID]}},
+            {"Block_id": CHOICE_ID, "Type": "choice",
+             "Params": {"prompt": "Цвет?", "var": "color",
+                        "options": [{"id": "o1", "label": "Красный", "value": "red"},
+                                    {"id": "o2", "label": "Синий", "value": "blue"}]},
+             "Connections": {"In": ["start"], "Out": ["red", "blue"]}},
+            {"Block_id": "red", "Type": "sendMessage", "Params": {"message": "Выбран ${color}"},
+             "Connections": {"In": [CHOICE_ID], "Out": []}},
+            {"Block_id": "blue", "Type": "sendMessage", "Params": {"message": "Выбран ${color}"},
+             "Connections": {"In": [CHOICE_ID], "Out": []}},
+        ],
+    }
+
+
+async def start(storage=None):
+    api, events = make_production_adapter()
+    interpreter = BotInterpreter(choice_model(), api, storage or MemoryStorage())
+    await interpreter.start_dialog(1, {})
+    return interpreter, events
+
+
+def test_token_fits_callback_data_limit():
+    token = encode_choice_token(CHOICE_ID, 2 ** 32 - 1, 255)
+    assert token.startswith("~") and len(token) <= CHOICE_TOKEN_MAX
+    assert encode_choice_token("x" * 100, 1, 0) is None
+    assert encode_choice_token(CHOICE_ID, 1, 0) != encode_choice_token(CHOICE_ID, 2, 0)
+
+
+def test_button_token_selects_branch():
+    async def run():
+        interpreter, events = await start()
+        buttons = events[-1][2]
+        await interpreter.resume_dialog(1, buttons[1])
+        return buttons, events
+    buttons, events = asyncio.run(run())
+    assert all(b.startswith("~") for b in buttons)
+    assert events[-1] == ("message", "Выбран blue")
+
+
+def test_option_id_typed_as_text_still_selects():
+    async def run():
+        interpreter, events = await start()
+        await interpreter.resume_dialog(1, "o1")
+        return events
+    assert asyncio.run(run())[-1] == ("message", "Выбран red")
+
+
+def test_stale_token_answered_without_loading_session():
+    async def run():
+        storage = CountingStorage()
+        interpreter, events = await start(storage)
+        old_button = events[-1][2][0]
+        changed = choice_model()
+        changed["Blocks"][1]["Params"]["options"][0]["label"] = "Алый"
+        interpreter.patch_blocks([changed["Blocks"][1]])
+        loads = storage.loads
+        await interpreter.resume_dialog(1, old_button)
+        return storage.loads - loads, events
+    loads, events = asyncio.run(run())
+    assert loads == 0
+    assert events[-1] == ("message", "Эта опция уже недоступна или неверна.")
+
+
+def test_unchanged_block_keeps_tokens_after_patch():
+    async def run():
+        interpreter, events = await start()
+        button = events[-1][2][0]
+        interpreter.patch_blocks([copy.deepcopy(choice_model()["Blocks"][1])])
+        await interpreter.resume_dialog(1, button)
+        return events
+    assert asyncio.run(run())[-1] == ("message", "Выбран red")
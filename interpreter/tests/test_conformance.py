@@ -0,0 +1,33 @@
+# test_conformance.py
+import asyncio
+from pathlib import Path
+
+from conformance import DEFAULT_INPUTS, PREVIEW_DIR, check_parity
+from state_storage import MemoryStorage
+from validator import parse_bot_config_from_file
+
+INTERPRETER_DIR = Path(__file__).resolve().parent.parent
+CORE_FILES = ["bot_api_interface.py", "state_storage.py", "bot_interpreter.py"]
+
+
+def test_preview_has_no_copy_of_the_core():
+    # Ядро отдается превью из interpreter/ плагином Vite, копий в public/python быть не должно
+    assert all((INTERPRETER_DIR / name).exists() for name in CORE_FILES)
+    assert not any((PREVIEW_DIR / name).exists() for name in CORE_FILES)
+
+
+def test_production_and_preview_transcripts_match():
+    model = parse_bot_config_from_file(str(INTERPRETER_DIR / "bot_model.json"))
+    assert asyncio.run(check_parity(model, DEFAULT_INPUTS))
+
+
+def test_memory_storage_does_not_alias_sessions():
+    async def run():
+        storage = MemoryStorage()
+        state = {"variables": {"a": 1}}
+        await storage.save_state(1, state)
+        state["variables"]["a"] = 2
+        loaded = await storage.load_state(1)
+        loaded["variables"]["a"] = 3
+        return await storage.load_state(1)
+    assert asyncio.run(run()) == {"variables": {"a": 1}}
@@ -0,0 +1,65 @@
+# test_dedup.py
+import json
+
+from dedup import SeenSet
+
+
+def test_check_reports_repeats():
+    seen = SeenSet()
+    assert not seen.check(1, now=0.0)
+    assert seen.check(1, now=1.0)
+    assert not seen.check("cb:1", now=1.0)
+    assert seen.counters == {"checked": 3, "duplicates": 1}
+
+
+def test_capacity_evicts_oldest_key():
+    seen = SeenSet(capacity=2)
+    for key in (1, 2, 3):
+        seen.check(key, now=0.0)
+    assert len(seen) == 2
+    assert not seen.check(1, now=0.0)
+
+
+def test_window_expires_old_keys():
+    seen = SeenSet(window=10.0)
+    seen.check(1, now=0.0)
+    assert not seen.check(1, now=11.0)
+
+
+def test_save_and_load_survive_restart(tmp_path, monkeypatch):
+    path = str(tmp_path / "seen.json")
+    seen = SeenSet(path=path)
+    seen.check(1, now=1000.0)
+    seen.check("cb:abc", now=1000.0)
+    seen.save()
+
+    monkeypatch.setattr("dedup.time.time", lambda: 1001.0)
+    restored = SeenSet(path=path)
+    restored.load()
+    assert restored.check(1)
+    assert restored.check("cb:abc")
+    assert not restored.check(2)
+
+
+def test_load_skips_expired_and_over_capacity_records(tmp_path, monkeypatch):
+    path = tmp_path / "seen.json"
+    path.write_text(json.dumps([[1, 0.0], [2, 95.0], [3, 96.0], [4, 97.0]]), encoding="utf-8")
+    monkeypatch.setattr("dedup.time.time", lambda: 100.0)
+
+    seen = SeenSet(capacity=2, window=10.0, path=str(path))
+    seen.load()
+    assert len(seen) == 2
+    assert seen.check(4, now=100.0)
+    assert not seen.check(2, now=100.0)
+
+
+def test_load_ignores_missing_or_corrupt_file(tmp_path):
+    seen = SeenSet(path=str(tmp_path / "missing.json"))
+    seen.load()
+    assert len(seen) == 0
+
+    corrupt = tmp_path / "corrupt.json"
+    corrupt.write_text("{", encoding="utf-8")
+    seen = SeenSet(path=str(corrupt))
+    seen.load()
+    assert len(seen) == 0
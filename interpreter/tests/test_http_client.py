@@ -0,0 +1,207 @@
+# test_http_client.py
+import asyncio
+
+import pytest
+
+from http_client import (
+    _MISSING, CircuitBreaker, CircuitOpenError, HttpClient, ResponseTooLargeError, UpstreamError, compile_path,
+    extract_path,
+)
+
+
+def expire(breaker: CircuitBreaker):
+    breaker.opened_at -= breaker.reset_timeout
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_breaker_success_resets_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_allows_single_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    expire(breaker)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    for _ in range(5):
+        breaker.record_failure()
+    expire(breaker)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+class FakeClient(HttpClient):
+    """HttpClient без сети: _send возвращает заготовленные ответы по очереди"""
+    BACKOFF_BASE = 0.001
+
+    def __init__(self, responses, **kwargs):
+        super().__init__(**kwargs)
+        self.responses = list(responses)
+        self.sent = 0
+
+    async def _send(self, params, method, stats_key):
+        self.sent += 1
+        response = self.responses.pop(0)
+        if isinstance(response, BaseException):
+            raise response
+        if response == "hang":
+            await asyncio.sleep(3600)
+        return response, {"ok": response}
+
+
+GET = {"url": "http://upstream.test/x", "method": "GET", "retries": 2}
+
+
+def test_retries_idempotent_requests():
+    client = FakeClient([500, OSError("reset"), 200])
+    status, data = asyncio.run(client.request(GET))
+    assert status == 200 and client.sent == 3
+    assert client.counters["retries"] == 2
+
+
+def test_post_is_not_retried():
+    client = FakeClient([500, 200])
+    with pytest.raises(UpstreamError):
+        asyncio.run(client.request({**GET, "method": "POST"}))
+    assert client.sent == 1
+
+
+def test_client_error_returned_without_failure():
+    client = FakeClient([404], failure_threshold=1)
+    assert asyncio.run(client.request(GET))[0] == 404
+    assert client.breaker("upstream.test").state == CircuitBreaker.CLOSED
+
+
+def test_open_circuit_rejects_without_sending():
+    client = FakeClient([500], failure_threshold=1)
+    with pytest.raises(UpstreamError):
+        asyncio.run(client.request({**GET, "retries": 0}))
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(client.request(GET))
+    assert client.sent == 1 and client.counters["circuit_rejections"] == 1
+
+
+def test_cancelled_probe_releases_half_open_circuit():
+    client = FakeClient([500, "hang", 200], failure_threshold=1)
+
+    async def run():
+        with pytest.raises(UpstreamError):
+            await client.request({**GET, "retries": 0})
+        breaker = client.breaker("upstream.test")
+        expire(breaker)
+        # parallelApi отменяет вызов по таймауту через wait_for
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(client.request(GET), 0.01)
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        return await client.request(GET), breaker.state
+
+    (status, _), state = asyncio.run(run())
+    assert status == 200 and state == CircuitBreaker.CLOSED
+
+
+def test_cancelled_regular_request_keeps_probe():
+    client = FakeClient(["hang"], failure_threshold=1)
+    breaker = client.breaker("upstream.test")
+
+    async def run():
+        task = asyncio.ensure_future(client.request(GET))
+        await asyncio.sleep(0)
+        # Пока запрос в полете, цепь разомкнулась и перешла в half-open с чужой пробой
+        breaker.record_failure()
+        expire(breaker)
+        assert breaker.allow()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert not breaker.allow()
+
+
+class FakeContent:
+    def __init__(self, parts):
+        self.parts = parts
+        self.read_parts = 0
+
+    async def iter_chunked(self, size):
+        for part in self.parts:
+            self.read_parts += 1
+            yield part
+
+
+class FakeResponse:
+    """Ответ aiohttp в объеме, который нужен _read_capped и _decode"""
+    def __init__(self, parts, content_length=None, content_type="application/json"):
+        self.content = FakeContent(parts)
+        self.content_length = content_length
+        self.headers = {"Content-Type": content_type}
+        self.charset = None
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_read_capped_rejects_declared_length_without_reading():
+    resp = FakeResponse([b"x" * 10], content_length=100)
+    with pytest.raises(ResponseTooLargeError):
+        asyncio.run(HttpClient()._read_capped(resp, 50))
+    assert resp.closed and resp.content.read_parts == 0
+
+
+def test_read_capped_aborts_once_cap_exceeded():
+    resp = FakeResponse([b"x" * 40, b"x" * 40, b"x" * 40])
+    with pytest.raises(ResponseTooLargeError):
+        asyncio.run(HttpClient()._read_capped(resp, 50))
+    assert resp.closed and resp.content.read_parts == 2
+
+
+def test_read_capped_returns_body_within_cap():
+    resp = FakeResponse([b'{"a": ', b'1}'])
+    raw = asyncio.run(HttpClient()._read_capped(resp, 50))
+    assert HttpClient()._decode(resp, raw) == {"a": 1}
+    assert not resp.closed
+
+
+def test_non_json_body_exposed_as_text():
+    resp = FakeResponse([], content_type="text/plain")
+    assert HttpClient()._decode(resp, "привет".encode()) == {"$body": "привет"}
+
+
+def test_nested_paths_extracted():
+    data = {"user": {"items": [{"name": "a"}, {"name": "b"}]}}
+    assert compile_path("user.items[1].name") == ("user", "items", 1, "name")
+    assert extract_path(data, compile_path("user.items[1].name")) == "b"
+    assert extract_path(data, compile_path("user.items[5].name")) is _MISSING
+    assert extract_path(data, compile_path("user.name")) is _MISSING
+
+
+@pytest.mark.parametrize("path", ["", "a..b", "a[x]"])
+def test_invalid_paths_rejected(path):
+    with pytest.raises(ValueError):
+        compile_path(path)
@@ -0,0 +1,55 @@
+# test_http_metrics.py
+import asyncio
+import logging
+
+from http_client import HttpClient
+from http_metrics import EndpointStats, HttpMetrics
+
+
+def test_endpoint_stats_aggregates_phases_and_errors():
+    stats = EndpointStats()
+    stats.add({"dns": 0.01, "connect": 0.02, "ttfb": 0.1, "total": 0.2}, None)
+    stats.add({"ttfb": 0.3, "total": 0.4, "reused": True}, "http_5xx")
+    data = stats.to_dict()
+    assert data["count"] == 2
+    assert data["errors"] == {"http_5xx": 1}
+    assert data["reused_connections"] == 1
+    assert data["avg_ms"]["ttfb"] == 200.0 and data["avg_ms"]["dns"] == 5.0
+    assert data["max_total_ms"] == 400.0
+
+
+def test_slowest_ranks_endpoints_by_p95():
+    metrics = HttpMetrics()
+    for _ in range(10):
+        metrics.record(("bot", "fast", "a.test"), {"total": 0.01})
+        metrics.record(("bot", "slow", "b.test"), {"total": 1.0})
+    slowest = metrics.slowest(top=1)
+    assert [(e["block_id"], e["host"]) for e in slowest] == [("slow", "b.test")]
+    assert slowest[0]["p95_total_ms"] == 1000.0
+
+
+def test_log_summary_lists_slowest(caplog):
+    metrics = HttpMetrics()
+    metrics.record(("bot", "block", "a.test"), {"total": 0.5}, "TimeoutError")
+    with caplog.at_level(logging.INFO, logger="http_metrics"):
+        metrics.log_summary()
+    assert "bot / block / a.test" in caplog.text and "TimeoutError" in caplog.text
+
+
+def test_request_context_becomes_stats_key():
+    keys = []
+
+    class RecordingClient(HttpClient):
+        async def _send(self, params, method, stats_key):
+            keys.append(stats_key)
+            return 200, {}
+
+    asyncio.run(RecordingClient().request({"url": "http://upstream.test:8080/x"}, ("Bot", "block-1")))
+    asyncio.run(RecordingClient().request({"url": "http://upstream.test/x"}))
+    assert keys == [("Bot", "block-1", "upstream.test:8080"), ("", "", "upstream.test")]
+
+
+def test_trace_ctx_factory_defaults_to_fresh_dict():
+    timings = {}
+    assert HttpMetrics._ctx_factory(timings).trace_request_ctx is timings
+    assert HttpMetrics._ctx_factory().trace_request_ctx == {}
@@ -0,0 +1,61 @@
+# test_lifecycle.py
+import asyncio
+
+from lifecycle import drain_runtime
+
+
+class FakeAPI:
+    def __init__(self, log):
+        self.log = log
+
+    async def stop_polling(self):
+        self.log.append("stop_polling")
+
+    def release_state(self):
+        self.log.append("release_state")
+
+    async def drain(self, timeout):
+        self.log.append("drain")
+        return True
+
+    async def close(self):
+        self.log.append("close")
+
+
+class FakeComponent:
+    def __init__(self, log, name):
+        self.log = log
+        self.name = name
+
+    def release_store(self):
+        self.log.append(f"{self.name}.release_store")
+
+    async def stop(self):
+        self.log.append(f"{self.name}.stop")
+
+
+class FakeInterpreter:
+    def __init__(self, log):
+        self.scheduler = FakeComponent(log, "scheduler")
+        self.shared = FakeComponent(log, "shared")
+        self.analytics = None
+
+
+def _run(handoff):
+    log = []
+    asyncio.run(drain_runtime(FakeAPI(log), FakeInterpreter(log), timeout=1.0,
+                              on_polling_stopped=lambda: log.append("released"), handoff=handoff))
+    return log
+
+
+def test_handoff_releases_state_files_before_polling_is_released():
+    log = _run(handoff=True)
+    assert log[:4] == ["stop_polling", "release_state", "scheduler.release_store", "released"]
+    assert log[-1] == "close"
+
+
+def test_plain_stop_keeps_state_files():
+    log = _run(handoff=False)
+    assert "release_state" not in log
+    assert "scheduler.release_store" not in log
+    assert log[:2] == ["stop_polling", "released"]
@@ -0,0 +1,88 @@
+# test_model_cache.py
+import asyncio
+import threading
+
+import pytest
+
+from model_cache import ModelCache
+
+
+class SlowSource:
+    def __init__(self, delay=0.02, error=None):
+        self.delay = delay
+        self.error = error
+        self.fetches = 0
+
+    async def fetch(self, bot_id):
+        self.fetches += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return 1, {"Token": "t", "bot": bot_id}
+
+
+def make_cache(source):
+    return ModelCache(source, compile=lambda scenario: dict(scenario))
+
+
+def test_concurrent_gets_share_one_fetch():
+    source = SlowSource()
+    cache = make_cache(source)
+
+    async def run():
+        return await asyncio.gather(*(cache.get("b") for _ in range(5)))
+
+    entries = asyncio.run(run())
+    assert source.fetches == 1
+    assert all(e is entries[0] for e in entries)
+
+
+def test_cancelled_first_loader_does_not_block_others():
+    source = SlowSource()
+    cache = make_cache(source)
+
+    async def run():
+        first = asyncio.ensure_future(cache.get("b"))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(cache.get("b"))
+        await asyncio.sleep(0)
+        first.cancel()
+        entry = await asyncio.wait_for(second, 1.0)
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return entry
+
+    entry = asyncio.run(run())
+    assert entry.model["bot"] == "b" and source.fetches == 1
+    assert cache._inflight == {}
+
+
+def test_failed_load_is_retried():
+    source = SlowSource(error=ConnectionError("db down"))
+    cache = make_cache(source)
+
+    async def run():
+        with pytest.raises(ConnectionError):
+            await cache.get("b")
+        source.error = None
+        return await cache.get("b")
+
+    assert asyncio.run(run()).token == "t"
+    assert source.fetches == 2
+
+
+def test_compile_runs_off_event_loop_thread():
+    compile_threads = []
+
+    def compile(scenario):
+        compile_threads.append(threading.current_thread())
+        return dict(scenario)
+
+    cache = ModelCache(SlowSource(delay=0), compile=compile)
+
+    async def run():
+        return await cache.get("b")
+
+    entry = asyncio.run(run())
+    assert entry.model["bot"] == "b"
+    assert compile_threads and compile_threads[0] is not threading.current_thread()
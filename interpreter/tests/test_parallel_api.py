@@ -0,0 +1,80 @@
+# test_parallel_api.py
+import asyncio
+import time
+
+from bot_interpreter import BotInterpreter
+from conformance import make_production_adapter
+from state_storage import MemoryStorage
+
+
+class DelayedHttp:
+    """Ответ по URL: (задержка, статус, данные)"""
+    def __init__(self, responses):
+        self.responses = responses
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def request(self, params, context=None):
+        delay, status, data = self.responses[params["url"]]
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self.in_flight -= 1
+        return status, data
+
+
+def parallel_model(deadline=None):
+    requests = [
+        {"url": "http://a.test", "method": "GET", "variables": {"user.name": "name"}},
+        {"url": "http://b.test", "method": "GET", "variables": {"items[0]": "first"}},
+    ]
+    return {
+        "BotName": "Bot",
+        "Start": "start",
+        "Final": "final",
+        "Blocks": [
+            {"Block_id": "start", "Type": "start", "Params": {}, "Connections": {"In": [], "Out": ["fan"]}},
+            {"Block_id": "fan", "Type": "parallelApi", "Params": {"requests": requests, "deadline": deadline},
+             "Connections": {"In": ["start"], "Out": ["ok", "fail"]}},
+            {"Block_id": "ok", "Type": "sendMessage", "Params": {"message": "${name} ${first}"},
+             "Connections": {"In": ["fan"], "Out": []}},
+            {"Block_id": "fail", "Type": "sendMessage", "Params": {"message": "Ошибка ${name}"},
+             "Connections": {"In": ["fan"], "Out": []}},
+        ],
+    }
+
+
+def run(http, deadline=None):
+    async def dialog():
+        api, events = make_production_adapter()
+        interpreter = BotInterpreter(parallel_model(deadline), api, MemoryStorage(), http_client=http)
+        started = time.monotonic()
+        await interpreter.start_dialog(1, {})
+        return events, time.monotonic() - started
+    return asyncio.run(dialog())
+
+
+def test_requests_run_concurrently_and_fill_variables():
+    http = DelayedHttp({"http://a.test": (0.2, 200, {"user": {"name": "Ann"}}),
+                        "http://b.test": (0.2, 200, {"items": ["x"]})})
+    events, elapsed = run(http)
+    assert events == [("message", "Ann x")]
+    assert http.max_in_flight == 2
+    assert elapsed < 0.35
+
+
+def test_one_failed_request_takes_fail_branch_and_keeps_successful_results():
+    http = DelayedHttp({"http://a.test": (0, 200, {"user": {"name": "Ann"}}),
+                        "http://b.test": (0, 500, {})})
+    events, _ = run(http)
+    assert events == [("message", "Ошибка Ann")]
+
+
+def test_deadline_takes_fail_branch():
+    http = DelayedHttp({"http://a.test": (0, 200, {"user": {"name": "Ann"}}),
+                        "http://b.test": (5, 200, {"items": ["x"]})})
+    events, elapsed = run(http, deadline=0.1)
+    assert events[0][1].startswith("Ошибка")
+    assert elapsed < 1.0
@@ -0,0 +1,104 @@
+# test_preview.py
+# Путь превью: модель из toScenario редактора идет в BotInterpreter без валидатора
+import asyncio
+
+from bot_interpreter import BotInterpreter
+from conformance import make_preview_adapter
+from state_storage import MemoryStorage
+
+
+class FakeHttp:
+    def __init__(self, status=200, data=None):
+        self.status = status
+        self.data = data
+        self.calls = []
+
+    async def request(self, params, context=None):
+        self.calls.append(params)
+        return self.status, self.data
+
+
+def editor_api_model():
+    # Так блок API сохраняет toScenario (botEditor/src/utils/scenarioUtils.js)
+    return {
+        "BotName": "Bot",
+        "Start": "start",
+        "Final": "final",
+        "Blocks": [
+            {"BlockName": "Старт", "Block_id": "start", "Type": "start", "X": 0, "Y": 0, "Params": {},
+             "Connections": {"In": [], "Out": ["api"]}},
+            {"BlockName": "API", "Block_id": "api", "Type": "apiRequest", "X": 0, "Y": 0,
+             "Params": {"url": "https://api.example.com/user", "method": "GET", "headers": {}, "body": "",
+                        "resultVariable": "result", "retryCount": 0},
+             "Connections": {"In": ["start"], "Out": ["ok", "fail"]}},
+            {"BlockName": "OK", "Block_id": "ok", "Type": "sendMessage", "X": 0, "Y": 0,
+             "Params": {"message": "Ответ: ${result}"}, "Connections": {"In": ["api"], "Out": []}},
+            {"BlockName": "Fail", "Block_id": "fail", "Type": "sendMessage", "X": 0, "Y": 0,
+             "Params": {"message": "Ошибка"}, "Connections": {"In": ["api"], "Out": []}},
+        ],
+    }
+
+
+def run_preview(http):
+    async def run():
+        api, events = make_preview_adapter()
+        interpreter = BotInterpreter(editor_api_model(), api, MemoryStorage(), http_client=http)
+        await interpreter.start_dialog(777, {})
+        return events
+    return asyncio.run(run())
+
+
+def test_editor_api_block_runs_in_preview():
+    http = FakeHttp(data={"name": "Ann"})
+    events = run_preview(http)
+    assert http.calls and http.calls[0]["url"] == "https://api.example.com/user"
+    assert events == [("message", "Ответ: {'name': 'Ann'}")]
+
+
+def test_editor_api_block_failure_branch_in_preview():
+    events = run_preview(FakeHttp(status=404, data={}))
+    assert events == [("message", "Ошибка")]
+
+
+def message_model(text):
+    return {
+        "BotName": "Bot",
+        "Start": "start",
+        "Final": "final",
+        "GlobalVariables": [{"name": "name", "type": "string", "default": "гость"}],
+        "Blocks": [
+            {"Block_id": "start", "Type": "start", "Params": {}, "Connections": {"In": [], "Out": ["hello"]}},
+            {"Block_id": "hello", "Type": "sendMessage", "Params": {"message": text},
+             "Connections": {"In": ["start"], "Out": ["bye"]}},
+            {"Block_id": "bye", "Type": "sendMessage", "Params": {"message": "Пока, ${name}"},
+             "Connections": {"In": ["hello"], "Out": ["final"]}},
+            {"Block_id": "final", "Type": "final", "Params": {}, "Connections": {"In": ["bye"], "Out": []}},
+        ],
+    }
+
+
+def test_patch_blocks_updates_running_interpreter():
+    async def run():
+        api, events = make_preview_adapter()
+        interpreter = BotInterpreter(message_model("Привет, ${name}"), api, MemoryStorage())
+        await interpreter.start_dialog(777, {})
+        before = list(events)
+        events.clear()
+        changed = message_model("Здравствуйте, ${name}")
+        interpreter.patch_blocks([changed["Blocks"][1]], bot_model=changed)
+        await interpreter.start_dialog(777, {})
+        return before, events
+    before, after = asyncio.run(run())
+    # Последнее сообщение - итоги от блока final
+    assert before[:2] == [("message", "Привет, гость"), ("message", "Пока, гость")]
+    assert after[:2] == [("message", "Здравствуйте, гость"), ("message", "Пока, гость")]
+
+
+def test_start_dialog_from_block_with_snapshot():
+    async def run():
+        api, events = make_preview_adapter()
+        interpreter = BotInterpreter(message_model("Привет, ${name}"), api, MemoryStorage())
+        await interpreter.start_dialog(777, {}, start_block="bye", variables={"name": "Аня"})
+        return events
+    events = asyncio.run(run())
+    assert events[0] == ("message", "Пока, Аня") and len(events) == 2
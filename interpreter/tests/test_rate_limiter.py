@@ -0,0 +1,132 @@
+# test_rate_limiter.py
+import asyncio
+
+import pytest
+
+from rate_limiter import InboundLimiter, TokenBucket
+
+
+def _recorder(log, name):
+    async def process():
+        log.append(name)
+    return process
+
+
+def test_token_bucket_burst_then_empty():
+    bucket = TokenBucket(rate=1.0, capacity=2)
+    assert bucket.try_acquire()
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+
+
+def test_token_bucket_acquire_waits_for_refill():
+    async def run():
+        bucket = TokenBucket(rate=100.0, capacity=1)
+        await bucket.acquire()
+        await asyncio.wait_for(bucket.acquire(), timeout=1.0)
+    asyncio.run(run())
+
+
+def test_unknown_policy_rejected():
+    with pytest.raises(ValueError):
+        InboundLimiter(policy="queue")
+
+
+def test_drop_policy_drops_over_limit():
+    async def run():
+        limiter = InboundLimiter(rate=0.001, burst=2, policy="drop")
+        log = []
+        for i in range(4):
+            await limiter.submit(1, _recorder(log, i))
+        return limiter, log
+    limiter, log = asyncio.run(run())
+    assert log == [0, 1]
+    assert limiter.counters["passed"] == 2
+    assert limiter.counters["dropped"] == 2
+
+
+def test_coalesce_policy_keeps_last_event():
+    async def run():
+        limiter = InboundLimiter(rate=50.0, burst=1, policy="coalesce")
+        log = []
+        for i in range(4):
+            await limiter.submit(1, _recorder(log, i))
+        assert await limiter.wait_idle(timeout=1.0)
+        return limiter, log
+    limiter, log = asyncio.run(run())
+    assert log == [0, 3]
+    assert limiter.counters["coalesced"] == 2
+
+
+def test_delay_policy_queues_up_to_max_queue():
+    async def run():
+        limiter = InboundLimiter(rate=50.0, burst=1, policy="delay", max_queue=2)
+        log = []
+        for i in range(5):
+            await limiter.submit(1, _recorder(log, i))
+        assert await limiter.wait_idle(timeout=1.0)
+        return limiter, log
+    limiter, log = asyncio.run(run())
+    assert log == [0, 1, 2]
+    assert limiter.counters["delayed"] == 2
+    assert limiter.counters["dropped"] == 2
+
+
+def test_users_are_limited_independently():
+    async def run():
+        limiter = InboundLimiter(rate=0.001, burst=1, policy="drop")
+        log = []
+        await limiter.submit(1, _recorder(log, "a"))
+        await limiter.submit(2, _recorder(log, "b"))
+        await limiter.submit(1, _recorder(log, "c"))
+        return log
+    assert asyncio.run(run()) == ["a", "b"]
+
+
+def test_evict_skips_draining_users_and_keeps_scanning():
+    limiter = InboundLimiter(idle_ttl=10.0)
+    busy = limiter._bucket(1, now=0.0)
+    busy.draining = True
+    limiter._bucket(2, now=0.0)
+    limiter._bucket(3, now=0.0)
+    limiter._bucket(4, now=95.0)
+
+    limiter._evict(now=100.0)
+
+    assert list(limiter._users) == [1, 4]
+    assert limiter.counters["evicted"] == 2
+
+
+def test_evict_enforces_max_users_past_draining_head():
+    limiter = InboundLimiter(idle_ttl=1000.0, max_users=2)
+    limiter._bucket(1, now=0.0).draining = True
+    for user_id in (2, 3, 4):
+        limiter._bucket(user_id, now=0.0)
+
+    limiter._evict(now=1.0)
+
+    assert list(limiter._users) == [1, 4]
+
+
+def test_default_policy_queues_instead_of_dropping():
+    async def run():
+        limiter = InboundLimiter(rate=50.0, burst=1)
+        log = []
+        for i in range(3):
+            await limiter.submit(1, _recorder(log, i))
+        assert await limiter.wait_idle(timeout=1.0)
+        return log
+    assert asyncio.run(run()) == [0, 1, 2]
+
+
+def test_drain_keeps_recency_order():
+    async def run():
+        limiter = InboundLimiter(rate=50.0, burst=1, policy="delay")
+        log = []
+        await limiter.submit(1, _recorder(log, "a"))
+        await limiter.submit(1, _recorder(log, "b"))
+        await limiter.submit(2, _recorder(log, "c"))
+        assert await limiter.wait_idle(timeout=1.0)
+        return list(limiter._users)
+    # Пользователь 1 был активен последним (его отложенное событие обработано после прихода пользователя 2)
+    assert asyncio.run(run()) == [2, 1]
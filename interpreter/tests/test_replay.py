@@ -0,0 +1,95 @@
+# test_replay.py
+import asyncio
+import copy
+from pathlib import Path
+
+from bot_interpreter import BotInterpreter
+from conformance import DEFAULT_INPUTS, make_production_adapter
+from replay import HTTP, Recorder, Replayer, load_core, load_log
+from state_storage import MemoryStorage
+from validator import parse_bot_config_from_file
+
+MODEL_PATH = Path(__file__).resolve().parent.parent / "bot_model.json"
+USER_ID = 123456789
+META = {"username": "ivan_petrov", "first_name": "Иван", "user_id": USER_ID}
+
+
+class FakeHttp:
+    def __init__(self, status=200, data=None):
+        self.status = status
+        self.data = data
+
+    async def request(self, params, context=None):
+        return self.status, self.data
+
+
+def api_model():
+    return {
+        "BotName": "Bot", "Start": "start", "Final": "final",
+        "Blocks": [
+            {"Block_id": "start", "Type": "start", "Params": {}, "Connections": {"In": [], "Out": ["api"]}},
+            {"Block_id": "api", "Type": "apiRequest",
+             "Params": {"url": "https://api.example.com/user", "method": "GET", "resultVariable": "result"},
+             "Connections": {"In": ["start"], "Out": ["ok", "fail"]}},
+            {"Block_id": "ok", "Type": "sendMessage", "Params": {"message": "Ответ: ${result}"},
+             "Connections": {"In": ["api"], "Out": []}},
+            {"Block_id": "fail", "Type": "sendMessage", "Params": {"message": "Ошибка"},
+             "Connections": {"In": ["api"], "Out": []}},
+        ],
+    }
+
+
+def record(path, model, inputs=(), http=None):
+    async def run():
+        api, _ = make_production_adapter()
+        recorder = Recorder(str(path))
+        interpreter = recorder.attach(BotInterpreter(model, api, MemoryStorage(), http_client=http))
+        await interpreter.start_dialog(USER_ID, META)
+        for text in inputs:
+            await interpreter.resume_dialog(USER_ID, text)
+        await recorder.close()
+    asyncio.run(run())
+    return load_log(str(path))
+
+
+def replay(model, records):
+    return asyncio.run(Replayer(model, load_core(), speed=None).run(records))
+
+
+def test_recorded_dialog_replays_without_diffs(tmp_path):
+    model = parse_bot_config_from_file(str(MODEL_PATH))
+    records = record(tmp_path / "dialog.jsonl.gz", model, DEFAULT_INPUTS)
+    # Введенное имя совпадает с first_name: в журнале и во входе, и в ответе бота - плейсхолдер
+    assert all("Иван" not in str(r[3]) for r in records)
+    report = replay(model, records)
+    assert report["events"] == 1 + len(DEFAULT_INPUTS)
+    assert report["errors"] == 0 and report["diff"] == {}
+
+
+def test_user_data_not_written_to_log(tmp_path):
+    path = tmp_path / "dialog.jsonl"
+    model = api_model()
+    model["Blocks"][2]["Params"]["message"] = "${first_name} (${username}, ${user_id}): ${result}"
+    records = record(path, model, http=FakeHttp(data={"n": 1}))
+    text = path.read_text(encoding="utf-8")
+    assert str(USER_ID) not in text and "Иван" not in text and "ivan_petrov" not in text
+    assert all(r[2] != USER_ID for r in records)
+    # Плейсхолдеры совпадают с метаданными, с которыми диалог стартует при воспроизведении
+    assert replay(model, records)["diff"] == {}
+
+
+def test_http_answers_replayed_from_log(tmp_path):
+    records = record(tmp_path / "dialog.jsonl", api_model(), http=FakeHttp(data={"name": "Ann"}))
+    assert [r[3][:3] for r in records if r[1] == HTTP] == [["api", 200, {"name": "Ann"}]]
+    report = replay(api_model(), records)
+    assert report["http_missing"] == 0 and report["diff"] == {}
+
+
+def test_changed_model_reported_as_diff(tmp_path):
+    records = record(tmp_path / "dialog.jsonl", api_model(), http=FakeHttp(data={}))
+    changed = copy.deepcopy(api_model())
+    changed["Blocks"][2]["Params"]["message"] = "Результат: ${result}"
+    diff = replay(changed, records)["diff"]
+    assert len(diff) == 1
+    idx, recorded, replayed = next(iter(diff.values()))
+    assert idx == 0 and recorded == ["m", "Ответ: {}"] and replayed == ["m", "Результат: {}"]
@@ -0,0 +1,188 @@
+# test_script_runner.py
+import asyncio
+import json
+import os
+import signal
+
+import pytest
+
+from script_runner import ScriptError, ScriptRunner, _on_cpu_limit, analyze_script, execute_script
+
+FRAME_ATTRS = ["gi_frame", "gi_code", "cr_frame", "ag_frame", "f_back", "f_globals", "f_locals",
+               "f_builtins", "tb_frame", "tb_next"]
+
+
+@pytest.mark.parametrize("attr", FRAME_ATTRS)
+def test_frame_and_generator_attributes_rejected(attr):
+    with pytest.raises(ScriptError):
+        analyze_script(f"g = (x for x in [1])\nv = g.{attr}\n")
+
+
+def test_generator_frame_escape_rejected():
+    source = (
+        "g = (x for x in [1])\n"
+        "popen = g.gi_frame.f_back.f_globals['os'].popen\n"
+        "out = popen('id').read()\n"
+    )
+    with pytest.raises(ScriptError):
+        analyze_script(source)
+
+
+@pytest.mark.parametrize("source", [
+    "import os\n",
+    "from os import path\n",
+    "x = __import__('os')\n",
+    "x = ''.__class__\n",
+    "x = '{0.__class__}'.format(1)\n",
+    "x = 'a'.format_map({})\n",
+    "x = (lambda: 1).__globals__\n",
+    "def f():\n    yield 1\n",
+    "x = unknown.attribute\n",
+])
+def test_forbidden_constructs_rejected(source):
+    with pytest.raises(ScriptError):
+        analyze_script(source)
+
+
+def test_syntax_error_reported():
+    with pytest.raises(ScriptError, match="строке 1"):
+        analyze_script("x = (\n")
+
+
+def test_allowed_methods_and_io_names():
+    info = analyze_script(
+        "words = sorted(text.lower().split())\n"
+        "label = ', '.join(w.strip() for w in words)\n"
+        "root = math.sqrt(n)\n"
+        "def double(v):\n"
+        "    return v * 2\n"
+        "twice = double(n)\n"
+    )
+    assert info.reads >= {"text", "n"}
+    assert "math" not in info.reads and "sorted" not in info.reads
+    assert info.writes == {"words", "label", "root", "twice"}
+
+
+def test_execute_script_returns_only_outputs():
+    info = analyze_script("a = x + 1\nb = [x] * 2\n")
+    raw = execute_script(info.hash, info.source, json.dumps({"x": 2}), ("a",), None)
+    assert json.loads(raw) == {"ok": True, "vars": {"a": 3}}
+
+
+def test_execute_script_reports_errors():
+    info = analyze_script("a = 1 / x\n")
+    result = json.loads(execute_script(info.hash, info.source, json.dumps({"x": 0}), ("a",), None))
+    assert result["ok"] is False and "ZeroDivisionError" in result["error"]
+
+
+def test_builtins_restricted_at_runtime():
+    # open не входит в белый список встроенных функций - NameError при выполнении
+    info = analyze_script("f = open('/etc/passwd')\n")
+    result = json.loads(execute_script(info.hash, info.source, "{}", ("f",), None))
+    assert result["ok"] is False and "NameError" in result["error"]
+
+
+def test_inline_pure_results_cached(monkeypatch):
+    monkeypatch.setattr(ScriptRunner, "INLINE", True)
+
+    async def run():
+        runner = ScriptRunner(workers=1)
+        script = analyze_script("y = x * 2\n")
+        first = await runner.run(script, {"x": 21}, pure=True)
+        second = await runner.run(script, {"x": 21}, pure=True)
+        other = await runner.run(script, {"x": 1}, pure=True)
+        return runner, first, second, other
+
+    runner, first, second, other = asyncio.run(run())
+    assert first == second == {"y": 42}
+    assert other == {"y": 2}
+    assert runner.counters["runs"] == 2 and runner.counters["cache_hits"] == 1
+
+
+def test_inline_error_raises_script_error(monkeypatch):
+    monkeypatch.setattr(ScriptRunner, "INLINE", True)
+    runner = ScriptRunner(workers=1)
+    with pytest.raises(ScriptError, match="KeyError"):
+        asyncio.run(runner.run(analyze_script("y = {}['k']\n"), {}))
+
+
+def test_pool_limits_and_privileges():
+    async def run():
+        runner = ScriptRunner(workers=1, cpu_limit=0.2, wall_timeout=5.0)
+        await runner.start()
+        try:
+            uid = await asyncio.get_running_loop().run_in_executor(runner._pool, os.geteuid)
+            result = await runner.run(analyze_script("y = sum(range(n))\n"), {"n": 10})
+            with pytest.raises(ScriptError, match="CPU time limit"):
+                await runner.run(analyze_script("while True:\n    pass\n"), {})
+        finally:
+            await runner.stop()
+        return uid, result
+
+    uid, result = asyncio.run(run())
+    assert result == {"y": 45}
+    if os.geteuid() == 0:
+        assert uid != 0
+
+
+@pytest.mark.parametrize("source", [
+    "try:\n    x = 1\nexcept:\n    pass\n",
+    "try:\n    x = 1\nexcept BaseException:\n    pass\n",
+    "try:\n    x = 1\nexcept (ValueError, BaseException):\n    pass\n",
+    "while True:\n    try:\n        x = 1\n    finally:\n        continue\n",
+    "def f():\n    try:\n        return 1\n    finally:\n        return 2\n",
+])
+def test_handlers_that_could_swallow_cpu_limit_rejected(source):
+    with pytest.raises(ScriptError):
+        analyze_script(source)
+
+
+def test_except_exception_still_allowed():
+    analyze_script("try:\n    x = int(s)\nexcept (ValueError, TypeError):\n    x = 0\nexcept Exception:\n    x = -1\n")
+
+
+def test_cpu_limit_not_swallowed_by_except_exception():
+    source = (
+        "while True:\n"
+        "    try:\n"
+        "        x = 1\n"
+        "    except Exception:\n"
+        "        pass\n"
+    )
+
+    async def run():
+        runner = ScriptRunner(workers=1, cpu_limit=0.2, wall_timeout=5.0)
+        await runner.start()
+        try:
+            with pytest.raises(ScriptError, match="CPU time limit"):
+                await runner.run(analyze_script(source), {})
+            # Пул не пересоздавался - остальные вызовы продолжают выполняться в нем же
+            pool = runner._pool
+            result = await runner.run(analyze_script("y = n + 1\n"), {"n": 1})
+            return runner, pool, result
+        finally:
+            await runner.stop()
+
+    runner, pool, result = asyncio.run(run())
+    assert runner.counters["pool_restarts"] == 0
+    assert pool is not None
+    assert result == {"y": 2}
+
+
+def test_cpu_limit_fires_again_inside_finally():
+    # Обработчик SIGPROF ставит _init_worker; здесь скрипт выполняется в процессе теста
+    previous = signal.signal(signal.SIGPROF, _on_cpu_limit)
+    source = (
+        "try:\n"
+        "    while True:\n"
+        "        pass\n"
+        "finally:\n"
+        "    while True:\n"
+        "        pass\n"
+    )
+    info = analyze_script(source)
+    try:
+        result = json.loads(execute_script(info.hash, info.source, "{}", (), 0.1))
+    finally:
+        signal.signal(signal.SIGPROF, previous)
+    assert result["ok"] is False and "CPU time limit" in result["error"]
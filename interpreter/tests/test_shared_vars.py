@@ -0,0 +1,67 @@
+# test_shared_vars.py
+import asyncio
+
+import pytest
+
+from shared_vars import CAS, GET, INCR, SET, FileSharedBackend, LocalSharedStore, SharedStore, apply_op
+
+
+def test_apply_op_get_and_set():
+    assert apply_op(5, (GET,)) == (5, (True, 5))
+    assert apply_op(5, (SET, 7)) == (7, (True, 7))
+
+
+def test_apply_op_incr_respects_bounds():
+    assert apply_op(None, (INCR, 1, None, None)) == (1, (True, 1))
+    assert apply_op(1, (INCR, -1, 0, None)) == (0, (True, 0))
+    assert apply_op(0, (INCR, -1, 0, None)) == (0, (False, 0))
+    assert apply_op(10, (INCR, 1, None, 10)) == (10, (False, 10))
+
+
+def test_apply_op_cas():
+    assert apply_op("a", (CAS, "a", "b")) == ("b", (True, "b"))
+    assert apply_op("c", (CAS, "a", "b")) == ("c", (False, "c"))
+
+
+def test_apply_op_rejects_unknown_operation():
+    with pytest.raises(ValueError):
+        apply_op(None, ("append", 1))
+
+
+def test_shared_store_requires_execute():
+    with pytest.raises(TypeError):
+        SharedStore()
+
+
+def test_local_store_cas_and_bounded_incr():
+    async def run():
+        store = LocalSharedStore()
+        await store.set("seats", 2)
+        results = await asyncio.gather(*(store.incr("seats", -1, min=0) for _ in range(3)))
+        assert sorted(results) == [(False, 0), (True, 0), (True, 1)]
+        assert await store.cas("state", None, "open") == (True, "open")
+        assert await store.cas("state", None, "closed") == (False, "open")
+        return store
+    store = asyncio.run(run())
+    assert store.counters["operations"] == 6
+    assert store.counters["rejected"] == 2
+
+
+def test_local_store_persists_through_file_backend(tmp_path):
+    path = str(tmp_path / "shared.json")
+
+    async def run():
+        store = LocalSharedStore(FileSharedBackend(path), bot="bot")
+        await store.incr("counter", 5)
+        await store.cas("owner", None, "alice")
+        await store.stop()
+
+        restored = LocalSharedStore(FileSharedBackend(path), bot="bot")
+        await restored.load()
+        other = LocalSharedStore(FileSharedBackend(path), bot="other")
+        await other.load()
+        return restored, other
+
+    restored, other = asyncio.run(run())
+    assert restored.values == {"counter": 5, "owner": "alice"}
+    assert other.values == {}
@@ -0,0 +1,76 @@
+# test_split.py
+import asyncio
+import os
+import subprocess
+import sys
+
+from bot_interpreter import BotInterpreter, split_point
+from conformance import make_production_adapter
+from state_storage import MemoryStorage
+
+INTERPRETER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def split_model(weights=None):
+    params = {"var": "variant"}
+    if weights is not None:
+        params["weights"] = weights
+    return {
+        "BotName": "Bot", "Start": "start", "Final": "final",
+        "Blocks": [
+            {"Block_id": "start", "Type": "start", "Params": {}, "Connections": {"In": [], "Out": ["ab"]}},
+            {"Block_id": "ab", "Type": "split", "Params": params, "Connections": {"In": ["start"], "Out": ["a", "b"]}},
+            {"Block_id": "a", "Type": "sendMessage", "Params": {"message": "A ${variant}"},
+             "Connections": {"In": ["ab"], "Out": ["final"]}},
+            {"Block_id": "b", "Type": "sendMessage", "Params": {"message": "B ${variant}"},
+             "Connections": {"In": ["ab"], "Out": ["final"]}},
+            {"Block_id": "final", "Type": "final", "Params": {}, "Connections": {"In": ["a", "b"], "Out": []}},
+        ],
+    }
+
+
+def run_users(model, user_ids):
+    async def run():
+        api, events = make_production_adapter()
+        interpreter = BotInterpreter(model, api, MemoryStorage())
+        branches = {}
+        for user_id in user_ids:
+            events.clear()
+            await interpreter.start_dialog(user_id, {})
+            branches[user_id] = events[0][1]
+        return interpreter, branches
+    return asyncio.run(run())
+
+
+def test_split_point_independent_of_hash_seed():
+    code = "from bot_interpreter import split_point; print(repr(split_point('ab', 12345)))"
+    outputs = {
+        subprocess.run([sys.executable, "-c", code], cwd=INTERPRETER_DIR, check=True, capture_output=True, text=True,
+                       env={**os.environ, "PYTHONHASHSEED": seed}).stdout.strip()
+        for seed in ("1", "2")
+    }
+    assert outputs == {repr(split_point("ab", 12345))}
+
+
+def test_user_stays_in_the_same_branch():
+    _, first = run_users(split_model(), range(50))
+    _, second = run_users(split_model(), range(50))
+    assert first == second
+    assert {text[0] for text in first.values()} == {"A", "B"}
+    assert all(text in ("A 0", "B 1") for text in first.values())
+
+
+def test_weights_shape_the_split():
+    _, branches = run_users(split_model([1, 3]), range(4000))
+    share_b = sum(text.startswith("B") for text in branches.values()) / len(branches)
+    assert 0.70 < share_b < 0.80
+
+    _, branches = run_users(split_model([0, 1]), range(200))
+    assert all(text.startswith("B") for text in branches.values())
+
+
+def test_variant_entries_and_completions_counted():
+    interpreter, branches = run_users(split_model(), range(20))
+    in_b = sum(text.startswith("B") for text in branches.values())
+    assert interpreter.variant_stats[("ab", 0)] == [20 - in_b, 20 - in_b]
+    assert interpreter.variant_stats[("ab", 1)] == [in_b, in_b]
@@ -0,0 +1,135 @@
+# test_timers.py
+import asyncio
+import time
+
+from timers import FileTimerStore, MemoryTimerStore, Timer, TimerScheduler, TimerWheel
+
+
+def test_wheel_fires_due_timers_only():
+    wheel = TimerWheel(tick=1.0, slots=8, now=0.0)
+    wheel.add(Timer("a", 1, due=2.0))
+    wheel.add(Timer("b", 2, due=5.0))
+    assert wheel.advance(1.0) == []
+    assert [t.timer_id for t in wheel.advance(2.0)] == ["a"]
+    assert [t.timer_id for t in wheel.advance(10.0)] == ["b"]
+    assert len(wheel) == 0
+
+
+def test_wheel_handles_timers_beyond_one_round():
+    wheel = TimerWheel(tick=1.0, slots=4, now=0.0)
+    wheel.add(Timer("far", 1, due=10.0))
+    assert wheel.advance(9.0) == []
+    assert [t.timer_id for t in wheel.advance(10.0)] == ["far"]
+
+
+def test_wheel_cancel():
+    wheel = TimerWheel(tick=1.0, slots=4, now=0.0)
+    wheel.add(Timer("a", 1, due=1.0))
+    assert wheel.cancel("a")
+    assert not wheel.cancel("a")
+    assert wheel.advance(5.0) == []
+
+
+def test_file_store_replays_journal(tmp_path):
+    path = str(tmp_path / "timers.jsonl")
+    store = FileTimerStore(path)
+    store.add(Timer("a", 1, due=100.0))
+    store.add(Timer("b", 2, due=200.0))
+    store.remove("a")
+
+    restored = FileTimerStore(path).load()
+    assert [(t.timer_id, t.user_id, t.due) for t in restored] == [("b", 2, 200.0)]
+    # load компактизирует журнал до живых таймеров
+    with open(path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 1
+
+
+def test_file_store_compacts_while_running(tmp_path):
+    path = str(tmp_path / "timers.jsonl")
+    store = FileTimerStore(path)
+    store.COMPACT_MIN_RECORDS = 10
+    store.load()
+    store.add(Timer("keep", 1, due=100.0))
+    for i in range(50):
+        store.add(Timer(f"t{i}", i, due=100.0))
+        store.remove(f"t{i}")
+    with open(path, encoding="utf-8") as f:
+        lines = f.readlines()
+    assert len(lines) < 20
+    assert [t.timer_id for t in FileTimerStore(path).load()] == ["keep"]
+
+
+def test_file_store_ignores_unknown_removals(tmp_path):
+    path = str(tmp_path / "timers.jsonl")
+    store = FileTimerStore(path)
+    store.remove("missing")
+    assert store._records == 0
+
+
+def test_scheduler_fires_handler_and_forgets_timer():
+    fired = []
+    store = MemoryTimerStore()
+    scheduler = TimerScheduler(store, tick=0.01, slots=16)
+
+    async def handler(timer):
+        fired.append(timer.user_id)
+
+    async def run():
+        scheduler.set_handler(handler)
+        scheduler.schedule(7, 0.0)
+        await scheduler.process_due(time.time() + 1)
+
+    asyncio.run(run())
+    assert fired == [7]
+    assert store.load() == []
+
+
+def test_scheduler_drops_restored_timers_without_session():
+    store = MemoryTimerStore()
+    store.add(Timer("live", 1, due=time.time() + 3600))
+    store.add(Timer("orphan", 2, due=time.time() + 3600))
+    scheduler = TimerScheduler(store, tick=0.01, slots=16)
+
+    async def is_live(timer):
+        return timer.user_id == 1
+
+    async def run():
+        scheduler.set_handler(lambda timer: None, is_live)
+        scheduler.start()
+        await asyncio.sleep(0.05)
+        await scheduler.stop()
+
+    asyncio.run(run())
+    assert [t.timer_id for t in store.load()] == ["live"]
+    assert len(scheduler.wheel) == 1
+    assert scheduler.counters["orphans_dropped"] == 1
+
+
+def test_interpreter_reports_timer_liveness():
+    from bot_interpreter import BotInterpreter
+    from state_storage import MemoryStorage
+
+    storage = MemoryStorage()
+    model = {"BotName": "t", "Start": "s", "Final": "f", "Blocks": []}
+    interpreter = BotInterpreter(model, api=None, storage=storage)
+
+    async def run():
+        await storage.save_state(1, {"active": True, "timer": {"id": "t1", "kind": "delay"}})
+        return (await interpreter._timer_is_live(Timer("t1", 1, 0.0)),
+                await interpreter._timer_is_live(Timer("old", 1, 0.0)),
+                await interpreter._timer_is_live(Timer("t2", 2, 0.0)))
+
+    assert asyncio.run(run()) == (True, False, False)
+
+
+def test_released_store_is_no_longer_written(tmp_path):
+    path = str(tmp_path / "timers.jsonl")
+    scheduler = TimerScheduler(FileTimerStore(path))
+    kept = scheduler.schedule(1, delay=60)
+    scheduler.release_store()
+
+    scheduler.schedule(2, delay=60)
+    scheduler.cancel(kept)
+
+    assert [t.timer_id for t in FileTimerStore(path).load()] == [kept]
+    assert len(scheduler.wheel) == 1
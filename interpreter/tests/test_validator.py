@@ -0,0 +1,217 @@
+# test_validator.py
+import os
+import subprocess
+import sys
+import uuid
+
+import pytest
+
+from validator import BotConfigParser, ValidationError
+
+
+def editor_scenario(**overrides):
+    """Сценарий в том виде, в котором его сохраняет редактор (toScenario + BotEditorShell)"""
+    ids = [str(uuid.uuid4()) for _ in range(4)]
+    scenario = {
+        "BotName": "Bot", "Token": "", "Start": ids[0], "Final": ids[3],
+        "GlobalVariables": ["city", "greeting"],
+        "Blocks": [
+            {"BlockName": "Старт", "Block_id": ids[0], "Type": "start", "X": 0, "Y": 0, "Params": {},
+             "Connections": {"In": [], "Out": [ids[1]]}},
+            {"BlockName": "API", "Block_id": ids[1], "Type": "api", "X": 0, "Y": 0,
+             "Params": {"url": "https://example.com/weather", "method": "GET", "headers": {}, "body": "",
+                        "resultVariable": "weather", "retryCount": 2},
+             "Connections": {"In": [ids[0]], "Out": [ids[2], ids[3]]}},
+            {"BlockName": "Ответ", "Block_id": ids[2], "Type": "sendMessage", "X": 0, "Y": 0,
+             "Params": {"message": "${weather}"}, "Connections": {"In": [ids[1]], "Out": [ids[3]]}},
+            {"BlockName": "Конец", "Block_id": ids[3], "Type": "final", "X": 0, "Y": 0, "Params": {},
+             "Connections": {"In": [ids[1], ids[2]], "Out": []}},
+        ],
+    }
+    scenario.update(overrides)
+    return scenario
+
+
+def test_editor_scenario_is_normalized():
+    model = BotConfigParser().parse_bot_config(editor_scenario())
+    assert [v["name"] for v in model["GlobalVariables"]] == ["city", "greeting"]
+    assert all(v["type"] == "string" for v in model["GlobalVariables"])
+    api = model["Blocks"][1]
+    assert api["Type"] == "apiRequest"
+    assert api["Params"]["resultVariable"] == "weather"
+    assert api["Params"]["retries"] == 2
+
+
+def test_empty_global_variable_name_rejected():
+    with pytest.raises(ValidationError):
+        BotConfigParser().parse_bot_config(editor_scenario(GlobalVariables=["city", "  "]))
+
+
+def test_validator_does_not_import_optional_subsystems():
+    # Ядро (validator) не должно тянуть http_client/script_runner, пока в сценарии нет их блоков
+    code = (
+        "import sys, validator\n"
+        "assert 'http_client' not in sys.modules, 'http_client'\n"
+        "assert 'script_runner' not in sys.modules, 'script_runner'\n"
+    )
+    interpreter_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, "-c", code], cwd=interpreter_dir, check=True)
+
+
+def retry_loop_scenario(block_type, params):
+    """Сценарий с повтором запроса: fail-ветка API ведет в блок block_type, который снова вызывает API"""
+    scenario = editor_scenario()
+    start, api, message, final = scenario["Blocks"]
+    retry = {"BlockName": "Повтор", "Block_id": str(uuid.uuid4()), "Type": block_type, "X": 0, "Y": 0,
+             "Params": params, "Connections": {"In": [api["Block_id"]], "Out": [api["Block_id"], final["Block_id"]]}}
+    api["Connections"]["Out"] = [message["Block_id"], retry["Block_id"]]
+    api["Connections"]["In"].append(retry["Block_id"])
+    final["Connections"]["In"] = [message["Block_id"], retry["Block_id"]]
+    scenario["Blocks"].insert(3, retry)
+    return scenario
+
+
+def test_api_retry_loop_allowed():
+    # Цикл condition -> apiRequest -> condition ограничивает бюджет автоматических шагов интерпретатора
+    BotConfigParser().parse_bot_config(retry_loop_scenario("condition", {"condition": "True"}))
+
+
+def test_loop_without_waiting_block_rejected():
+    scenario = editor_scenario()
+    start, api, message, final = scenario["Blocks"]
+    other = {"BlockName": "Снова", "Block_id": str(uuid.uuid4()), "Type": "sendMessage", "X": 0, "Y": 0,
+             "Params": {"message": "еще раз"},
+             "Connections": {"In": [message["Block_id"]], "Out": [message["Block_id"]]}}
+    message["Connections"]["Out"] = [other["Block_id"], final["Block_id"]]
+    message["Connections"]["In"].append(other["Block_id"])
+    scenario["Blocks"].insert(3, other)
+    with pytest.raises(ValidationError, match="цикл"):
+        BotConfigParser().parse_bot_config(scenario)
+
+
+def test_loop_check_skips_unconnected_outputs():
+    # Неподключенный выход не должен прерывать обход остальных выходов блока
+    blocks_map = {
+        "a": {"Type": "condition", "Connections": {"Out": [None, "b"]}},
+        "b": {"Type": "sendMessage", "Connections": {"Out": ["a"]}},
+    }
+    with pytest.raises(ValidationError, match="цикл"):
+        BotConfigParser()._validate_no_auto_loops(blocks_map)
+
+
+def with_api_params(**params):
+    scenario = editor_scenario()
+    scenario["Blocks"][1]["Params"].update(params)
+    return scenario
+
+
+@pytest.mark.parametrize("params", [
+    {"url": "ftp://example.com/x"},
+    {"method": "TRACE"},
+    {"headers": {"X-Count": 1}},
+    {"variables": {"items[x]": "first"}},
+    {"maxBodyBytes": 0},
+    {"timeouts": {"connect": 1, "dns": 1}},
+    {"retryCount": -1},
+])
+def test_invalid_api_request_params_rejected(params):
+    with pytest.raises(ValidationError):
+        BotConfigParser().parse_bot_config(with_api_params(**params))
+
+
+def test_api_request_nested_variables_accepted():
+    model = BotConfigParser().parse_bot_config(with_api_params(method="patch", variables={"user.items[0].id": "uid"}))
+    assert model["Blocks"][1]["Params"]["method"] == "PATCH"
+    assert model["Blocks"][1]["Params"]["variables"] == {"user.items[0].id": "uid"}
+
+
+def test_condition_syntax_checked():
+    scenario = editor_scenario()
+    message = scenario["Blocks"][2]
+    message["Type"] = "condition"
+    message["Params"] = {"expression": "weather ==="}
+    with pytest.raises(ValidationError, match="условии"):
+        BotConfigParser().parse_bot_config(scenario)
+    message["Params"] = {"expression": "weather == 'sunny'"}
+    model = BotConfigParser().parse_bot_config(scenario)
+    assert model["Blocks"][2]["Params"] == {"condition": "weather == 'sunny'"}
+
+
+def test_unchanged_scenario_not_revalidated(monkeypatch):
+    parser = BotConfigParser()
+    scenario = editor_scenario()
+    first = parser.parse_bot_config(scenario)
+    calls = []
+    monkeypatch.setattr(parser, "_parse_bot_config_uncached", lambda data: calls.append(data))
+    second = parser.parse_bot_config(scenario)
+    assert calls == [] and second == first
+    # Вызывающий получает копию: изменения результата не портят кэш
+    second["BotName"] = "changed"
+    assert parser.parse_bot_config(scenario)["BotName"] == "Bot"
+
+
+def test_unchanged_blocks_reused_after_edit(monkeypatch):
+    parser = BotConfigParser()
+    scenario = editor_scenario()
+    parser.parse_bot_config(scenario)
+    validated = []
+    original = parser._validate_block
+    monkeypatch.setattr(parser, "_validate_block", lambda block: validated.append(block["Block_id"]) or original(block))
+    scenario["Blocks"][2]["Params"]["message"] = "Погода: ${weather}"
+    model = parser.parse_bot_config(scenario)
+    assert validated == [scenario["Blocks"][2]["Block_id"]]
+    assert model["Blocks"][2]["Params"]["message"] == "Погода: ${weather}"
+
+
+def parallel_scenario(params):
+    scenario = editor_scenario()
+    api = scenario["Blocks"][1]
+    api["Type"] = "parallelApi"
+    api["Params"] = params
+    return scenario
+
+
+def test_parallel_api_requests_validated():
+    params = {"requests": [{"url": "https://a.example.com", "timeout": 2},
+                           {"url": "https://b.example.com", "method": "post"}], "deadline": 5}
+    model = BotConfigParser().parse_bot_config(parallel_scenario(params))
+    parsed = model["Blocks"][1]["Params"]
+    assert parsed["deadline"] == 5
+    assert [r["timeout"] for r in parsed["requests"]] == [2, None]
+    assert parsed["requests"][1]["method"] == "POST"
+
+
+@pytest.mark.parametrize("params", [
+    {"requests": []},
+    {"requests": [{"url": "https://a.example.com", "timeout": 0}]},
+    {"requests": [{"url": "not a url"}]},
+    {"requests": [{"url": "https://a.example.com"}], "deadline": -1},
+])
+def test_invalid_parallel_api_params_rejected(params):
+    with pytest.raises(ValidationError):
+        BotConfigParser().parse_bot_config(parallel_scenario(params))
+
+
+def split_scenario(params):
+    scenario = editor_scenario()
+    split = scenario["Blocks"][1]
+    split["Type"] = "split"
+    split["Params"] = params
+    return scenario
+
+
+def test_split_params_validated():
+    model = BotConfigParser().parse_bot_config(split_scenario({"weights": [1, 3], "var": "variant"}))
+    assert model["Blocks"][1]["Params"] == {"weights": [1, 3], "var": "variant"}
+
+
+@pytest.mark.parametrize("params", [
+    {"weights": [1]},
+    {"weights": [1, -1]},
+    {"weights": [0, 0]},
+    {"weights": [1, True]},
+    {"var": 1},
+])
+def test_invalid_split_params_rejected(params):
+    with pytest.raises(ValidationError):
+        BotConfigParser().parse_bot_config(split_scenario(params))
@@ -0,0 +1,309 @@
+# timers.py
+"""
+Планировщик отложенных событий для блоков delay/timeout.
+
+Вместо asyncio.sleep на каждого пользователя используется хэшированное колесо таймеров:
+вставка и отмена O(1), за один тик обрабатывается только один слот.
+Таймеры дублируются в TimerStore, поэтому переживают перезапуск процесса; восстановленные таймеры,
+у которых больше нет сессии (сессии в памяти не пережили рестарт), планировщик отбрасывает.
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, asdict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Timer:
+    timer_id: str
+    user_id: int
+    due: float                  # Время срабатывания (unix time)
+    rounds: int = 0             # Сколько полных оборотов колеса осталось (не сохраняется)
+
+    def to_dict(self):
+        data = asdict(self)
+        data.pop("rounds")
+        return data
+
+
+# -------------------------
+# Хранилища таймеров
+# -------------------------
+
+class TimerStore(ABC):
+    @abstractmethod
+    def add(self, timer: Timer):
+        """Сохранить таймер"""
+        pass
+
+    @abstractmethod
+    def remove(self, timer_id: str):
+        """Удалить таймер (сработал или отменен)"""
+        pass
+
+    @abstractmethod
+    def load(self) -> List[Timer]:
+        """Все несработавшие таймеры (при старте процесса)"""
+        pass
+
+    def close(self):
+        """Освободить ресурсы хранилища"""
+        pass
+
+
+class MemoryTimerStore(TimerStore):
+    """Таймеры только в памяти (сбрасываются при перезапуске)"""
+    def __init__(self):
+        self._data: Dict[str, Timer] = {}
+
+    def add(self, timer: Timer):
+        self._data[timer.timer_id] = timer
+
+    def remove(self, timer_id: str):
+        self._data.pop(timer_id, None)
+
+    def load(self) -> List[Timer]:
+        return list(self._data.values())
+
+
+class FileTimerStore(TimerStore):
+    """
+    Журнал таймеров в файле (JSON Lines): каждая операция - одна дописанная строка, O(1).
+    При загрузке журнал проигрывается и перезаписывается только живыми таймерами; во время работы
+    он так же компактизируется, когда записи о сработавших и отмененных таймерах составляют
+    больше COMPACT_DEAD_RATIO журнала.
+    """
+    COMPACT_MIN_RECORDS = 10_000
+    COMPACT_DEAD_RATIO = 0.5
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._timers: Dict[str, Timer] = {}
+        self._records = 0       # Строк в журнале
+
+    def _append(self, record: dict):
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        self._records += 1
+
+    def add(self, timer: Timer):
+        self._timers[timer.timer_id] = timer
+        self._append({"op": "add", **timer.to_dict()})
+
+    def remove(self, timer_id: str):
+        if self._timers.pop(timer_id, None) is None:
+            return
+        self._append({"op": "del", "timer_id": timer_id})
+        dead = self._records - len(self._timers)
+        if self._records >= self.COMPACT_MIN_RECORDS and dead > self._records * self.COMPACT_DEAD_RATIO:
+            self._rewrite()
+
+    def _rewrite(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for timer in self._timers.values():
+                f.write(json.dumps({"op": "add", **timer.to_dict()}) + "\n")
+        os.replace(tmp_path, self.path)
+        self._records = len(self._timers)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def load(self) -> List[Timer]:
+        timers: Dict[str, Timer] = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    if record.pop("op") == "add":
+                        timers[record["timer_id"]] = Timer(**record)
+                    else:
+                        timers.pop(record["timer_id"], None)
+
+        # Компактизация журнала
+        self._timers = timers
+        self._rewrite()
+        return list(timers.values())
+
+
+# -------------------------
+# Колесо таймеров
+# -------------------------
+
+class TimerWheel:
+    """
+    Хэшированное колесо таймеров.
+    tick - разрешение (сек), slots - количество слотов; таймеры дальше одного оборота
+    хранят счетчик оставшихся оборотов.
+    """
+    def __init__(self, tick: float = 1.0, slots: int = 3600, now: Optional[float] = None):
+        self.tick = tick
+        self._slots: List[Dict[str, Timer]] = [{} for _ in range(slots)]
+        self._slot_of: Dict[str, int] = {}
+        self._cursor = 0
+        self._cursor_time = now if now is not None else time.time()
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def add(self, timer: Timer):
+        ticks = max(1, math.ceil((timer.due - self._cursor_time) / self.tick))
+        slot = (self._cursor + ticks) % len(self._slots)
+        timer.rounds = (ticks - 1) // len(self._slots)
+        self._slots[slot][timer.timer_id] = timer
+        self._slot_of[timer.timer_id] = slot
+
+    def cancel(self, timer_id: str) -> bool:
+        slot = self._slot_of.pop(timer_id, None)
+        if slot is None:
+            return False
+        del self._slots[slot][timer_id]
+        return True
+
+    def advance(self, now: float) -> List[Timer]:
+        """Сдвигает колесо до момента now и возвращает сработавшие таймеры"""
+        due: List[Timer] = []
+        while self._cursor_time + self.tick <= now:
+            self._cursor_time += self.tick
+            self._cursor = (self._cursor + 1) % len(self._slots)
+            slot = self._slots[self._cursor]
+            for timer_id, timer in list(slot.items()):
+                if timer.rounds > 0:
+                    timer.rounds -= 1
+                else:
+                    del slot[timer_id]
+                    del self._slot_of[timer_id]
+                    due.append(timer)
+        return due
+
+
+class TimerScheduler:
+    """
+    Запускает обработчик для сработавших таймеров пачками.
+    handler(timer) обычно вызывает interpreter.resume_dialog.
+    is_live(timer) - есть ли еще сессия, которая ждет таймер; восстановленные из хранилища таймеры
+    без сессии удаляются при старте тика.
+    """
+    BATCH_SIZE = 500
+
+    def __init__(self, store: Optional[TimerStore] = None, tick: float = 1.0, slots: int = 3600):
+        self.store = store if store else MemoryTimerStore()
+        self.wheel = TimerWheel(tick=tick, slots=slots)
+        self.handler: Optional[Callable[[Timer], Awaitable[None]]] = None
+        self.is_live: Optional[Callable[[Timer], Awaitable[bool]]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loaded = False
+        self._restored: List[Timer] = []
+        self.counters = {
+            "orphans_dropped": 0,
+        }
+
+    def set_handler(self, handler: Callable[[Timer], Awaitable[None]],
+                    is_live: Optional[Callable[[Timer], Awaitable[bool]]] = None):
+        self.handler = handler
+        self.is_live = is_live
+
+    def _ensure_loaded(self):
+        # Восстанавливаем таймеры, пережившие рестарт (просроченные сработают на первом тике)
+        if not self._loaded:
+            self._loaded = True
+            self._restored = self.store.load()
+            for timer in self._restored:
+                self.wheel.add(timer)
+
+    async def drop_orphans(self, timers: List[Timer]) -> int:
+        """Удаляет таймеры, которые больше не ждет ни одна сессия"""
+        if self.is_live is None:
+            return 0
+        dropped = 0
+        for i in range(0, len(timers), self.BATCH_SIZE):
+            batch = timers[i:i + self.BATCH_SIZE]
+            live = await asyncio.gather(*(self.is_live(t) for t in batch), return_exceptions=True)
+            for timer, ok in zip(batch, live):
+                # Ошибка хранилища - таймер оставляем: устаревший сработает вхолостую
+                if ok is False:
+                    self.cancel(timer.timer_id)
+                    dropped += 1
+        if dropped:
+            self.counters["orphans_dropped"] += dropped
+            logger.info(f"Dropped {dropped} restored timers without a session")
+        return dropped
+
+    def release_store(self):
+        """
+        Handoff: журнал таймеров переходит новому процессу. Таймеры этого процесса доживают в памяти,
+        но в хранилище больше не пишутся.
+        """
+        self._loaded = True
+        self.store.close()
+        self.store = MemoryTimerStore()
+
+    def schedule(self, user_id: int, delay: float) -> str:
+        self._ensure_loaded()
+        timer = Timer(timer_id=uuid.uuid4().hex, user_id=user_id, due=time.time() + delay)
+        self.wheel.add(timer)
+        self.store.add(timer)
+        self.start()
+        return timer.timer_id
+
+    def cancel(self, timer_id: str):
+        if self.wheel.cancel(timer_id):
+            self.store.remove(timer_id)
+
+    def start(self):
+        """Запуск фонового тика (если event loop уже работает)"""
+        self._ensure_loaded()
+        if self._task is None or self._task.done():
+            try:
+                self._task = asyncio.get_running_loop().create_task(self._run())
+            except RuntimeError:
+                pass
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        if self._restored:
+            restored, self._restored = self._restored, []
+            await self.drop_orphans(restored)
+        while True:
+            await asyncio.sleep(self.wheel.tick)
+            await self.process_due(time.time())
+
+    async def process_due(self, now: float):
+        due = self.wheel.advance(now)
+        for i in range(0, len(due), self.BATCH_SIZE):
+            await self._fire_batch(due[i:i + self.BATCH_SIZE])
+
+    async def _fire_batch(self, batch: Iterable[Timer]):
+        async def fire(timer: Timer):
+            try:
+                if self.handler:
+                    await self.handler(timer)
+            except Exception as e:
+                logger.error(f"Timer {timer.timer_id} for user {timer.user_id} failed: {e}")
+            finally:
+                self.store.remove(timer.timer_id)
+
+        await asyncio.gather(*(fire(t) for t in batch))
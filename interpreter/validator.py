@@ -1,8 +1,14 @@
+import ast
+import copy
+import hashlib
 import json
+import threading
 import uuid
+from collections import OrderedDict
 from typing import Dict, Any, List, Optional, Callable
 from enum import Enum
 from pathlib import Path
+from urllib.parse import urlparse
 
 class BlockType(Enum):
     START = "start"
@@ -10,6 +16,14 @@ class BlockType(Enum):
     GET_MESSAGE = "getMessage"
     CHOICE = "choice"
     FINAL = "final"
+    CONDITION = "condition"
+    API_REQUEST = "apiRequest"
+    PARALLEL_API = "parallelApi"
+    DELAY = "delay"
+    TIMEOUT = "timeout"
+    SHARED_VAR = "sharedVar"
+    SPLIT = "split"
+    SCRIPT = "script"
 
 class ValidationError(Exception):
     """Кастомное исключение для ошибок валидации"""
@@ -45,6 +59,14 @@ class BotConfigParser:
             BlockType.GET_MESSAGE: self._parse_get_message_params,
             BlockType.CHOICE: self._parse_choice_params,
             BlockType.FINAL: self._parse_final_params,
+            BlockType.CONDITION: self._parse_condition_params,
+            BlockType.API_REQUEST: self._parse_api_request_params,
+            BlockType.PARALLEL_API: self._parse_parallel_api_params,
+            BlockType.DELAY: self._parse_timer_params,
+            BlockType.TIMEOUT: self._parse_timer_params,
+            BlockType.SHARED_VAR: self._parse_shared_var_params,
+            BlockType.SPLIT: self._parse_split_params,
+            BlockType.SCRIPT: self._parse_script_params,
         }
         
         # Регистр валидаторов соединений для каждого типа блока
@@ -54,6 +76,14 @@ class BotConfigParser:
             BlockType.GET_MESSAGE: self._validate_message_connections,
             BlockType.CHOICE: self._validate_choice_connections,
             BlockType.FINAL: self._validate_final_connections,
+            BlockType.CONDITION: self._validate_branch_connections,
+            BlockType.API_REQUEST: self._validate_branch_connections,
+            BlockType.PARALLEL_API: self._validate_branch_connections,
+            BlockType.DELAY: self._validate_message_connections,
+            BlockType.TIMEOUT: self._validate_timeout_connections,
+            BlockType.SHARED_VAR: self._validate_branch_connections,
+            BlockType.SPLIT: self._validate_split_connections,
+            BlockType.SCRIPT: self._validate_branch_connections,
         }
         
         # Допустимые типы для глобальных переменных
@@ -61,6 +91,24 @@ class BotConfigParser:
         
         # Допустимые типы для блока getMessage
         self._allowed_input_types = {"string", "number", "boolean", "date"}
+        
+        # Допустимые HTTP-методы для блока apiRequest
+        self._allowed_http_methods = {"GET", "POST", "PUT", "PATCH", "DELETE"}
+        
+        # Типы блоков, под которыми редактор сохранял сценарии раньше (сейчас toScenario пишет типы интерпретатора)
+        self._block_type_aliases = {"api": BlockType.API_REQUEST.value}
+        
+        # Допустимые операции блока sharedVar
+        self._allowed_shared_ops = {"get", "set", "incr", "cas"}
+        
+        # Кэш результатов валидации: хэш сценария -> результат (LRU)
+        self._config_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # Кэш провалидированных блоков: хэш блока -> блок (для инкрементальной валидации)
+        self._block_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.config_cache_size = 64
+        self.block_cache_size = 4096
+        # Компиляция моделей идет в рабочих потоках (ModelCache) - доступ к кэшам под блокировкой
+        self._cache_lock = threading.Lock()
     
     def parse_bot_config_from_file(self, file_path: str) -> Dict[str, Any]:
         """
@@ -92,8 +140,32 @@ class BotConfigParser:
     
     def parse_bot_config(self, json_data: Dict[str, Any]) -> Dict[str, Any]:
         """
-        Основная функция парсинга конфигурации бота из словаря (после JSON парсинга)
+        Основная функция парсинга конфигурации бота из словаря (после JSON парсинга).
+        Результат кэшируется по хэшу содержимого: неизмененный сценарий повторно не валидируется.
         """
+        config_hash = scenario_hash(json_data)
+        with self._cache_lock:
+            cached = self._config_cache.get(config_hash)
+            if cached is not None:
+                self._config_cache.move_to_end(config_hash)
+        if cached is not None:
+            return copy.deepcopy(cached)
+        
+        result = self._parse_bot_config_uncached(json_data)
+        
+        with self._cache_lock:
+            self._config_cache[config_hash] = copy.deepcopy(result)
+            if len(self._config_cache) > self.config_cache_size:
+                self._config_cache.popitem(last=False)
+        return result
+    
+    def clear_cache(self):
+        """Сброс кэшей валидации"""
+        with self._cache_lock:
+            self._config_cache.clear()
+            self._block_cache.clear()
+    
+    def _parse_bot_config_uncached(self, json_data: Dict[str, Any]) -> Dict[str, Any]:
         try:
             # 1. Валидация верхнеуровневых полей
             self._validate_top_level_fields(json_data)
@@ -149,6 +221,12 @@ class BotConfigParser:
         
         for i, var in enumerate(global_vars):
             try:
+                # Редактор сохраняет глобальные переменные списком имен - это строки без значения по умолчанию
+                if isinstance(var, str):
+                    if not var.strip():
+                        raise ValidationError("Имя переменной не может быть пустым", f"GlobalVariables[{i}]")
+                    var = {"name": var.strip(), "type": "string"}
+                
                 # Проверка обязательных полей
                 if "name" not in var:
                     raise ValidationError("Отсутствует поле 'name'", f"GlobalVariables[{i}]")
@@ -196,22 +274,30 @@ class BotConfigParser:
         seen_ids = set()
         
         for block in blocks:
+            block_id = block.get("Block_id") if isinstance(block, dict) else None
             try:
-                # Базовая валидация структуры блока
-                validated_block = self._validate_block_structure(block)
-                block_id = validated_block["Block_id"]
-                block_type = BlockType(validated_block["Type"])
-                
                 # Проверка уникальности Block_id
                 if block_id in seen_ids:
-                    raise ValidationError(f"Дублирующийся Block_id: {block_id}", "Block_id", block_id, block_type.value)
+                    raise ValidationError(f"Дублирующийся Block_id: {block_id}", "Block_id", block_id, block.get("Type"))
                 seen_ids.add(block_id)
                 
-                # Валидация параметров блока
-                validated_block["Params"] = self._parse_block_params(validated_block)
+                # Инкрементальная валидация: неизмененные блоки берем из кэша
+                block_hash = scenario_hash(block)
+                with self._cache_lock:
+                    cached = self._block_cache.get(block_hash)
+                    if cached is not None:
+                        self._block_cache.move_to_end(block_hash)
+                if cached is not None:
+                    blocks_map[block_id] = copy.deepcopy(cached)
+                    continue
                 
-                # Валидация соединений блока
-                self._validate_block_connections(validated_block)
+                validated_block = self._validate_block(block)
+                block_id = validated_block["Block_id"]
+                
+                with self._cache_lock:
+                    self._block_cache[block_hash] = copy.deepcopy(validated_block)
+                    if len(self._block_cache) > self.block_cache_size:
+                        self._block_cache.popitem(last=False)
                 
                 blocks_map[block_id] = validated_block
                 
@@ -219,13 +305,27 @@ class BotConfigParser:
                 raise
             except ValueError as e:
                 if "is not a valid BlockType" in str(e):
-                    raise ValidationError(f"Недопустимый тип блока: {validated_block['Type']}", "Type", block_id)
+                    raise ValidationError(f"Недопустимый тип блока: {block['Type']}", "Type", block_id)
                 raise
             except Exception as e:
                 raise ValidationError(f"Непредвиденная ошибка при парсинге блока: {str(e)}", block_id=block_id)
         
         return blocks_map
     
+    def _validate_block(self, block: Dict) -> Dict:
+        """Полная валидация одного блока (структура, параметры, соединения)"""
+        # Базовая валидация структуры блока
+        validated_block = self._validate_block_structure(block)
+        BlockType(validated_block["Type"])
+        
+        # Валидация параметров блока
+        validated_block["Params"] = self._parse_block_params(validated_block)
+        
+        # Валидация соединений блока
+        self._validate_block_connections(validated_block)
+        
+        return validated_block
+    
     def _validate_block_structure(self, block: Dict) -> Dict:
         """Базовая валидация структуры блока"""
         # Обязательные поля
@@ -235,7 +335,7 @@ class BotConfigParser:
                 raise ValidationError(f"Отсутствует обязательное поле: {field}")
         
         block_id = block["Block_id"]
-        block_type = block["Type"]
+        block_type = self._block_type_aliases.get(block["Type"], block["Type"])
         
         # Валидация Block_id
         if not self._is_valid_uuid(block_id):
@@ -403,6 +503,242 @@ class BotConfigParser:
             raise ValidationError("Params должен быть пустым объектом", "Params", block_id, BlockType.FINAL.value)
         return {}
     
+    def _parse_condition_params(self, params: Dict, block_id: str) -> Dict:
+        """Парсинг параметров блока condition"""
+        # Редактор сохраняет выражение в поле 'expression', интерпретатор читает 'condition'
+        expr = params.get("condition", params.get("expression"))
+        if expr is None:
+            raise ValidationError("Отсутствует обязательное поле 'condition'", "Params.condition", block_id, BlockType.CONDITION.value)
+        
+        if not isinstance(expr, str) or not expr.strip():
+            raise ValidationError("Поле 'condition' должно быть непустой строкой", "Params.condition", block_id, BlockType.CONDITION.value)
+        
+        try:
+            ast.parse(expr, mode="eval")
+        except SyntaxError as e:
+            raise ValidationError(f"Синтаксическая ошибка в условии: {e.msg}", "Params.condition", block_id, BlockType.CONDITION.value)
+        
+        return {"condition": expr}
+    
+    def _parse_api_request_params(self, params: Dict, block_id: str) -> Dict:
+        """Парсинг параметров блока apiRequest"""
+        block_type = BlockType.API_REQUEST.value
+        
+        if "url" not in params:
+            raise ValidationError("Отсутствует обязательное поле 'url'", "Params.url", block_id, block_type)
+        
+        url = params["url"]
+        if not isinstance(url, str):
+            raise ValidationError("Поле 'url' должно быть строкой", "Params.url", block_id, block_type)
+        
+        parsed_url = urlparse(url)
+        if parsed_url.scheme not in ("http", "https") or not parsed_url.netloc:
+            raise ValidationError(f"Некорректный URL: {url}", "Params.url", block_id, block_type)
+        
+        method = params.get("method", "GET")
+        if not isinstance(method, str) or method.upper() not in self._allowed_http_methods:
+            raise ValidationError(
+                f"Недопустимый HTTP-метод '{method}'. Допустимые: {', '.join(sorted(self._allowed_http_methods))}",
+                "Params.method", block_id, block_type
+            )
+        
+        headers = params.get("headers", {})
+        if not isinstance(headers, dict) or not all(isinstance(k, str) and isinstance(v, str) for k, v in headers.items()):
+            raise ValidationError("Поле 'headers' должно быть объектом со строковыми значениями", "Params.headers", block_id, block_type)
+        
+        body = params.get("body", {})
+        if not isinstance(body, (dict, list, str)):
+            raise ValidationError("Поле 'body' должно быть объектом, массивом или строкой", "Params.body", block_id, block_type)
+        
+        variables = params.get("variables", {})
+        if not isinstance(variables, dict) or not all(isinstance(k, str) and isinstance(v, str) for k, v in variables.items()):
+            raise ValidationError("Поле 'variables' должно быть объектом {поле ответа: переменная}", "Params.variables", block_id, block_type)
+        from http_client import compile_path
+        for path in variables:
+            try:
+                compile_path(path)
+            except ValueError as e:
+                raise ValidationError(str(e), f"Params.variables.{path}", block_id, block_type)
+        
+        max_body = params.get("maxBodyBytes")
+        if max_body is not None and (isinstance(max_body, bool) or not isinstance(max_body, int) or max_body <= 0):
+            raise ValidationError("Поле 'maxBodyBytes' должно быть положительным целым числом", "Params.maxBodyBytes", block_id, block_type)
+        
+        timeouts = params.get("timeouts", {})
+        if not isinstance(timeouts, dict) or set(timeouts) - {"connect", "read", "total"}:
+            raise ValidationError("Поле 'timeouts' должно быть объектом с полями connect/read/total", "Params.timeouts", block_id, block_type)
+        for name in timeouts:
+            self._parse_optional_seconds(timeouts, name, f"Params.timeouts.{name}", block_id, block_type)
+        
+        # Редактор сохраняет количество повторов в поле 'retryCount'
+        retries = params.get("retries", params.get("retryCount", 0))
+        if isinstance(retries, bool) or not isinstance(retries, int) or retries < 0:
+            raise ValidationError("Поле 'retries' должно быть неотрицательным целым числом", "Params.retries", block_id, block_type)
+        
+        # Редактор сохраняет весь ответ в одну переменную 'resultVariable'
+        result_var = params.get("resultVariable") or None
+        if result_var is not None and not isinstance(result_var, str):
+            raise ValidationError("Поле 'resultVariable' должно быть строкой", "Params.resultVariable", block_id, block_type)
+        
+        return {
+            "url": url,
+            "method": method.upper(),
+            "headers": headers,
+            "body": body,
+            "variables": variables,
+            "timeouts": timeouts,
+            "retries": retries,
+            **({"maxBodyBytes": max_body} if max_body is not None else {}),
+            **({"resultVariable": result_var} if result_var is not None else {})
+        }
+    
+    def _parse_parallel_api_params(self, params: Dict, block_id: str) -> Dict:
+        """Парсинг параметров блока parallelApi: список запросов в формате apiRequest + таймауты"""
+        block_type = BlockType.PARALLEL_API.value
+        
+        requests = params.get("requests")
+        if not isinstance(requests, list) or not requests:
+            raise ValidationError("Поле 'requests' должно быть непустым массивом", "Params.requests", block_id, block_type)
+        
+        validated_requests = []
+        for i, req in enumerate(requests):
+            if not isinstance(req, dict):
+                raise ValidationError(f"Запрос {i} должен быть объектом", f"Params.requests[{i}]", block_id, block_type)
+            try:
+                validated = self._parse_api_request_params(req, block_id)
+            except ValidationError as e:
+                raise ValidationError(e.message, f"Params.requests[{i}].{(e.field or '').replace('Params.', '')}", block_id, block_type)
+            validated["timeout"] = self._parse_optional_seconds(req, "timeout", f"Params.requests[{i}].timeout", block_id, block_type)
+            validated_requests.append(validated)
+        
+        return {
+            "requests": validated_requests,
+            "deadline": self._parse_optional_seconds(params, "deadline", "Params.deadline", block_id, block_type)
+        }
+    
+    def _parse_optional_seconds(self, params: Dict, field: str, field_path: str, block_id: str, block_type: str) -> Optional[float]:
+        """Необязательное положительное число секунд (None - без ограничения)"""
+        value = params.get(field)
+        if value is None:
+            return None
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+            raise ValidationError(f"Поле '{field}' должно быть положительным числом", field_path, block_id, block_type)
+        return value
+    
+    def _parse_timer_params(self, params: Dict, block_id: str) -> Dict:
+        """Парсинг параметров блоков delay и timeout"""
+        if "seconds" not in params:
+            raise ValidationError("Отсутствует обязательное поле 'seconds'", "Params.seconds", block_id)
+        
+        seconds = params["seconds"]
+        if isinstance(seconds, bool) or not isinstance(seconds, (int, float)) or seconds <= 0:
+            raise ValidationError("Поле 'seconds' должно быть положительным числом", "Params.seconds", block_id)
+        
+        return {"seconds": seconds}
+    
+    def _parse_shared_var_params(self, params: Dict, block_id: str) -> Dict:
+        """Парсинг параметров блока sharedVar (атомарная операция над общей переменной бота)"""
+        block_type = BlockType.SHARED_VAR.value
+        
+        name = params.get("name")
+        if not isinstance(name, str) or not name.strip():
+            raise ValidationError("Поле 'name' должно быть непустой строкой", "Params.name", block_id, block_type)
+        
+        op = params.get("op", "incr")
+        if op not in self._allowed_shared_ops:
+            raise ValidationError(
+                f"Недопустимая операция '{op}'. Допустимые: {', '.join(sorted(self._allowed_shared_ops))}",
+                "Params.op", block_id, block_type
+            )
+        
+        result = {"name": name, "op": op}
+        
+        required = {"set": ["value"], "cas": ["expected", "value"]}.get(op, [])
+        for field in ("value", "expected"):
+            if field not in params:
+                if field in required:
+                    raise ValidationError(f"Отсутствует обязательное поле '{field}'", f"Params.{field}", block_id, block_type)
+                continue
+            # Строка - выражение над переменными сессии, как в condition
+            value = params[field]
+            if isinstance(value, str):
+                try:
+                    ast.parse(value, mode="eval")
+                except SyntaxError as e:
+                    raise ValidationError(f"Синтаксическая ошибка в выражении: {e.msg}", f"Params.{field}", block_id, block_type)
+            result[field] = value
+        
+        if op == "incr":
+            for field in ("min", "max"):
+                bound = params.get(field)
+                if bound is not None and (isinstance(bound, bool) or not isinstance(bound, (int, float))):
+                    raise ValidationError(f"Поле '{field}' должно быть числом", f"Params.{field}", block_id, block_type)
+                result[field] = bound
+        
+        if "var" in params:
+            if not isinstance(params["var"], str):
+                raise ValidationError("Поле 'var' должно быть строкой", "Params.var", block_id, block_type)
+            result["var"] = params["var"]
+        
+        return result
+    
+    def _parse_split_params(self, params: Dict, block_id: str) -> Dict:
+        """Парсинг параметров блока split: веса веток (по порядку Out) и переменная для номера варианта"""
+        block_type = BlockType.SPLIT.value
+        result = {}
+        
+        # Без весов ветки равновероятны
+        if "weights" in params:
+            weights = params["weights"]
+            if not isinstance(weights, list) or len(weights) < 2:
+                raise ValidationError("Поле 'weights' должно быть массивом минимум из 2 чисел", "Params.weights", block_id, block_type)
+            for i, w in enumerate(weights):
+                if isinstance(w, bool) or not isinstance(w, (int, float)) or w < 0:
+                    raise ValidationError(f"Вес {i} должен быть неотрицательным числом", f"Params.weights[{i}]", block_id, block_type)
+            if sum(weights) <= 0:
+                raise ValidationError("Сумма весов должна быть больше нуля", "Params.weights", block_id, block_type)
+            result["weights"] = weights
+        
+        if "var" in params:
+            if not isinstance(params["var"], str):
+                raise ValidationError("Поле 'var' должно быть строкой", "Params.var", block_id, block_type)
+            result["var"] = params["var"]
+        
+        return result
+    
+    def _parse_script_params(self, params: Dict, block_id: str) -> Dict:
+        """Парсинг параметров блока script: код из разрешенного подмножества Python"""
+        block_type = BlockType.SCRIPT.value
+        
+        code = params.get("code")
+        if not isinstance(code, str) or not code.strip():
+            raise ValidationError("Поле 'code' должно быть непустой строкой", "Params.code", block_id, block_type)
+        from script_runner import ScriptError, analyze_script
+        try:
+            analyze_script(code)
+        except ScriptError as e:
+            raise ValidationError(str(e), "Params.code", block_id, block_type)
+        
+        result = {"code": code, "pure": False}
+        
+        if "pure" in params:
+            if not isinstance(params["pure"], bool):
+                raise ValidationError("Поле 'pure' должно быть логическим значением", "Params.pure", block_id, block_type)
+            result["pure"] = params["pure"]
+        
+        if "outputs" in params:
+            outputs = params["outputs"]
+            if not isinstance(outputs, list) or not all(isinstance(name, str) for name in outputs):
+                raise ValidationError("Поле 'outputs' должно быть массивом строк", "Params.outputs", block_id, block_type)
+            result["outputs"] = outputs
+        
+        # timeout - лимит процессорного времени на вызов (секунды)
+        timeout = self._parse_optional_seconds(params, "timeout", "Params.timeout", block_id, block_type)
+        if timeout is not None:
+            result["timeout"] = timeout
+        
+        return result
+    
     # endregion
     
     # region Валидаторы соединений для каждого типа блока
@@ -463,6 +799,45 @@ class BotConfigParser:
             if not self._is_valid_uuid(conn):
                 raise ValidationError(f"Некорректный UUID в In[{i}]", f"Connections.In[{i}]", block_id, BlockType.FINAL.value)
     
+    def _validate_branch_connections(self, connections: Dict, block_id: str):
+        """Валидация соединений блоков с ветвлением condition (True/False) и apiRequest (Success/Fail)"""
+        if not isinstance(connections["In"], list) or len(connections["In"]) < 1:
+            raise ValidationError("In должен содержать минимум 1 элемент", "Connections.In", block_id)
+        
+        if not isinstance(connections["Out"], list) or not 1 <= len(connections["Out"]) <= 2:
+            raise ValidationError("Out должен содержать 1 или 2 элемента", "Connections.Out", block_id)
+        
+        for i, conn in enumerate(connections["In"]):
+            if not self._is_valid_uuid(conn):
+                raise ValidationError(f"Некорректный UUID в In[{i}]", f"Connections.In[{i}]", block_id)
+        
+        for i, conn in enumerate(connections["Out"]):
+            if not self._is_valid_uuid(conn):
+                raise ValidationError(f"Некорректный UUID в Out[{i}]", f"Connections.Out[{i}]", block_id)
+    
+    def _validate_split_connections(self, connections: Dict, block_id: str):
+        """Валидация соединений блока split: по выходу на каждый вариант"""
+        if not isinstance(connections["In"], list) or len(connections["In"]) < 1:
+            raise ValidationError("In должен содержать минимум 1 элемент", "Connections.In", block_id, BlockType.SPLIT.value)
+        
+        if not isinstance(connections["Out"], list) or len(connections["Out"]) < 2:
+            raise ValidationError("Out должен содержать минимум 2 элемента", "Connections.Out", block_id, BlockType.SPLIT.value)
+        
+        for i, conn in enumerate(connections["In"]):
+            if not self._is_valid_uuid(conn):
+                raise ValidationError(f"Некорректный UUID в In[{i}]", f"Connections.In[{i}]", block_id, BlockType.SPLIT.value)
+        
+        for i, conn in enumerate(connections["Out"]):
+            if not self._is_valid_uuid(conn):
+                raise ValidationError(f"Некорректный UUID в Out[{i}]", f"Connections.Out[{i}]", block_id, BlockType.SPLIT.value)
+    
+    def _validate_timeout_connections(self, connections: Dict, block_id: str):
+        """Валидация соединений блока timeout: Out[0] - ожидаемый ответ, Out[1] - ветка таймаута"""
+        self._validate_message_connections(connections, block_id)
+        
+        if len(connections["Out"]) != 2:
+            raise ValidationError("Out должен содержать ровно 2 элемента", "Connections.Out", block_id, BlockType.TIMEOUT.value)
+    
     # endregion
     
     def _validate_graph_integrity(self, blocks_map: Dict[str, Dict], start_id: str, final_id: str):
@@ -517,6 +892,56 @@ class BotConfigParser:
                         f"Количество опций ({options_count}) не соответствует количеству выходных соединений ({out_count})",
                         "Connections.Out", block_id, block_type.value
                     )
+        
+        # Проверка на циклы без ожидания ввода
+        self._validate_no_auto_loops(blocks_map)
+    
+    def _validate_no_auto_loops(self, blocks_map: Dict[str, Dict]):
+        """
+        Поиск циклов, в которых нет ни одного блока, ожидающего ввода (getMessage/choice/timeout),
+        таймера (delay) или внешнего запроса (apiRequest/parallelApi).
+        Такой цикл интерпретатор будет крутить без участия пользователя и без пауз.
+        Циклы повторных запросов и опроса API допустимы: их ограничивает бюджет автоматических
+        шагов интерпретатора (MAX_AUTO_STEPS/MAX_AUTO_SECONDS).
+        """
+        waiting_types = {BlockType.GET_MESSAGE.value, BlockType.CHOICE.value, BlockType.DELAY.value,
+                         BlockType.TIMEOUT.value, BlockType.API_REQUEST.value, BlockType.PARALLEL_API.value}
+        
+        # Подграф только из автоматических блоков
+        auto_ids = {bid for bid, b in blocks_map.items() if b["Type"] not in waiting_types}
+        done = object()
+        
+        WHITE, GRAY, BLACK = 0, 1, 2
+        color = {bid: WHITE for bid in auto_ids}
+        
+        for root in auto_ids:
+            if color[root] != WHITE:
+                continue
+            # Итеративный DFS, чтобы не упираться в лимит рекурсии на больших сценариях
+            path = [root]
+            stack = [(root, iter(blocks_map[root]["Connections"]["Out"]))]
+            color[root] = GRAY
+            while stack:
+                node_id, children = stack[-1]
+                child = next(children, done)
+                if child is done:
+                    color[node_id] = BLACK
+                    stack.pop()
+                    path.pop()
+                    continue
+                # Неподключенный выход (None) пропускаем, остальные выходы блока проверяются дальше
+                if child not in auto_ids:
+                    continue
+                if color[child] == GRAY:
+                    cycle = path[path.index(child):] + [child]
+                    raise ValidationError(
+                        f"Обнаружен цикл без блока ожидания ввода: {' -> '.join(cycle)}",
+                        "Connections.Out", node_id, blocks_map[node_id]["Type"]
+                    )
+                if color[child] == WHITE:
+                    color[child] = GRAY
+                    path.append(child)
+                    stack.append((child, iter(blocks_map[child]["Connections"]["Out"])))
     
     def _is_valid_uuid(self, uuid_str: str) -> bool:
         """Проверка валидности UUID"""
@@ -547,20 +972,32 @@ class BotConfigParser:
         self._param_parsers[enum_block_type] = param_parser
         self._connection_validators[enum_block_type] = connection_validator
 
+def scenario_hash(data: Any) -> str:
+    """Хэш содержимого сценария (или блока), не зависящий от порядка ключей"""
+    raw = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+# Общий парсер процесса: его кэши переживают повторные вызовы
+_default_parser = BotConfigParser()
+
 # Функции для удобного использования
+def parse_bot_config(json_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Основная функция для парсинга конфигурации бота из словаря
+    """
+    return _default_parser.parse_bot_config(json_data)
+
 def parse_bot_config_from_file(file_path: str) -> Dict[str, Any]:
     """
     Основная функция для парсинга конфигурации бота из JSON файла
     """
-    parser = BotConfigParser()
-    return parser.parse_bot_config_from_file(file_path)
+    return _default_parser.parse_bot_config_from_file(file_path)
 
 def parse_bot_config_from_string(json_string: str) -> Dict[str, Any]:
     """
     Основная функция для парсинга конфигурации бота из JSON строки
     """
-    parser = BotConfigParser()
-    return parser.parse_bot_config_from_string(json_string)
+    return _default_parser.parse_bot_config_from_string(json_string)
 
 # Пример использования с JSON файлом
 if __name__ == "__main__":